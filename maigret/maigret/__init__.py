@@ -8,6 +8,7 @@ __author_email__ = 'soxoj@protonmail.com'
 
 from .__version__ import __version__
 from .checking import maigret as search
+from .checking import maigret_stream as stream
 from .maigret import main as cli
 from .sites import MaigretEngine, MaigretSite, MaigretDatabase
 from .notify import QueryNotifyPrint as Notifier
@@ -1,82 +1,157 @@
+import asyncio
 import json
+import time
 from http.cookiejar import MozillaCookieJar
 from http.cookies import Morsel
+from typing import Dict, Tuple
 
-from aiohttp import CookieJar
+from aiohttp import ClientSession, CookieJar
+
+
+# time in seconds for which activated site headers are reused
+ACTIVATION_TTL = 10 * 60
+
+# site name -> (monotonic time of activation, headers updated by it),
+# shared by all the searches of the process
+_activation_tokens: Dict[str, Tuple[float, Dict[str, str]]] = {}
 
 
 class ParsingActivator:
+    """
+    Activation methods get new tokens for sites and update their headers,
+    requests are made with the shared aiohttp session of the checker.
+    """
+
     @staticmethod
-    def twitter(site, logger, cookies={}):
+    async def twitter(site, logger, session: ClientSession):
         headers = dict(site.headers)
         del headers["x-guest-token"]
-        import requests
 
-        r = requests.post(site.activation["url"], headers=headers)
-        logger.info(r)
-        j = r.json()
+        async with session.post(site.activation["url"], headers=headers) as r:
+            logger.info(r)
+            j = await r.json(content_type=None)
         guest_token = j[site.activation["src"]]
         site.headers["x-guest-token"] = guest_token
 
     @staticmethod
-    def vimeo(site, logger, cookies={}):
+    async def vimeo(site, logger, session: ClientSession):
         headers = dict(site.headers)
         if "Authorization" in headers:
             del headers["Authorization"]
-        import requests
 
-        r = requests.get(site.activation["url"], headers=headers)
-        logger.debug(f"Vimeo viewer activation: {json.dumps(r.json(), indent=4)}")
-        jwt_token = r.json()["jwt"]
+        async with session.get(site.activation["url"], headers=headers) as r:
+            j = await r.json(content_type=None)
+        logger.debug(f"Vimeo viewer activation: {json.dumps(j, indent=4)}")
+        jwt_token = j["jwt"]
         site.headers["Authorization"] = "jwt " + jwt_token
 
     @staticmethod
-    def spotify(site, logger, cookies={}):
+    async def spotify(site, logger, session: ClientSession):
         headers = dict(site.headers)
         if "Authorization" in headers:
             del headers["Authorization"]
-        import requests
 
-        r = requests.get(site.activation["url"])
-        bearer_token = r.json()["accessToken"]
+        async with session.get(site.activation["url"]) as r:
+            j = await r.json(content_type=None)
+        bearer_token = j["accessToken"]
         site.headers["authorization"] = f"Bearer {bearer_token}"
 
     @staticmethod
-    def weibo(site, logger):
+    async def weibo(site, logger, session: ClientSession):
         headers = dict(site.headers)
-        import requests
 
-        session = requests.Session()
         # 1 stage: get the redirect URL
-        r = session.get(
+        async with session.get(
             "https://weibo.com/clairekuo", headers=headers, allow_redirects=False
-        )
-        logger.debug(
-            f"1 stage: {'success' if r.status_code == 302 else 'no 302 redirect, fail!'}"
-        )
-        location = r.headers.get("Location")
+        ) as r:
+            logger.debug(
+                f"1 stage: {'success' if r.status == 302 else 'no 302 redirect, fail!'}"
+            )
+            location = r.headers.get("Location")
 
         # 2 stage: go to passport visitor page
         headers["Referer"] = location
-        r = session.get(location, headers=headers)
-        logger.debug(
-            f"2 stage: {'success' if r.status_code == 200 else 'no 200 response, fail!'}"
-        )
+        async with session.get(location, headers=headers) as r:
+            logger.debug(
+                f"2 stage: {'success' if r.status == 200 else 'no 200 response, fail!'}"
+            )
 
         # 3 stage: gen visitor token
         headers["Referer"] = location
-        r = session.post(
+        async with session.post(
             "https://passport.weibo.com/visitor/genvisitor2",
             headers=headers,
             data={'cb': 'visitor_gray_callback', 'tid': '', 'from': 'weibo'},
-        )
-        cookies = r.headers.get('set-cookie')
-        logger.debug(
-            f"3 stage: {'success' if r.status_code == 200 and cookies else 'no 200 response and cookies, fail!'}"
-        )
+        ) as r:
+            cookies = ", ".join(r.headers.getall('Set-Cookie', []))
+            logger.debug(
+                f"3 stage: {'success' if r.status == 200 and cookies else 'no 200 response and cookies, fail!'}"
+            )
         site.headers["Cookie"] = cookies
 
 
+class SiteActivator:
+    """
+    Runs activation of sites once for all the concurrent checks and caches
+    activated headers by site names until they expire.
+    """
+
+    def __init__(self, ttl=ACTIVATION_TTL, tokens=None):
+        self.ttl = ttl
+        self.tokens = _activation_tokens if tokens is None else tokens
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def apply(self, site):
+        """Updates headers of the site by its last activation, if it's not expired"""
+        token = self.tokens.get(site.name)
+        if token and time.monotonic() - token[0] < self.ttl:
+            site.headers.update(token[1])
+
+    async def activate(
+        self, site, logger, session: ClientSession, requested_at: float
+    ) -> bool:
+        """
+        Activates the site, if it wasn't activated after the request with
+        the activation mark in the response was made.
+
+        Keyword Arguments:
+        requested_at           -- Monotonic time of the request start.
+
+        Return Value:
+        True if the site headers are updated.
+        """
+        lock = self.locks.setdefault(site.name, asyncio.Lock())
+        async with lock:
+            token = self.tokens.get(site.name)
+            if token and token[0] > requested_at:
+                site.headers.update(token[1])
+                return True
+
+            method = site.activation["method"]
+            activate_fun = getattr(ParsingActivator, method, None)
+            if not activate_fun:
+                logger.warning(
+                    f"Activation method {method} for site {site.name} not found!"
+                )
+                return False
+
+            old_headers = dict(site.headers)
+            try:
+                await activate_fun(site, logger, session)
+            except Exception as e:
+                logger.warning(
+                    f"Failed activation {method} for site {site.name}: {str(e)}",
+                    exc_info=True,
+                )
+                return False
+
+            new_headers = {
+                k: v for k, v in site.headers.items() if old_headers.get(k) != v
+            }
+            self.tokens[site.name] = (time.monotonic(), new_headers)
+            return True
+
+
 def import_aiohttp_cookies(cookiestxt_filename):
     cookies_obj = MozillaCookieJar(cookiestxt_filename)
     cookies_obj.load(ignore_discard=True, ignore_expires=True)
@@ -0,0 +1,157 @@
+"""Maigret Results Cache Module
+
+This module stores the results of site checks between the runs, so repeated
+searches by the same usernames don't make requests to the same sites again.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .result import MaigretCheckResult, MaigretCheckStatus
+
+RESULTS_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".maigret", "cache", "results.sqlite3"
+)
+
+# one day
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# part of the TTL during which the result of the status is valid:
+# accounts rarely disappear, while free usernames may be registered at any
+# moment; errors are temporary and illegal usernames are detected without
+# requests, so they are not cached at all
+STATUS_TTL_FACTORS = {
+    MaigretCheckStatus.CLAIMED: 1.0,
+    MaigretCheckStatus.AVAILABLE: 0.25,
+}
+
+# number of new results kept in memory before writing to the disk
+FLUSH_SIZE = 100
+
+CacheKey = Tuple[str, str, str]
+
+
+class ResultsCache:
+    """
+    Persistent cache of check results by site name, username and identifier type.
+    """
+
+    def __init__(self, filename: str = RESULTS_CACHE_FILE, ttl=DEFAULT_CACHE_TTL):
+        """
+        Keyword Arguments:
+        filename               -- Path to the SQLite file with the cache, is
+                                  created if not exists.
+        ttl                    -- Time in seconds during which the results of
+                                  found accounts are valid, results with other
+                                  statuses are valid for the part of it.
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.pending: Dict[CacheKey, Tuple[Any, ...]] = {}
+
+        cache_dir = os.path.dirname(filename)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                site TEXT NOT NULL,
+                username TEXT NOT NULL,
+                id_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                http_status INTEGER,
+                ids_data TEXT,
+                parsed INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (site, username, id_type)
+            )
+            """
+        )
+        # expired results will never be used again
+        self.db.execute(
+            "DELETE FROM results WHERE checked_at < ?", (time.time() - self.ttl,)
+        )
+        self.db.commit()
+
+    def get_ttl(self, status: MaigretCheckStatus) -> float:
+        return self.ttl * STATUS_TTL_FACTORS.get(status, 0)
+
+    def get(
+        self, site_name: str, username: str, id_type: str, parsing: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns valid cached result as a dict with status, http_status,
+        ids_data and checked_at fields or None.
+
+        Found accounts checked without parsing are not valid for searches
+        with parsing, because they have no extracted data.
+        """
+        key = (site_name, username, id_type)
+        row = self.pending.get(key)
+        if row is None:
+            row = self.db.execute(
+                "SELECT * FROM results WHERE site = ? AND username = ? AND id_type = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+
+        _, _, _, status_value, http_status, ids_data, parsed, checked_at = row
+        status = MaigretCheckStatus(status_value)
+
+        if time.time() - checked_at > self.get_ttl(status):
+            return None
+        if parsing and not parsed and status == MaigretCheckStatus.CLAIMED:
+            return None
+
+        return {
+            "status": status,
+            "http_status": http_status,
+            "ids_data": json.loads(ids_data) if ids_data else {},
+            "checked_at": checked_at,
+        }
+
+    def set(
+        self,
+        site_name: str,
+        username: str,
+        id_type: str,
+        result: MaigretCheckResult,
+        http_status: Optional[int] = None,
+        parsing: bool = False,
+    ):
+        """Saves the check result, if results with its status are cached"""
+        if not self.get_ttl(result.status) or result.error:
+            return
+
+        key = (site_name, username, id_type)
+        self.pending[key] = key + (
+            result.status.value,
+            http_status if isinstance(http_status, int) else None,
+            json.dumps(result.ids_data) if result.ids_data else None,
+            int(bool(parsing)),
+            time.time(),
+        )
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.db.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self.pending.values(),
+        )
+        self.db.commit()
+        self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.db.close()
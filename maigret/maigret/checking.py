@@ -1,13 +1,26 @@
 # Standard library imports
 import ast
 import asyncio
+import codecs
 import logging
 import random
 import re
 import ssl
 import sys
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import quote
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote, urlparse
 
 # Third party imports
 import aiodns
@@ -24,13 +37,22 @@ except ImportError:
 
 # Local imports
 from . import errors
-from .activation import ParsingActivator, import_aiohttp_cookies
+from .activation import SiteActivator, import_aiohttp_cookies
 from .errors import CheckError
-from .executors import AsyncioQueueGeneratorExecutor
-from .result import MaigretCheckResult, MaigretCheckStatus
+from .executors import AsyncioDynamicQueueExecutor, KeyedLimiter
+from .health import (
+    SELF_CHECK_ERROR,
+    SELF_CHECK_FAILED,
+    SELF_CHECK_OK,
+    SELF_CHECK_WINDOW,
+    SiteHealthHistory,
+    is_site_broken,
+)
+from .result import MaigretCheckResult, MaigretCheckStatus, MaigretSiteResult
 from .sites import MaigretDatabase, MaigretSite
+from .timings import finish_timings, make_trace_config, start_timings
 from .types import QueryOptions, QueryResultWrapper
-from .utils import ascii_data_display, get_random_user_agent
+from .utils import ascii_data_display, compile_regex, get_random_user_agent
 
 
 SUPPORTED_IDS = (
@@ -47,6 +69,24 @@ SUPPORTED_IDS = (
 
 BAD_CHARS = "#"
 
+# HTTP statuses of rate limiting, checks of the site host are paused after them
+BACKOFF_STATUS_CODES = (429, 503)
+
+# Adaptive timeout is a multiplied percentile of the last site response times
+RESPONSE_TIMES_WINDOW = 20
+RESPONSE_TIMES_MIN_COUNT = 5
+ADAPTIVE_TIMEOUT_PERCENTILE = 0.95
+ADAPTIVE_TIMEOUT_FACTOR = 3
+ADAPTIVE_TIMEOUT_MIN = 1.0
+
+# Response bodies are read by chunks to stop reading when the check result is known
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+COMMON_ERRORS_MARKERS = tuple(errors.COMMON_ERRORS.keys())
+
+# Repeated slashes in profile URLs, except the protocol ones
+URL_SLASHES_RE = re.compile("(?<!:)/+")
+
 
 class CheckerBase:
     pass
@@ -57,26 +97,131 @@ class SimpleAiohttpChecker(CheckerBase):
         self.proxy = kwargs.get('proxy')
         self.cookie_jar = kwargs.get('cookie_jar')
         self.logger = kwargs.get('logger', Mock())
+        # connection pool settings, shared by all requests of the checker
+        self.connections_limit = kwargs.get('connections_limit', 100)
+        self.connections_per_host = kwargs.get('connections_per_host', 0)
+        self.dns_cache_ttl = kwargs.get('dns_cache_ttl', 300)
+        self.session: Optional[ClientSession] = None
         self.url = None
         self.headers = None
         self.allow_redirects = True
         self.timeout = 0
         self.method = 'get'
-
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+        self.max_size = 0
+        self.stop_reading = None
+        self.timings = None
+
+    def prepare(
+        self,
+        url,
+        headers=None,
+        allow_redirects=True,
+        timeout=0,
+        method='get',
+        max_size=0,
+        stop_reading=None,
+        timings=None,
+    ):
+        """
+        max_size               -- Maximum size of a response body to read in
+                                  bytes, 0 means no limit.
+        stop_reading           -- Function called with every decoded chunk
+                                  of a response body, reading is stopped if
+                                  it returns True.
+        timings                -- Dict to save timings of the request phases
+                                  and the size of the read body to.
+        """
         self.url = url
         self.headers = headers
         self.allow_redirects = allow_redirects
         self.timeout = timeout
         self.method = method
+        self.max_size = max_size
+        self.stop_reading = stop_reading
+        self.timings = timings
         return None
 
+    def make_connector(self) -> TCPConnector:
+        from aiohttp_socks import ProxyConnector
+
+        connector_options = {
+            'ssl': False,
+            'limit': self.connections_limit,
+            'limit_per_host': self.connections_per_host,
+            'use_dns_cache': True,
+            'ttl_dns_cache': self.dns_cache_ttl,
+        }
+
+        if self.proxy:
+            return ProxyConnector.from_url(self.proxy, **connector_options)
+        return TCPConnector(**connector_options)
+
+    def get_session(self) -> ClientSession:
+        """
+        Returns the pooled HTTP session of the checker, creating it on first use.
+        Connections are kept alive and reused until `close()` is called.
+        """
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(
+                connector=self.make_connector(),
+                trust_env=True,
+                trace_configs=[make_trace_config()],
+                # TODO: tests
+                cookie_jar=self.cookie_jar if self.cookie_jar else None,
+            )
+        return self.session
+
     async def close(self):
-        pass
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _read_body(
+        self, response, max_size=0, stop_reading=None, timings=None
+    ) -> str:
+        charset = response.charset or "utf-8"
+        decoder = codecs.getincrementaldecoder(charset)("ignore")
+
+        if not max_size and not stop_reading:
+            content = await response.content.read()
+            if timings is not None:
+                timings["bytes"] = len(content)
+            return decoder.decode(content, final=True)
+
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(RESPONSE_CHUNK_SIZE):
+            size += len(chunk)
+            text = decoder.decode(chunk)
+            chunks.append(text)
+
+            if stop_reading and stop_reading(text):
+                break
+            if max_size and size >= max_size:
+                self.logger.debug(f"Response of {response.url} is cut at {size} bytes")
+                break
+        else:
+            chunks.append(decoder.decode(b"", final=True))
+
+        if timings is not None:
+            timings["bytes"] = size
+        return "".join(chunks)
 
     async def _make_request(
-        self, session, url, headers, allow_redirects, timeout, method, logger
+        self,
+        session,
+        url,
+        headers,
+        allow_redirects,
+        timeout,
+        method,
+        logger,
+        max_size=0,
+        stop_reading=None,
+        timings=None,
     ) -> Tuple[str, int, Optional[CheckError]]:
+        if timings is not None:
+            start_timings(timings)
         try:
             request_method = session.get if method == 'get' else session.head
             async with request_method(
@@ -84,11 +229,12 @@ class SimpleAiohttpChecker(CheckerBase):
                 headers=headers,
                 allow_redirects=allow_redirects,
                 timeout=timeout,
+                trace_request_ctx=timings,
             ) as response:
                 status_code = response.status
-                response_content = await response.content.read()
-                charset = response.charset or "utf-8"
-                decoded_content = response_content.decode(charset, "ignore")
+                decoded_content = await self._read_body(
+                    response, max_size, stop_reading, timings
+                )
 
                 error = CheckError("Connection lost") if status_code == 0 else None
                 logger.debug(decoded_content)
@@ -116,44 +262,32 @@ class SimpleAiohttpChecker(CheckerBase):
             else:
                 logger.debug(e, exc_info=True)
                 return None, 0, CheckError("Unexpected", str(e))
+        finally:
+            if timings is not None:
+                finish_timings(timings)
 
     async def check(self) -> Tuple[str, int, Optional[CheckError]]:
-        from aiohttp_socks import ProxyConnector
-
-        connector = (
-            ProxyConnector.from_url(self.proxy)
-            if self.proxy
-            else TCPConnector(ssl=False)
+        html_text, status_code, error = await self._make_request(
+            self.get_session(),
+            self.url,
+            self.headers,
+            self.allow_redirects,
+            self.timeout,
+            self.method,
+            self.logger,
+            self.max_size,
+            self.stop_reading,
+            self.timings,
         )
-        connector.verify_ssl = False
-
-        async with ClientSession(
-            connector=connector,
-            trust_env=True,
-            # TODO: tests
-            cookie_jar=self.cookie_jar if self.cookie_jar else None,
-        ) as session:
-            html_text, status_code, error = await self._make_request(
-                session,
-                self.url,
-                self.headers,
-                self.allow_redirects,
-                self.timeout,
-                self.method,
-                self.logger,
-            )
 
-            if error and str(error) == "Invalid proxy response":
-                self.logger.debug(error, exc_info=True)
+        if error and str(error) == "Invalid proxy response":
+            self.logger.debug(error, exc_info=True)
 
-            return str(html_text) if html_text else '', status_code, error
+        return str(html_text) if html_text else '', status_code, error
 
 
 class ProxiedAiohttpChecker(SimpleAiohttpChecker):
-    def __init__(self, *args, **kwargs):
-        self.proxy = kwargs.get('proxy')
-        self.cookie_jar = kwargs.get('cookie_jar')
-        self.logger = kwargs.get('logger', Mock())
+    pass
 
 
 class AiodnsDomainResolver(CheckerBase):
@@ -165,7 +299,9 @@ class AiodnsDomainResolver(CheckerBase):
         self.logger = kwargs.get('logger', Mock())
         self.resolver = aiodns.DNSResolver(loop=loop)
 
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+    def prepare(
+        self, url, headers=None, allow_redirects=True, timeout=0, *args, **kwargs
+    ):
         self.url = url
         return None
 
@@ -187,11 +323,29 @@ class AiodnsDomainResolver(CheckerBase):
         return text, status, error
 
 
+class QueryNotifyMock:
+    """Notifier which ignores everything, unlike Mock doesn't record calls"""
+
+    def start(self, *args, **kwargs):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def finish(self, *args, **kwargs):
+        pass
+
+    def warning(self, *args, **kwargs):
+        pass
+
+
 class CheckerMock:
     def __init__(self, *args, **kwargs):
         pass
 
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+    def prepare(
+        self, url, headers=None, allow_redirects=True, timeout=0, *args, **kwargs
+    ):
         return None
 
     async def check(self) -> Tuple[str, int, Optional[CheckError]]:
@@ -204,28 +358,122 @@ class CheckerMock:
 
 # TODO: move to separate class
 def detect_error_page(
-    html_text, status_code, fail_flags, ignore_403
+    html_text, status_code, fail_flags, ignore_403, found_markers=None
 ) -> Optional[CheckError]:
+    # markers can be already found in the page, see ResponseMarkersSearch
+    is_found = (
+        found_markers.__contains__
+        if found_markers is not None
+        else html_text.__contains__
+    )
+
     # Detect service restrictions such as a country restriction
     for flag, msg in fail_flags.items():
-        if flag in html_text:
+        if is_found(flag):
             return CheckError("Site-specific", msg)
 
     # Detect common restrictions such as provider censorship and bot protection
-    err = errors.detect(html_text)
-    if err:
-        return err
+    for flag, err in errors.COMMON_ERRORS.items():
+        if is_found(flag):
+            return err
 
     # Detect common site errors
     if status_code == 403 and not ignore_403:
         return CheckError("Access denied", "403 status code, use proxy/vpn")
 
+    elif status_code == 429:
+        return CheckError("Too many requests", "429 status code")
+
     elif status_code >= 500:
         return CheckError("Server", f"{status_code} status code")
 
     return None
 
 
+class ResponseMarkersSearch:
+    """
+    Incremental search of the site markers (site-specific errors, common
+    errors, activation marks, presence and absence strings) in a response
+    body, which is read by chunks.
+
+    Tells when the rest of the body can not change the result of
+    process_site_result, so reading can be stopped. Common errors (bot
+    protection pages, etc.) don't delay the stop, they are short pages
+    detected in the beginning of the body.
+
+    Found markers are reused by process_site_result, so the body is scanned
+    once. Every marker is searched until it's found, duplicates are searched
+    once, and markers are not searched again in the text they were already
+    checked in (except the overlap with the previous chunk).
+    """
+
+    def __init__(self, site: MaigretSite):
+        self.check_type = site.check_type
+        self.errors = site.errors_dict
+        self.activation_marks = (
+            site.activation.get("marks", []) if site.activation else []
+        )
+        self.presense_strs = site.presense_strs
+        self.absence_strs = site.absence_strs if self.check_type == "message" else []
+
+        self.found: set = set()
+        self.pending = set(COMMON_ERRORS_MARKERS)
+        for markers in (
+            self.errors,
+            self.activation_marks,
+            self.presense_strs,
+            self.absence_strs,
+        ):
+            self.pending.update(markers)
+        # markers can be split between chunks
+        self.overlap = max(map(len, self.pending), default=1) - 1
+        self.tail = ""
+        self.is_scanned = False
+
+    def feed(self, text: str) -> bool:
+        """Searches markers in the next chunk, returns True if the result is known"""
+        self.is_scanned = True
+        window = self.tail + text
+        for marker in [m for m in self.pending if m in window]:
+            self.pending.discard(marker)
+            self.found.add(marker)
+        self.tail = window[-self.overlap :] if self.overlap else ""
+
+        return self.is_decided()
+
+    def is_found(self, markers) -> bool:
+        return any(marker in self.found for marker in markers)
+
+    def first_found(self, markers) -> Optional[str]:
+        """Returns the first of the markers (in their order) found in the text"""
+        for marker in markers:
+            if marker in self.found:
+                return marker
+        return None
+
+    def is_decided(self) -> bool:
+        # activation must be done if there is a mark in the page
+        if self.activation_marks and not self.is_found(self.activation_marks):
+            return False
+
+        if self.is_found(self.errors) or self.is_found(COMMON_ERRORS_MARKERS):
+            return True
+        # site-specific error can be found further
+        if self.errors:
+            return False
+
+        is_presense_detected = not self.presense_strs or self.is_found(
+            self.presense_strs
+        )
+        if self.check_type == "message":
+            return self.is_found(self.absence_strs) or (
+                not self.absence_strs and is_presense_detected
+            )
+        if self.check_type == "response_url":
+            return is_presense_detected
+        return True
+
+
 def debug_response_logging(url, html_text, status_code, check_error):
     with open("debug.log", "a") as f:
         status = status_code or "No response"
@@ -237,6 +485,7 @@ def debug_response_logging(url, html_text, status_code, check_error):
 def process_site_result(
     response, query_notify, logger, results_info: QueryResultWrapper, site: MaigretSite
 ):
+    markers_search = results_info.pop("markers", None)
     if not response:
         return results_info
 
@@ -263,41 +512,34 @@ def process_site_result(
 
     html_text, status_code, check_error = response
 
-    # TODO: add elapsed request time counting
-    response_time = None
+    response_time = results_info.get("timings", {}).get("total")
 
     if logger.level == logging.DEBUG:
         debug_response_logging(url, html_text, status_code, check_error)
 
+    # all the markers are searched in one pass, if the checker hasn't done it
+    if not markers_search or not markers_search.is_scanned:
+        markers_search = ResponseMarkersSearch(site)
+        markers_search.feed(html_text or "")
+    found_markers = markers_search.found if html_text else set()
+
     # additional check for errors
     if status_code and not check_error:
         check_error = detect_error_page(
-            html_text, status_code, site.errors_dict, site.ignore403
+            html_text,
+            status_code,
+            markers_search.errors,
+            site.ignore403,
+            found_markers=found_markers,
         )
 
-    # parsing activation
-    is_need_activation = any(
-        [s for s in site.activation.get("marks", []) if s in html_text]
-    )
-
-    if site.activation and html_text and is_need_activation:
-        logger.debug(f"Activation for {site.name}")
-        method = site.activation["method"]
-        try:
-            activate_fun = getattr(ParsingActivator(), method)
-            # TODO: async call
-            activate_fun(site, logger)
-        except AttributeError as e:
-            logger.warning(
-                f"Activation method {method} for site {site.name} not found!",
-                exc_info=True,
-            )
-        except Exception as e:
-            logger.warning(
-                f"Failed activation {method} for site {site.name}: {str(e)}",
-                exc_info=True,
-            )
-        # TODO: temporary check error
+    # parsing activation is async, it's made by the caller
+    if site.activation and html_text:
+        is_need_activation = any(
+            s for s in site.activation.get("marks", []) if s in found_markers
+        )
+        if is_need_activation:
+            results_info["need_activation"] = True
 
     site_name = site.pretty_name
     # presense flags
@@ -310,12 +552,11 @@ def process_site_result(
             is_presense_detected = True
             site.stats["presense_flag"] = None
         else:
-            for presense_flag in presense_flags:
-                if presense_flag in html_text:
-                    is_presense_detected = True
-                    site.stats["presense_flag"] = presense_flag
-                    logger.debug(presense_flag)
-                    break
+            presense_flag = markers_search.first_found(presense_flags)
+            if presense_flag is not None:
+                is_presense_detected = True
+                site.stats["presense_flag"] = presense_flag
+                logger.debug(presense_flag)
 
     def build_result(status, **kwargs):
         return MaigretCheckResult(
@@ -342,9 +583,7 @@ def process_site_result(
         )
     elif check_type == "message":
         # Checks if the error message is in the HTML
-        is_absence_detected = any(
-            [(absence_flag in html_text) for absence_flag in site.absence_strs]
-        )
+        is_absence_detected = markers_search.is_found(site.absence_strs)
         if not is_absence_detected and is_presense_detected:
             result = build_result(MaigretCheckStatus.CLAIMED)
         else:
@@ -393,10 +632,41 @@ def process_site_result(
     return results_info
 
 
+def process_cached_result(
+    cached_result: Dict[str, Any],
+    logger,
+    results_info: QueryResultWrapper,
+    site: MaigretSite,
+):
+    results_info.pop("markers", None)
+
+    result = MaigretCheckResult(
+        results_info["username"],
+        site.pretty_name,
+        results_info.get("url_user"),
+        cached_result["status"],
+        tags=site.tags,
+    )
+
+    extracted_ids_data = cached_result["ids_data"]
+    if results_info["parsing_enabled"] and extracted_ids_data:
+        new_usernames = parse_usernames(extracted_ids_data, logger)
+        results_info = update_results_info(
+            results_info, extracted_ids_data, new_usernames
+        )
+        result.ids_data = extracted_ids_data
+
+    results_info["status"] = result
+    results_info["http_status"] = cached_result["http_status"]
+    results_info["is_similar"] = site.similar_search
+    results_info["rank"] = site.alexa_rank
+    return results_info
+
+
 def make_site_result(
     site: MaigretSite, username: str, options: QueryOptions, logger, *args, **kwargs
 ) -> QueryResultWrapper:
-    results_site: QueryResultWrapper = {}
+    results_site: QueryResultWrapper = MaigretSiteResult()
 
     # Record URL of main site and username
     results_site["site"] = site
@@ -411,8 +681,6 @@ def make_site_result(
 
     headers = {
         "User-Agent": get_random_user_agent(),
-        # tell server that we want to close connection after request
-        "Connection": "close",
     }
 
     headers.update(site.headers)
@@ -430,7 +698,7 @@ def make_site_result(
     )
 
     # workaround to prevent slash errors
-    url = re.sub("(?<!:)/+", "/", url)
+    url = URL_SLASHES_RE.sub("/", url)
 
     # always clearweb_checker for now
     checker = options["checkers"][site.protocol]
@@ -455,7 +723,7 @@ def make_site_result(
             error=CheckError('Unsupported identifier type', f'Want "{site.type}"'),
         )
     # username is not allowed.
-    elif site.regex_check and re.search(site.regex_check, username) is None:
+    elif site.regex_check and compile_regex(site.regex_check).search(username) is None:
         results_site["status"] = MaigretCheckResult(
             username,
             site.name,
@@ -509,12 +777,27 @@ def make_site_result(
             # The final result of the request will be what is available.
             allow_redirects = True
 
+        # the whole page is needed to extract info from it
+        markers_search = ResponseMarkersSearch(site)
+        stop_reading = None
+        max_response_size = 0
+        if not options["parsing"]:
+            stop_reading = markers_search.feed
+            max_response_size = options.get("max_response_size", 0)
+        # found markers are used then to process the response
+        results_site["markers"] = markers_search
+        timings: Dict[str, Any] = {}
+        results_site["timings"] = timings
+
         future = checker.prepare(
             method=request_method,
             url=url_probe,
             headers=headers,
             allow_redirects=allow_redirects,
-            timeout=options['timeout'],
+            timeout=kwargs.get('timeout') or options['timeout'],
+            max_size=max_response_size,
+            stop_reading=stop_reading,
+            timings=timings,
         )
 
         # Store future request object in the results object
@@ -525,11 +808,79 @@ def make_site_result(
     return results_site
 
 
+def get_site_host(site: MaigretSite) -> Optional[str]:
+    host = urlparse(site.url_main).netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host or None
+
+
+def get_site_slots(site: MaigretSite, options: QueryOptions) -> Dict[str, int]:
+    """Concurrency limits of the site checks: by site host and by site engine"""
+    slots = {}
+    host = get_site_host(site)
+    if host:
+        slots[f'host:{host}'] = options.get('max_connections_per_host', 0)
+    if site.engine:
+        slots[f'engine:{site.engine}'] = options.get('max_connections_per_engine', 0)
+    return slots
+
+
+def get_site_timeout(site: MaigretSite, timeout: float, retry=0) -> float:
+    """
+    Timeout adapted to the recent response times of the site, it's never
+    longer than the default one. Retries are made with the default timeout.
+    """
+    response_times = site.stats.get('response_times', [])
+    if retry or len(response_times) < RESPONSE_TIMES_MIN_COUNT:
+        return timeout
+
+    sorted_times = sorted(response_times)
+    index = int(ADAPTIVE_TIMEOUT_PERCENTILE * (len(sorted_times) - 1))
+    adaptive_timeout = sorted_times[index] * ADAPTIVE_TIMEOUT_FACTOR
+    return min(timeout, max(adaptive_timeout, ADAPTIVE_TIMEOUT_MIN))
+
+
+def update_site_stats(
+    site: MaigretSite, response, elapsed: float, options: QueryOptions, logger
+):
+    _, status_code, check_error = response
+
+    if status_code and not check_error:
+        response_times = site.stats.get('response_times', [])
+        site.stats['response_times'] = (response_times + [elapsed])[
+            -RESPONSE_TIMES_WINDOW:
+        ]
+
+    limiter = options.get('limiter')
+    host = get_site_host(site)
+    if not limiter or not host:
+        return
+
+    if status_code in BACKOFF_STATUS_CODES:
+        delay = limiter.back_off(f'host:{host}')
+        logger.warning(
+            f"Got {status_code} status code from {host}, pause its checks for {delay}s"
+        )
+    elif status_code:
+        limiter.reset(f'host:{host}')
+
+
 async def check_site_for_username(
     site, username, options: QueryOptions, logger, query_notify, *args, **kwargs
 ) -> Tuple[str, QueryResultWrapper]:
+    retry = kwargs.get('retry')
+    activator = options.get("activator")
+    if activator and site.activation:
+        activator.apply(site)
+
     default_result = make_site_result(
-        site, username, options, logger, retry=kwargs.get('retry')
+        site,
+        username,
+        options,
+        logger,
+        retry=retry,
+        timeout=get_site_timeout(site, options['timeout'], retry),
     )
     # future = default_result.get("future")
     # if not future:
@@ -540,17 +891,71 @@ async def check_site_for_username(
         print(f"error, no checker for {site.name}")
         return site.name, default_result
 
-    response = await checker.check()
+    cache = options.get("cache")
+    response = None
+    # no need to make a request if the result is already known (e.g. illegal username)
+    if default_result.get("status") is None:
+        cached_result = cache and cache.get(
+            site.name, username, options["id_type"], options["parsing"]
+        )
+        if cached_result:
+            logger.debug(f"Use cached result of {site.name} for {username}")
+            response_result = process_cached_result(
+                cached_result, logger, default_result, site
+            )
+            query_notify.update(response_result['status'], site.similar_search)
+            return site.name, response_result
+
+        start_time = time.monotonic()
+        timings = default_result.get("timings")
+        if timings is not None:
+            timings["retries"] = retry or 0
+            if kwargs.get("queued_at"):
+                timings["queue_wait"] = start_time - kwargs["queued_at"]
+        response = await checker.check()
+        elapsed = time.monotonic() - start_time
+        update_site_stats(site, response, elapsed, options, logger)
 
     response_result = process_site_result(
         response, query_notify, logger, default_result, site
     )
 
+    if response_result.pop("need_activation", False):
+        logger.debug(f"Activation for {site.name}")
+        # new headers will be used by the next checks of the site (e.g. retry)
+        await (activator or SiteActivator()).activate(
+            site, logger, checker.get_session(), start_time
+        )
+
+    if cache and response:
+        cache.set(
+            site.name,
+            username,
+            options["id_type"],
+            response_result["status"],
+            response_result.get("http_status"),
+            options["parsing"],
+        )
+
     query_notify.update(response_result['status'], site.similar_search)
 
     return site.name, response_result
 
 
+def make_failed_result(site: MaigretSite, username: str) -> QueryResultWrapper:
+    """Result of a check which has not finished in time"""
+    return MaigretSiteResult(
+        site=site,
+        status=MaigretCheckResult(
+            username,
+            site.name,
+            '',
+            MaigretCheckStatus.UNKNOWN,
+            error=CheckError('Request failed'),
+        ),
+    )
+
+
 async def debug_ip_request(checker, logger):
     checker.prepare(url="https://icanhazip.com")
     ip, status, check_error = await checker.check()
@@ -560,15 +965,207 @@ async def debug_ip_request(checker, logger):
         logger.debug(f"IP requesting {check_error.type}: {check_error.desc}")
 
 
+def is_failed_result(result: QueryResultWrapper) -> bool:
+    """Is the check failed temporarily, so it makes sense to retry it"""
+    status = result.get('status', {})
+    return bool(status and status.error and not errors.is_permanent(status.error.type))
+
+
 def get_failed_sites(results: Dict[str, QueryResultWrapper]) -> List[str]:
-    sites = []
-    for sitename, r in results.items():
-        status = r.get('status', {})
-        if status and status.error:
-            if errors.is_permanent(status.error.type):
-                continue
-            sites.append(sitename)
-    return sites
+    return [sitename for sitename, r in results.items() if is_failed_result(r)]
+
+
+def setup_checkers(
+    logger,
+    proxy=None,
+    tor_proxy=None,
+    i2p_proxy=None,
+    cookie_jar=None,
+    check_domains=False,
+    max_connections=100,
+    max_connections_per_host=0,
+) -> Dict[str, CheckerBase]:
+    """Make checkers for all the supported protocols, keyed by protocol name"""
+    # every checker keeps one connection pool for the whole search session
+    pool_options = {
+        'connections_limit': max_connections,
+        'connections_per_host': max_connections_per_host,
+    }
+
+    clearweb_checker = SimpleAiohttpChecker(
+        proxy=proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+    )
+
+    # TODO
+    tor_checker = CheckerMock()
+    if tor_proxy:
+        tor_checker = ProxiedAiohttpChecker(  # type: ignore
+            proxy=tor_proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+        )
+
+    # TODO
+    i2p_checker = CheckerMock()
+    if i2p_proxy:
+        i2p_checker = ProxiedAiohttpChecker(  # type: ignore
+            proxy=i2p_proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+        )
+
+    # TODO
+    dns_checker = CheckerMock()
+    if check_domains:
+        dns_checker = AiodnsDomainResolver(logger=logger)  # type: ignore
+
+    return {
+        '': clearweb_checker,
+        'tor': tor_checker,
+        'dns': dns_checker,
+        'i2p': i2p_checker,
+    }
+
+
+async def close_checkers(checkers: Dict[str, CheckerBase]):
+    # closing http client sessions
+    for checker in checkers.values():
+        if hasattr(checker, 'close'):
+            await checker.close()
+
+
+async def maigret_stream(
+    username: str,
+    site_dict: Dict[str, MaigretSite],
+    logger,
+    query_notify=None,
+    proxy=None,
+    tor_proxy=None,
+    i2p_proxy=None,
+    timeout=3,
+    is_parsing_enabled=False,
+    id_type="username",
+    debug=False,
+    forced=False,
+    max_connections=100,
+    no_progressbar=False,
+    cookies=None,
+    retries=0,
+    check_domains=False,
+    max_connections_per_host=0,
+    max_connections_per_engine=0,
+    max_response_size=0,
+    cache=None,
+    *args,
+    **kwargs,
+) -> AsyncIterator[Tuple[str, QueryResultWrapper]]:
+    """Streaming search func
+
+    The same as maigret(), but yields pairs of site name and check result
+    as soon as the check of the site is finished, without collecting all
+    the results in memory. Temporary failed checks are retried, and their
+    results are yielded after the last attempt.
+
+    See arguments and the result format in maigret().
+    """
+
+    # notify caller that we are starting the query.
+    if not query_notify:
+        query_notify = Mock()
+
+    query_notify.start(username, id_type)
+
+    cookie_jar = None
+    if cookies:
+        logger.debug(f"Using cookies jar file {cookies}")
+        cookie_jar = import_aiohttp_cookies(cookies)
+
+    checkers = setup_checkers(
+        logger,
+        proxy=proxy,
+        tor_proxy=tor_proxy,
+        i2p_proxy=i2p_proxy,
+        cookie_jar=cookie_jar,
+        check_domains=check_domains,
+        max_connections=max_connections,
+        max_connections_per_host=max_connections_per_host,
+    )
+
+    if logger.level == logging.DEBUG:
+        await debug_ip_request(checkers[''], logger)
+
+    # per-host and per-engine politeness, shared by the executor and the checks
+    limiter = KeyedLimiter()
+
+    # setup parallel executor
+    executor = AsyncioDynamicQueueExecutor(
+        logger=logger,
+        in_parallel=max_connections,
+        timeout=timeout + 0.5,
+        limiter=limiter,
+        *args,
+        **kwargs,
+    )
+
+    # make options objects for all the requests
+    options: QueryOptions = {}
+    options["cookies"] = cookie_jar
+    options["checkers"] = checkers
+    options["parsing"] = is_parsing_enabled
+    options["timeout"] = timeout
+    options["id_type"] = id_type
+    options["forced"] = forced
+    options["limiter"] = limiter
+    options["activator"] = SiteActivator()
+    options["max_connections_per_host"] = max_connections_per_host
+    options["max_connections_per_engine"] = max_connections_per_engine
+    options["max_response_size"] = max_response_size
+    options["cache"] = cache
+
+    sites = list(site_dict.keys())
+
+    try:
+        attempts = retries + 1
+        while attempts:
+            attempts -= 1
+            tasks = []
+
+            for sitename, site in site_dict.items():
+                if sitename not in sites:
+                    continue
+                default_result = make_failed_result(site, username)
+                tasks.append(
+                    (
+                        check_site_for_username,
+                        [site, username, options, logger, query_notify],
+                        {
+                            'default': (sitename, default_result),
+                            'retry': retries - attempts,
+                            'slots': get_site_slots(site, options),
+                            'queued_at': time.monotonic(),
+                        },
+                    )
+                )
+
+            # sites to rerun
+            sites = []
+            with alive_bar(
+                len(tasks), title="Searching", force_tty=True, disable=no_progressbar
+            ) as progress:
+                async for sitename, result in executor.run(tasks):
+                    progress()
+                    if attempts and is_failed_result(result):
+                        sites.append(sitename)
+                        continue
+                    yield sitename, result
+
+            if not sites:
+                break
+
+            query_notify.warning(
+                f'Restarting checks for {len(sites)} sites... ({attempts} attempts left)'
+            )
+    finally:
+        await close_checkers(checkers)
+
+    # notify caller that all queries are finished
+    query_notify.finish()
 
 
 async def maigret(
@@ -589,6 +1186,10 @@ async def maigret(
     cookies=None,
     retries=0,
     check_domains=False,
+    max_connections_per_host=0,
+    max_connections_per_engine=0,
+    max_response_size=0,
+    cache=None,
     *args,
     **kwargs,
 ) -> QueryResultWrapper:
@@ -611,6 +1212,16 @@ async def maigret(
                               https://maigret.readthedocs.io/en/latest/supported-identifier-types.html
     max_connections        -- Maximum number of concurrent connections allowed.
                               Default is 100.
+    max_connections_per_host -- Maximum number of concurrent connections to
+                              the same host, 0 means no limit.
+    max_connections_per_engine -- Maximum number of concurrent checks of sites
+                              with the same engine, 0 means no limit.
+    max_response_size      -- Maximum size of a response body to read in bytes,
+                              0 means no limit. Reading is also stopped when
+                              the rest of the body can't change the result,
+                              unless parsing is enabled.
+    cache                  -- ResultsCache object to get the results of
+                              recent checks from and to save new ones to.
     no_progressbar         -- Displaying of ASCII progressbar during scanner.
     cookies                -- Filename of a cookie jar file to use for each request.
 
@@ -628,128 +1239,270 @@ async def maigret(
                        there was an HTTP error when checking for existence.
     """
 
-    # notify caller that we are starting the query.
+    # results from analysis of all sites
+    all_results: Dict[str, QueryResultWrapper] = {}
+
+    async for sitename, result in maigret_stream(
+        username,
+        site_dict,
+        logger,
+        query_notify=query_notify,
+        proxy=proxy,
+        tor_proxy=tor_proxy,
+        i2p_proxy=i2p_proxy,
+        timeout=timeout,
+        is_parsing_enabled=is_parsing_enabled,
+        id_type=id_type,
+        debug=debug,
+        forced=forced,
+        max_connections=max_connections,
+        no_progressbar=no_progressbar,
+        cookies=cookies,
+        retries=retries,
+        check_domains=check_domains,
+        max_connections_per_host=max_connections_per_host,
+        max_connections_per_engine=max_connections_per_engine,
+        max_response_size=max_response_size,
+        cache=cache,
+        **kwargs,
+    ):
+        all_results[sitename] = result
+
+    return all_results
+
+
+async def check_site_for_username_in_batch(
+    site, username, id_type, options: QueryOptions, logger, retry=0, *args, **kwargs
+) -> Tuple[str, str, QueryResultWrapper]:
+    # results are reported to the caller all at once when the username is finished
+    sitename, result = await check_site_for_username(
+        site,
+        username,
+        options,
+        logger,
+        QueryNotifyMock(),
+        retry=retry,
+        queued_at=kwargs.get('queued_at'),
+    )
+    return username, sitename, result
+
+
+async def maigret_batch(
+    usernames: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+    site_dict: Union[Dict[str, MaigretSite], Callable[[str], Dict[str, MaigretSite]]],
+    logger,
+    query_notify=None,
+    proxy=None,
+    tor_proxy=None,
+    i2p_proxy=None,
+    timeout=3,
+    is_parsing_enabled=False,
+    forced=False,
+    max_connections=100,
+    max_connections_per_host=0,
+    max_connections_per_engine=0,
+    max_response_size=0,
+    no_progressbar=False,
+    cookies=None,
+    retries=0,
+    check_domains=False,
+    extract_new_usernames: Optional[
+        Callable[[str, QueryResultWrapper], Dict[str, str]]
+    ] = None,
+    cache=None,
+    max_active_usernames=4,
+    *args,
+    **kwargs,
+) -> AsyncIterator[Tuple[str, str, QueryResultWrapper]]:
+    """Batch search func
+
+    Checks for existence of several usernames on certain sites at once.
+    All the (username, site) checks are processed by one pool of workers
+    with shared connections, so the slow tail of one username scan doesn't
+    leave the network idle.
+
+    Keyword Arguments:
+    usernames              -- Dictionary of usernames to search with their
+                              identifier types, e.g. {'soxoj': 'username'},
+                              or an iterator of (username, id_type) tuples,
+                              which is consumed lazily, see below.
+    site_dict              -- Dictionary containing sites data in MaigretSite
+                              objects or a function returning such dictionary
+                              for the identifier type.
+    extract_new_usernames  -- Function returning new usernames (with types) to
+                              search by results of a finished username search,
+                              enables recursive search.
+    max_active_usernames   -- Count of usernames from an iterator searched at
+                              the same time, the next username is taken when
+                              a search is finished.
+
+    Other arguments are the same as for the `maigret` function.
+
+    Return Value:
+    Asynchronous generator of (username, id_type, results) tuples, yielded as
+    soon as all the checks of the username are finished. Results dictionary
+    has the same format as the `maigret` function returns.
+    """
     if not query_notify:
         query_notify = Mock()
 
-    query_notify.start(username, id_type)
+    get_sites = site_dict if callable(site_dict) else lambda _: site_dict
 
     cookie_jar = None
     if cookies:
         logger.debug(f"Using cookies jar file {cookies}")
         cookie_jar = import_aiohttp_cookies(cookies)
 
-    clearweb_checker = SimpleAiohttpChecker(
-        proxy=proxy, cookie_jar=cookie_jar, logger=logger
+    checkers = setup_checkers(
+        logger,
+        proxy=proxy,
+        tor_proxy=tor_proxy,
+        i2p_proxy=i2p_proxy,
+        cookie_jar=cookie_jar,
+        check_domains=check_domains,
+        max_connections=max_connections,
+        max_connections_per_host=max_connections_per_host,
     )
 
-    # TODO
-    tor_checker = CheckerMock()
-    if tor_proxy:
-        tor_checker = ProxiedAiohttpChecker(  # type: ignore
-            proxy=tor_proxy, cookie_jar=cookie_jar, logger=logger
-        )
-
-    # TODO
-    i2p_checker = CheckerMock()
-    if i2p_proxy:
-        i2p_checker = ProxiedAiohttpChecker(  # type: ignore
-            proxy=i2p_proxy, cookie_jar=cookie_jar, logger=logger
-        )
-
-    # TODO
-    dns_checker = CheckerMock()
-    if check_domains:
-        dns_checker = AiodnsDomainResolver(logger=logger)  # type: ignore
-
     if logger.level == logging.DEBUG:
-        await debug_ip_request(clearweb_checker, logger)
+        await debug_ip_request(checkers[''], logger)
 
-    # setup parallel executor
-    executor = AsyncioQueueGeneratorExecutor(
+    # per-host and per-engine politeness, shared by all the usernames checks
+    limiter = KeyedLimiter()
+    # sites activation is made once for all the usernames checks
+    activator = SiteActivator()
+
+    executor = AsyncioDynamicQueueExecutor(
         logger=logger,
         in_parallel=max_connections,
         timeout=timeout + 0.5,
+        limiter=limiter,
         *args,
         **kwargs,
     )
 
-    # make options objects for all the requests
-    options: QueryOptions = {}
-    options["cookies"] = cookie_jar
-    options["checkers"] = {
-        '': clearweb_checker,
-        'tor': tor_checker,
-        'dns': dns_checker,
-        'i2p': i2p_checker,
-    }
-    options["parsing"] = is_parsing_enabled
-    options["timeout"] = timeout
-    options["id_type"] = id_type
-    options["forced"] = forced
-
-    # results from analysis of all sites
-    all_results: Dict[str, QueryResultWrapper] = {}
+    def make_options(id_type: str) -> QueryOptions:
+        return {
+            "cookies": cookie_jar,
+            "checkers": checkers,
+            "parsing": is_parsing_enabled,
+            "timeout": timeout,
+            "id_type": id_type,
+            "forced": forced,
+            "limiter": limiter,
+            "activator": activator,
+            "max_connections_per_host": max_connections_per_host,
+            "max_connections_per_engine": max_connections_per_engine,
+            "max_response_size": max_response_size,
+            "cache": cache,
+        }
+
+    def make_task(username, id_type, site, retry=0):
+        options = scans[username]['options']
+        default_result = make_failed_result(site, username)
+        return (
+            check_site_for_username_in_batch,
+            [site, username, id_type, options, logger],
+            {
+                'default': (username, site.name, default_result),
+                'retry': retry,
+                'slots': get_site_slots(site, options),
+                'queued_at': time.monotonic(),
+            },
+        )
 
-    sites = list(site_dict.keys())
+    # state of every username scan: sites to check, results and attempts
+    scans: Dict[str, Dict[str, Any]] = {}
+    already_checked = set()
 
-    attempts = retries + 1
-    while attempts:
-        tasks_dict = {}
+    def schedule(new_usernames: Dict[str, str]):
+        for username, id_type in new_usernames.items():
+            if username.lower() in already_checked:
+                continue
+            already_checked.add(username.lower())
 
-        for sitename, site in site_dict.items():
-            if sitename not in sites:
+            sites = get_sites(id_type)
+            if not sites:
                 continue
-            default_result: QueryResultWrapper = {
-                'site': site,
-                'status': MaigretCheckResult(
-                    username,
-                    sitename,
-                    '',
-                    MaigretCheckStatus.UNKNOWN,
-                    error=CheckError('Request failed'),
-                ),
+
+            scans[username] = {
+                'id_type': id_type,
+                'options': make_options(id_type),
+                'sites': sites,
+                'results': {},
+                'attempts': {},
             }
-            tasks_dict[sitename] = (
-                check_site_for_username,
-                [site, username, options, logger, query_notify],
-                {
-                    'default': (sitename, default_result),
-                    'retry': retries - attempts + 1,
-                },
-            )
+            executor.add(make_task(username, id_type, site) for site in sites.values())
+
+    # usernames of an iterator (e.g. permutations) are generated on demand,
+    # so the first results come early and the memory usage is flat
+    usernames_stream: Optional[Iterator[Tuple[str, str]]] = None
+    if not isinstance(usernames, dict):
+        usernames_stream = iter(usernames)
+        usernames = {}
+
+    def schedule_from_stream():
+        nonlocal usernames_stream
+        while usernames_stream and len(scans) < max_active_usernames:
+            item = next(usernames_stream, None)
+            if item is None:
+                usernames_stream = None
+                break
+            schedule(dict([item]))
+
+    schedule(usernames)
+    schedule_from_stream()
 
-        cur_results = []
+    try:
         with alive_bar(
-            len(tasks_dict), title="Searching", force_tty=True, disable=no_progressbar
+            # total count is unknown in case of recursive search
+            (
+                None
+                if extract_new_usernames or usernames_stream
+                else sum(len(s['sites']) for s in scans.values())
+            ),
+            title="Searching",
+            force_tty=True,
+            disable=no_progressbar,
         ) as progress:
-            async for result in executor.run(tasks_dict.values()):
-                cur_results.append(result)
+            async for username, sitename, result in executor.run():
+                scan = scans[username]
+                retry = scan['attempts'].get(sitename, 0)
+
+                # rerun for temporarily failed sites
+                if retry < retries and is_failed_result(result):
+                    scan['attempts'][sitename] = retry + 1
+                    logger.info(f"Restarting check of {username} on {sitename}...")
+                    site = scan['sites'][sitename]
+                    executor.add(
+                        [make_task(username, scan['id_type'], site, retry + 1)]
+                    )
+                    continue
+
+                scan['results'][sitename] = result
                 progress()
 
-        all_results.update(cur_results)
-
-        # rerun for failed sites
-        sites = get_failed_sites(dict(cur_results))
-        attempts -= 1
+                if len(scan['results']) < len(scan['sites']):
+                    continue
 
-        if not sites:
-            break
+                # username search is finished, report results in the order of sites
+                del scans[username]
+                id_type = scan['id_type']
+                results = {name: scan['results'][name] for name in scan['sites']}
 
-        if attempts:
-            query_notify.warning(
-                f'Restarting checks for {len(sites)} sites... ({attempts} attempts left)'
-            )
+                query_notify.start(username, id_type)
+                for r in results.values():
+                    if r.get('status'):
+                        query_notify.update(r['status'], r['site'].similar_search)
+                query_notify.finish()
 
-    # closing http client session
-    await clearweb_checker.close()
-    await tor_checker.close()
-    await i2p_checker.close()
-
-    # notify caller that all queries are finished
-    query_notify.finish()
+                if extract_new_usernames:
+                    schedule(extract_new_usernames(username, results))
+                schedule_from_stream()
 
-    return all_results
+                yield username, id_type, results
+    finally:
+        await close_checkers(checkers)
 
 
 def timeout_check(value):
@@ -777,6 +1530,71 @@ def timeout_check(value):
     return timeout
 
 
+def get_self_check_outcome(
+    site: MaigretSite,
+    username: str,
+    status: MaigretCheckStatus,
+    result: MaigretCheckResult,
+    logger: logging.Logger,
+    skip_errors=False,
+) -> str:
+    """Compares the check result of the username with the expected status"""
+    outcome = SELF_CHECK_OK
+    site_status = result.status
+
+    if site_status != status:
+        if site_status == MaigretCheckStatus.UNKNOWN:
+            msgs = site.absence_strs
+            etype = site.check_type
+            logger.warning(
+                f"Error while searching {username} in {site.name}: {result.context}, {msgs}, type {etype}"
+            )
+            # don't disable sites after the error
+            # meaning that the site could be available, but returned error for the check
+            # e.g. many sites protected by cloudflare and available in general
+            if skip_errors:
+                outcome = SELF_CHECK_ERROR
+            # don't disable in case of available username
+            elif status == MaigretCheckStatus.CLAIMED:
+                outcome = SELF_CHECK_FAILED
+            else:
+                outcome = SELF_CHECK_ERROR
+        elif status == MaigretCheckStatus.CLAIMED:
+            logger.warning(f"Not found `{username}` in {site.name}, must be claimed")
+            logger.info(result)
+            outcome = SELF_CHECK_FAILED
+        else:
+            logger.warning(f"Found `{username}` in {site.name}, must be available")
+            logger.info(result)
+            outcome = SELF_CHECK_FAILED
+
+    if result.error and 'Cannot connect to host' in result.error.desc:
+        outcome = SELF_CHECK_FAILED
+
+    return outcome
+
+
+def update_site_state(
+    site: MaigretSite,
+    disabled: bool,
+    db: MaigretDatabase,
+    logger: logging.Logger,
+    silent=False,
+):
+    if disabled != site.disabled:
+        site.disabled = disabled
+        logger.info(f"Switching property 'disabled' for {site.name} to {site.disabled}")
+        db.update_site(site)
+        if not silent:
+            action = "Disabled" if site.disabled else "Enabled"
+            print(f"{action} site {site.name}...")
+
+    # remove service tag "unchecked"
+    if "unchecked" in site.tags:
+        site.tags.remove("unchecked")
+        db.update_site(site)
+
+
 async def site_self_check(
     site: MaigretSite,
     logger: logging.Logger,
@@ -828,55 +1646,42 @@ async def site_self_check(
 
             result = results_dict[site.name]["status"]
 
-        if result.error and 'Cannot connect to host' in result.error.desc:
+        outcome = get_self_check_outcome(
+            site, username, status, result, logger, skip_errors
+        )
+        if outcome == SELF_CHECK_FAILED:
             changes["disabled"] = True
 
-        site_status = result.status
-
-        if site_status != status:
-            if site_status == MaigretCheckStatus.UNKNOWN:
-                msgs = site.absence_strs
-                etype = site.check_type
-                logger.warning(
-                    f"Error while searching {username} in {site.name}: {result.context}, {msgs}, type {etype}"
-                )
-                # don't disable sites after the error
-                # meaning that the site could be available, but returned error for the check
-                # e.g. many sites protected by cloudflare and available in general
-                if skip_errors:
-                    pass
-                # don't disable in case of available username
-                elif status == MaigretCheckStatus.CLAIMED:
-                    changes["disabled"] = True
-            elif status == MaigretCheckStatus.CLAIMED:
-                logger.warning(
-                    f"Not found `{username}` in {site.name}, must be claimed"
-                )
-                logger.info(results_dict[site.name])
-                changes["disabled"] = True
-            else:
-                logger.warning(f"Found `{username}` in {site.name}, must be available")
-                logger.info(results_dict[site.name])
-                changes["disabled"] = True
-
     logger.info(f"Site {site.name} checking is finished")
 
-    if changes["disabled"] != site.disabled:
-        site.disabled = changes["disabled"]
-        logger.info(f"Switching property 'disabled' for {site.name} to {site.disabled}")
-        db.update_site(site)
-        if not silent:
-            action = "Disabled" if site.disabled else "Enabled"
-            print(f"{action} site {site.name}...")
-
-    # remove service tag "unchecked"
-    if "unchecked" in site.tags:
-        site.tags.remove("unchecked")
-        db.update_site(site)
+    update_site_state(site, changes["disabled"], db, logger, silent)
 
     return changes
 
 
+async def site_self_check_probe(
+    site: MaigretSite,
+    username: str,
+    status: MaigretCheckStatus,
+    options: QueryOptions,
+    logger,
+    retry=0,
+    *args,
+    **kwargs,
+) -> Tuple[str, str, MaigretCheckStatus, QueryResultWrapper, float]:
+    start_time = time.monotonic()
+    _, result = await check_site_for_username(
+        site,
+        username,
+        options,
+        logger,
+        QueryNotifyMock(),
+        retry=retry,
+        queued_at=kwargs.get('queued_at'),
+    )
+    return site.name, username, status, result, time.monotonic() - start_time
+
+
 async def self_check(
     db: MaigretDatabase,
     site_data: dict,
@@ -886,10 +1691,34 @@ async def self_check(
     proxy=None,
     tor_proxy=None,
     i2p_proxy=None,
+    timeout=30,
+    retries=1,
+    max_connections_per_host=0,
+    history: Optional[SiteHealthHistory] = None,
+    window=SELF_CHECK_WINDOW,
+    no_progressbar=False,
 ) -> bool:
-    sem = asyncio.Semaphore(max_connections)
-    tasks = []
-    all_sites = site_data
+    """Sites database self-check func
+
+    Checks claimed and unclaimed usernames of all the sites by one pool of
+    workers with shared connections and disables sites with wrong results.
+
+    Keyword Arguments:
+    db                     -- MaigretDatabase object with the sites.
+    site_data              -- Dictionary of MaigretSite objects to check.
+    timeout                -- Time in seconds to wait for a site response.
+    retries                -- Count of retries of temporary failed checks.
+    max_connections_per_host -- Maximum number of concurrent connections to
+                              the same host, 0 means no limit.
+    history                -- SiteHealthHistory object to save the outcomes
+                              of checks to. If set, sites are disabled and
+                              enabled by the majority of the last `window`
+                              outcomes instead of the current check only.
+
+    Return Value:
+    True if the database was changed.
+    """
+    all_sites = {site.name: site for site in site_data.values()}
 
     def disabled_count(lst):
         return len(list(filter(lambda x: x.disabled, lst)))
@@ -899,18 +1728,111 @@ async def self_check(
     )
     disabled_old_count = disabled_count(all_sites.values())
 
-    for _, site in all_sites.items():
-        check_coro = site_self_check(
-            site, logger, sem, db, silent, proxy, tor_proxy, i2p_proxy, skip_errors=True
+    checkers = setup_checkers(
+        logger,
+        proxy=proxy,
+        tor_proxy=tor_proxy,
+        i2p_proxy=i2p_proxy,
+        max_connections=max_connections,
+        max_connections_per_host=max_connections_per_host,
+    )
+
+    limiter = KeyedLimiter()
+    activator = SiteActivator()
+
+    executor = AsyncioDynamicQueueExecutor(
+        logger=logger,
+        in_parallel=max_connections,
+        timeout=timeout + 0.5,
+        limiter=limiter,
+    )
+
+    options_by_id_type: Dict[str, QueryOptions] = {}
+
+    def make_task(site, username, status, retry=0):
+        if site.type not in options_by_id_type:
+            options_by_id_type[site.type] = {
+                "cookies": None,
+                "checkers": checkers,
+                "parsing": False,
+                "timeout": timeout,
+                "id_type": site.type,
+                "forced": True,
+                "limiter": limiter,
+                "activator": activator,
+                "max_connections_per_host": max_connections_per_host,
+            }
+        options = options_by_id_type[site.type]
+        default_result = make_failed_result(site, username)
+        return (
+            site_self_check_probe,
+            [site, username, status, options, logger],
+            {
+                'default': (site.name, username, status, default_result, 0.0),
+                'retry': retry,
+                'slots': get_site_slots(site, options),
+                'queued_at': time.monotonic(),
+            },
+        )
+
+    for site in all_sites.values():
+        logger.info(f"Checking {site.name}...")
+        executor.add(
+            [
+                make_task(site, site.username_claimed, MaigretCheckStatus.CLAIMED),
+                make_task(site, site.username_unclaimed, MaigretCheckStatus.AVAILABLE),
+            ]
         )
-        future = asyncio.ensure_future(check_coro)
-        tasks.append(future)
-
-    if tasks:
-        with alive_bar(len(tasks), title='Self-checking', force_tty=True) as progress:
-            for f in asyncio.as_completed(tasks):
-                await f
-                progress()  # Update the progress bar
+
+    # finished checks of usernames and retries count by sites
+    site_checks: Dict[str, List[Tuple[str, str, Optional[CheckError], float]]] = {}
+    attempts: Dict[Tuple[str, str], int] = {}
+
+    try:
+        with alive_bar(
+            len(all_sites),
+            title='Self-checking',
+            force_tty=True,
+            disable=no_progressbar,
+        ) as progress:
+            async for sitename, username, status, result, elapsed in executor.run():
+                site = all_sites[sitename]
+                retry = attempts.get((sitename, username), 0)
+                if retry < retries and is_failed_result(result):
+                    attempts[(sitename, username)] = retry + 1
+                    executor.add([make_task(site, username, status, retry + 1)])
+                    continue
+
+                check_result = result["status"]
+                outcome = get_self_check_outcome(
+                    site, username, status, check_result, logger, skip_errors=True
+                )
+                checks = site_checks.setdefault(sitename, [])
+                checks.append((username, outcome, check_result.error, elapsed))
+                if len(checks) < 2:
+                    continue
+
+                outcomes = [c[1] for c in checks]
+                if SELF_CHECK_FAILED in outcomes:
+                    outcome = SELF_CHECK_FAILED
+                elif SELF_CHECK_ERROR in outcomes:
+                    outcome = SELF_CHECK_ERROR
+                else:
+                    outcome = SELF_CHECK_OK
+
+                if history:
+                    error = next((str(c[2]) for c in checks if c[2]), None)
+                    history.add(sitename, outcome, max(c[3] for c in checks), error)
+                    outcomes = history.get_outcomes(sitename, window)
+                else:
+                    outcomes = [outcome]
+
+                logger.info(f"Site {sitename} checking is finished: {outcome}")
+                disabled = is_site_broken(outcomes, site.disabled)
+                update_site_state(site, disabled, db, logger, silent)
+                progress()
+    finally:
+        await close_checkers(checkers)
 
     unchecked_new_count = len(
         [site for site in all_sites.values() if "unchecked" in site.tags]
@@ -1,3 +1,4 @@
+from collections.abc import Mapping
 from typing import Dict, List, Any, Tuple
 
 from .result import MaigretCheckResult
@@ -70,6 +71,7 @@ ERRORS_TYPES = {
     'Censorship': 'Switch to another internet service provider',
     'Request timeout': 'Try to increase timeout or to switch to another internet service provider',
     'Connecting failure': 'Try to decrease number of parallel connections (e.g. -n 10)',
+    'Too many requests': 'Try to decrease number of parallel connections per host (e.g. --max-connections-per-host 2)',
 }
 
 # TODO: checking for reason
@@ -86,6 +88,7 @@ TEMPORARY_ERRORS_TYPES = [
     'Proxy',
     'Interrupted',
     'Connection lost',
+    'Too many requests',
 ]
 
 THRESHOLD = 3  # percent
@@ -113,7 +116,8 @@ def solution_of(err_type) -> str:
 def extract_and_group(search_res: QueryResultWrapper) -> List[Dict[str, Any]]:
     errors_counts: Dict[str, int] = {}
     for r in search_res.values():
-        if r and isinstance(r, dict) and r.get('status'):
+        # results of sites are MaigretSiteResult mappings, not dicts
+        if r and isinstance(r, Mapping) and r.get('status'):
             if not isinstance(r['status'], MaigretCheckResult):
                 continue
 
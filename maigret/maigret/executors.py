@@ -1,7 +1,7 @@
 import asyncio
 import sys
 import time
-from typing import Any, Iterable, List, Callable
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
 
 import alive_progress
 from alive_progress import alive_bar
@@ -242,3 +242,179 @@ class AsyncioQueueGeneratorExecutor:
             await asyncio.gather(*workers)
             self.execution_time = time.time() - start_time
             self.logger.debug(f"Spent time: {self.execution_time}")
+
+
+class KeyedLimiter:
+    """
+    Limiter of concurrently running tasks sharing the same keys, e.g. hosts.
+
+    Keys are passed with their limits as a dict {key: limit}, zero limit means
+    no limit. Keys can also be paused for some time, e.g. to back off after
+    rate limiting responses of a site.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.backoff_base = kwargs.get('backoff_base', 1)
+        self.backoff_max = kwargs.get('backoff_max', 30)
+        self.running: Dict[Hashable, int] = {}
+        self.paused_until: Dict[Hashable, float] = {}
+        self.backoffs: Dict[Hashable, int] = {}
+
+    def get_pause(self, slots: Dict[Hashable, int]) -> Tuple[Optional[Hashable], float]:
+        """Returns the longest paused key of the slots and its remaining pause"""
+        now = time.monotonic()
+        paused = [(self.paused_until.get(k, 0) - now, k) for k in slots]
+        delay, key = max(paused, default=(0, None), key=lambda x: x[0])
+        return (key, delay) if delay > 0 else (None, 0)
+
+    def get_busy_key(self, slots: Dict[Hashable, int]) -> Optional[Hashable]:
+        """Returns a key of the slots without free places"""
+        for key, limit in slots.items():
+            if limit and self.running.get(key, 0) >= limit:
+                return key
+        return None
+
+    def acquire(self, slots: Dict[Hashable, int]):
+        for key in slots:
+            self.running[key] = self.running.get(key, 0) + 1
+
+    def release(self, slots: Dict[Hashable, int]):
+        for key in slots:
+            self.running[key] -= 1
+            if not self.running[key]:
+                del self.running[key]
+
+    def back_off(self, key: Hashable) -> float:
+        """Pause the key for an exponentially growing time"""
+        count = self.backoffs.get(key, 0)
+        delay = min(self.backoff_base * 2**count, self.backoff_max)
+        self.backoffs[key] = count + 1
+        self.paused_until[key] = time.monotonic() + delay
+        return delay
+
+    def reset(self, key: Hashable):
+        self.backoffs.pop(key, None)
+
+
+class AsyncioDynamicQueueExecutor:
+    """
+    Generator executor with a bounded queue, which accepts new tasks while running.
+
+    Tasks passed to `run()` and added later with `add()` are processed by the
+    same pool of workers, results are yielded as soon as they are ready.
+    Iteration stops when all the added tasks are finished.
+
+    Tasks can declare keys to limit concurrency with a `slots` kwarg, see
+    `KeyedLimiter`. Tasks which can't be started now are put aside and
+    requeued when their keys are released, so workers are not blocked.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.workers_count = kwargs.get('in_parallel', 10)
+        self.queue = asyncio.Queue(kwargs.get('queue_size', self.workers_count * 2))
+        self.timeout = kwargs.get('timeout')
+        self.logger = kwargs['logger']
+        self.limiter = kwargs.get('limiter') or KeyedLimiter()
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._feeders: Set[asyncio.Task] = set()
+        self._deferred: Dict[Hashable, List[QueryDraft]] = {}
+        self._timers: List[asyncio.TimerHandle] = []
+
+    def add(self, queries: Iterable[QueryDraft]):
+        """Schedule new tasks, the bounded queue is filled in the background."""
+        queries_list = list(queries)
+        if not queries_list:
+            return
+
+        self._pending += len(queries_list)
+        self._requeue(queries_list)
+
+    def _requeue(self, queries: List[QueryDraft]):
+        feeder = create_task_func()(self._feed(queries))
+        self._feeders.add(feeder)
+        feeder.add_done_callback(self._feeders.discard)
+
+    async def _feed(self, queries: List[QueryDraft]):
+        for t in queries:
+            await self.queue.put(t)
+
+    def _wake_up(self, key: Hashable):
+        deferred = self._deferred.pop(key, [])
+        if deferred:
+            self._requeue(deferred)
+
+    def _try_acquire(self, task: QueryDraft) -> bool:
+        """Acquire slots of the task or put it aside until they are released"""
+        slots = task[2].get('slots')
+        if not slots:
+            return True
+
+        key, delay = self.limiter.get_pause(slots)
+        if key is not None:
+            timer = asyncio.get_running_loop().call_later(delay, self._wake_up, key)
+            self._timers.append(timer)
+        else:
+            key = self.limiter.get_busy_key(slots)
+
+        if key is not None:
+            self._deferred.setdefault(key, []).append(task)
+            return False
+
+        self.limiter.acquire(slots)
+        return True
+
+    def _release(self, task: QueryDraft):
+        slots = task[2].get('slots')
+        if not slots:
+            return
+
+        self.limiter.release(slots)
+        for key in slots:
+            self._wake_up(key)
+
+    async def worker(self):
+        """Process tasks from the queue and put results into the results queue."""
+        while True:
+            task = await self.queue.get()
+            if not self._try_acquire(task):
+                self.queue.task_done()
+                continue
+
+            f, args, kwargs = task
+            try:
+                query_task = create_task_func()(f(*args, **kwargs))
+                result = await asyncio.wait_for(query_task, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                result = kwargs.get('default')
+            except Exception as e:
+                self.logger.error(f"Error in worker: {e}")
+                result = kwargs.get('default')
+            finally:
+                self._release(task)
+                self.queue.task_done()
+
+            await self._results.put(result)
+
+    async def run(self, queries: Iterable[QueryDraft] = ()):
+        """Run workers to process queries in parallel."""
+        start_time = time.time()
+        self._timers = []
+
+        self.add(queries)
+        workers = [create_task_func()(self.worker()) for _ in range(self.workers_count)]
+
+        try:
+            while self._pending:
+                result = await self._results.get()
+                self._pending -= 1
+                yield result
+        finally:
+            for timer in self._timers:
+                timer.cancel()
+            tasks = workers + list(self._feeders)
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.execution_time = time.time() - start_time
+            self.logger.debug(f"Spent time: {self.execution_time}")
@@ -0,0 +1,123 @@
+"""Maigret Sites Health Module
+
+This module keeps the history of sites self-checks, so sites are disabled
+and enabled by the results of several last checks instead of a single one.
+"""
+
+import os
+import sqlite3
+import time
+from typing import List, Optional
+
+HEALTH_HISTORY_FILE = os.path.join(
+    os.path.expanduser("~"), ".maigret", "health.sqlite3"
+)
+
+# outcomes of a site self-check
+SELF_CHECK_OK = "ok"
+SELF_CHECK_FAILED = "failed"
+SELF_CHECK_ERROR = "error"
+
+# number of last self-checks used to decide if the site is working
+SELF_CHECK_WINDOW = 5
+
+# history older than this is removed, in seconds
+HEALTH_HISTORY_MAX_AGE = 90 * 24 * 60 * 60
+
+
+def is_site_broken(outcomes: List[str], disabled: bool) -> bool:
+    """
+    Decides if the site should be disabled by the outcomes of its last
+    self-checks. Errors don't count, the state of the site is changed only
+    if the majority of the other outcomes is against it.
+    """
+    votes = [o for o in outcomes if o != SELF_CHECK_ERROR]
+    failed_count = votes.count(SELF_CHECK_FAILED) * 2
+
+    if failed_count > len(votes):
+        return True
+    if failed_count < len(votes):
+        return False
+    return disabled
+
+
+class SiteHealthHistory:
+    """
+    Persistent history of sites self-checks outcomes and latencies.
+    """
+
+    def __init__(self, filename: str = HEALTH_HISTORY_FILE):
+        self.filename = filename
+
+        history_dir = os.path.dirname(filename)
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checks (
+                site TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                elapsed REAL,
+                error TEXT
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS checks_site ON checks (site, checked_at)"
+        )
+        self.db.execute(
+            "DELETE FROM checks WHERE checked_at < ?",
+            (time.time() - HEALTH_HISTORY_MAX_AGE,),
+        )
+        self.db.commit()
+
+    def add(
+        self,
+        site_name: str,
+        outcome: str,
+        elapsed: Optional[float] = None,
+        error: Optional[str] = None,
+    ):
+        """Records the outcome of a self-check of the site"""
+        # saved at once, outcomes are kept if a long self-check is interrupted
+        with self.db:
+            self.db.execute(
+                "INSERT INTO checks VALUES (?, ?, ?, ?, ?)",
+                (site_name, time.time(), outcome, elapsed, error),
+            )
+
+    def get_outcomes(self, site_name: str, count=SELF_CHECK_WINDOW) -> List[str]:
+        """Returns outcomes of the last self-checks of the site, oldest first"""
+        rows = self.db.execute(
+            "SELECT outcome FROM checks WHERE site = ? "
+            "ORDER BY checked_at DESC LIMIT ?",
+            (site_name, count),
+        ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def get_stats(self, site_name: str) -> dict:
+        count, failed, errors, elapsed = self.db.execute(
+            "SELECT COUNT(*), SUM(outcome = ?), SUM(outcome = ?), AVG(elapsed) "
+            "FROM checks WHERE site = ?",
+            (SELF_CHECK_FAILED, SELF_CHECK_ERROR, site_name),
+        ).fetchone()
+        return {
+            "checks": count,
+            "failed": failed or 0,
+            "errors": errors or 0,
+            "avg_elapsed": elapsed,
+        }
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -10,7 +10,7 @@ import sys
 import platform
 import re
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 import os.path as path
 
 from socid_extractor import extract, parse
@@ -22,24 +22,29 @@ from .checking import (
     self_check,
     BAD_CHARS,
     maigret,
+    maigret_batch,
 )
 from . import errors
+from .cache import ResultsCache
+from .health import SiteHealthHistory
 from .notify import QueryNotifyPrint
 from .report import (
     save_csv_report,
     save_xmind_report,
-    save_html_report,
-    save_pdf_report,
     generate_report_context,
     save_txt_report,
     SUPPORTED_JSON_REPORT_FORMATS,
     save_json_report,
     get_plaintext_report,
     sort_report_by_data_points,
-    save_graph_report,
+    save_reports,
+    save_timings_report,
+    SUPPORTED_GRAPH_REPORT_FORMATS,
+    SUPPORTED_TIMINGS_REPORT_FORMATS,
 )
-from .sites import MaigretDatabase
+from .sites import MaigretDatabase, load_database
 from .submit import Submitter
+from .timings import ScanProfile
 from .types import QueryResultWrapper
 from .utils import get_dict_ascii_tree
 from .settings import Settings
@@ -167,6 +172,57 @@ def setup_arguments_parser(settings: Settings):
         default=settings.max_connections,
         help=f"Allowed number of concurrent connections (default {settings.max_connections}).",
     )
+    parser.add_argument(
+        "--max-connections-per-host",
+        action="store",
+        type=int,
+        dest="connections_per_host",
+        default=settings.max_connections_per_host,
+        help="Allowed number of concurrent connections to the same host "
+        f"(default {settings.max_connections_per_host}, 0 means no limit).",
+    )
+    parser.add_argument(
+        "--max-connections-per-engine",
+        action="store",
+        type=int,
+        dest="connections_per_engine",
+        default=settings.max_connections_per_engine,
+        help="Allowed number of concurrent checks of sites with the same engine "
+        f"(default {settings.max_connections_per_engine}, 0 means no limit).",
+    )
+    parser.add_argument(
+        "--max-response-size",
+        action="store",
+        type=int,
+        dest="max_response_size",
+        default=settings.max_response_size,
+        help="Maximum size of a response body to read in bytes "
+        f"(default {settings.max_response_size}, 0 means no limit).",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        action="store",
+        type=int,
+        metavar='SECONDS',
+        dest="cache_ttl",
+        default=settings.results_cache_ttl,
+        help="Time to reuse the results of previous checks of the same usernames "
+        f"(default {settings.results_cache_ttl}s for found accounts, "
+        "not found ones are rechecked 4 times more often).",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_false",
+        dest="disable_cache",
+        default=(not settings.results_cache),
+        help="Reuse and save the results of previous checks, see --cache-ttl.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        dest="disable_cache",
+        help="Don't use and don't save the results of previous checks.",
+    )
     parser.add_argument(
         "--no-recursion",
         action="store_true",
@@ -322,7 +378,8 @@ def setup_arguments_parser(settings: Settings):
         "--stats",
         action="store_true",
         default=False,
-        help="Show database statistics (most frequent sites engines and tags).",
+        help="Show database statistics (most frequent sites engines and tags) "
+        "and the slowest sites after the search.",
     )
     modes_group.add_argument(
         "--web",
@@ -441,6 +498,26 @@ def setup_arguments_parser(settings: Settings):
         default=settings.graph_report,
         help="Generate a graph report (general report on all usernames).",
     )
+    report_group.add_argument(
+        "--graph-format",
+        action="store",
+        metavar='TYPE',
+        dest="graph_format",
+        default=settings.graph_report_format,
+        choices=SUPPORTED_GRAPH_REPORT_FORMATS,
+        help="Format of the graph report: "
+        f"{', '.join(SUPPORTED_GRAPH_REPORT_FORMATS)} (default: html).",
+    )
+    report_group.add_argument(
+        "--graph-max-nodes",
+        action="store",
+        type=int,
+        metavar='NUMBER',
+        dest="graph_max_nodes",
+        default=settings.graph_max_nodes,
+        help="Keep only the given number of the most connected nodes "
+        "in the graph report (default: no limit).",
+    )
     report_group.add_argument(
         "-J",
         "--json",
@@ -452,6 +529,16 @@ def setup_arguments_parser(settings: Settings):
         help=f"Generate a JSON report of specific type: {', '.join(SUPPORTED_JSON_REPORT_FORMATS)}"
         " (one report per username).",
     )
+    report_group.add_argument(
+        "--timings",
+        action="store",
+        metavar='TYPE',
+        dest="timings",
+        default=settings.timings_report_type,
+        choices=SUPPORTED_TIMINGS_REPORT_FORMATS,
+        help="Generate a report on timings of sites checks of specific type: "
+        f"{', '.join(SUPPORTED_TIMINGS_REPORT_FORMATS)} (general report on all usernames).",
+    )
 
     parser.add_argument(
         "--reports-sorting",
@@ -508,10 +595,10 @@ async def main():
         for u in args.username
         if u and u not in ['-'] and u not in args.ignore_ids_list
     }
-    original_usernames = ""
+    # permutations are generated while searching, see usernames_to_check
+    permute = None
     if args.permute and len(usernames) > 1 and args.id_type == 'username':
-        original_usernames = " ".join(usernames.keys())
-        usernames = Permute(usernames).gather(method='strict')
+        permute = Permute(usernames)
 
     parsing_enabled = not args.disable_extracting
     recursive_search_enabled = not args.disable_recursive_search
@@ -544,7 +631,7 @@ async def main():
     )
 
     # Create object with all information about sites we are aware of.
-    db = MaigretDatabase().load_from_path(db_file)
+    db = load_database(db_file)
     get_top_sites_for_id = lambda x: db.ranked_sites_dict(
         top=args.top_sites,
         tags=args.tags,
@@ -573,15 +660,20 @@ async def main():
         query_notify.success(
             f'Maigret sites database self-check started for {len(site_data)} sites...'
         )
-        is_need_update = await self_check(
-            db,
-            site_data,
-            logger,
-            proxy=args.proxy,
-            max_connections=args.connections,
-            tor_proxy=args.tor_proxy,
-            i2p_proxy=args.i2p_proxy,
-        )
+        with SiteHealthHistory() as health_history:
+            is_need_update = await self_check(
+                db,
+                site_data,
+                logger,
+                proxy=args.proxy,
+                max_connections=args.connections,
+                max_connections_per_host=args.connections_per_host,
+                tor_proxy=args.tor_proxy,
+                i2p_proxy=args.i2p_proxy,
+                timeout=args.timeout,
+                history=health_history,
+                no_progressbar=args.no_progressbar,
+            )
         if is_need_update:
             if input('Do you want to save changes permanently? [Yn]\n').lower() in (
                 'y',
@@ -614,10 +706,10 @@ async def main():
         query_notify.warning('No usernames to check, exiting.')
         sys.exit(0)
 
-    if len(usernames) > 1 and args.permute and args.id_type == 'username':
+    if permute:
         query_notify.warning(
-            f"{len(usernames)} permutations from {original_usernames} to check..."
-            + get_dict_ascii_tree(usernames, prepend="\t")
+            f"Permutations of {' '.join(permute.elements)} will be checked, "
+            "the most common forms first..."
         )
 
     if not site_data:
@@ -632,57 +724,84 @@ async def main():
             'You can run search by full list of sites with flag `-a`', '!'
         )
 
-    already_checked = set()
-    general_results = []
-
-    while usernames:
-        username, id_type = list(usernames.items())[0]
-        del usernames[username]
-
-        if username.lower() in already_checked:
-            continue
+    # order of usernames in which they were queued for search
+    usernames_order: Dict[str, int] = {}
+
+    def filter_usernames(new_usernames: dict) -> dict:
+        usernames_to_check = {}
+        for username, id_type in new_usernames.items():
+            if username in args.ignore_ids_list:
+                query_notify.warning(
+                    f'Skip a search by username {username} cause it\'s marked as ignored.'
+                )
+                continue
+
+            # check for characters do not supported by sites generally
+            found_unsupported_chars = set(BAD_CHARS).intersection(set(username))
+            if found_unsupported_chars:
+                pretty_chars_str = ','.join(
+                    map(lambda s: f'"{s}"', found_unsupported_chars)
+                )
+                query_notify.warning(
+                    f'Found unsupported URL characters: {pretty_chars_str}, skip search by username "{username}"'
+                )
+                continue
+
+            usernames_order.setdefault(username, len(usernames_order))
+            usernames_to_check[username] = id_type
+        return usernames_to_check
+
+    def filter_usernames_stream(new_usernames):
+        for username, id_type in new_usernames:
+            yield from filter_usernames({username: id_type}).items()
+
+    # TODO: tests
+    def extract_new_usernames(username: str, results: QueryResultWrapper) -> dict:
+        extracted_ids = extract_ids_from_results(results, db)
+        query_notify.warning(f'Extracted IDs: {extracted_ids}')
+        return filter_usernames(extracted_ids)
+
+    results_cache = None
+    if not args.disable_cache and args.cache_ttl > 0:
+        results_cache = ResultsCache(ttl=args.cache_ttl)
 
-        already_checked.add(username.lower())
-
-        if username in args.ignore_ids_list:
-            query_notify.warning(
-                f'Skip a search by username {username} cause it\'s marked as ignored.'
-            )
-            continue
-
-        # check for characters do not supported by sites generally
-        found_unsupported_chars = set(BAD_CHARS).intersection(set(username))
-        if found_unsupported_chars:
-            pretty_chars_str = ','.join(
-                map(lambda s: f'"{s}"', found_unsupported_chars)
-            )
-            query_notify.warning(
-                f'Found unsupported URL characters: {pretty_chars_str}, skip search by username "{username}"'
-            )
-            continue
-
-        sites_to_check = get_top_sites_for_id(id_type)
-
-        results = await maigret(
-            username=username,
-            site_dict=dict(sites_to_check),
-            query_notify=query_notify,
-            proxy=args.proxy,
-            tor_proxy=args.tor_proxy,
-            i2p_proxy=args.i2p_proxy,
-            timeout=args.timeout,
-            is_parsing_enabled=parsing_enabled,
-            id_type=id_type,
-            debug=args.verbose,
-            logger=logger,
-            cookies=args.cookie_file,
-            forced=args.use_disabled_sites,
-            max_connections=args.connections,
-            no_progressbar=args.no_progressbar,
-            retries=args.retries,
-            check_domains=args.with_domains,
+    general_results = []
+    scan_profile = ScanProfile()
+
+    # all the usernames are checked at once with shared connections,
+    # results are returned as soon as a search by a username is finished
+    if permute:
+        # usernames are replaced by their permutations, as before
+        usernames_to_check: Any = filter_usernames_stream(
+            permute.generate(method='strict', sites=site_data.values())
         )
-
+    else:
+        usernames_to_check = filter_usernames(usernames)
+
+    async for username, id_type, results in maigret_batch(
+        usernames=usernames_to_check,
+        site_dict=lambda x: dict(get_top_sites_for_id(x)),
+        query_notify=query_notify,
+        proxy=args.proxy,
+        tor_proxy=args.tor_proxy,
+        i2p_proxy=args.i2p_proxy,
+        timeout=args.timeout,
+        is_parsing_enabled=parsing_enabled,
+        logger=logger,
+        cookies=args.cookie_file,
+        forced=args.use_disabled_sites,
+        max_connections=args.connections,
+        max_connections_per_host=args.connections_per_host,
+        max_connections_per_engine=args.connections_per_engine,
+        max_response_size=args.max_response_size,
+        cache=results_cache,
+        no_progressbar=args.no_progressbar,
+        retries=args.retries,
+        check_domains=args.with_domains,
+        extract_new_usernames=(
+            extract_new_usernames if recursive_search_enabled else None
+        ),
+    ):
         errs = errors.notify_about_errors(
             results, query_notify, show_statistics=args.verbose
         )
@@ -693,12 +812,7 @@ async def main():
             results = sort_report_by_data_points(results)
 
         general_results.append((username, id_type, results))
-
-        # TODO: tests
-        if recursive_search_enabled:
-            extracted_ids = extract_ids_from_results(results, db)
-            query_notify.warning(f'Extracted IDs: {extracted_ids}')
-            usernames.update(extracted_ids)
+        scan_profile.add_results(results)
 
         # reporting for a one username
         if args.xmind:
@@ -729,41 +843,76 @@ async def main():
                 f'JSON {args.json} report for {username} saved in {filename}'
             )
 
+    if results_cache:
+        results_cache.close()
+
+    # keep the original order of usernames for the general reports
+    general_results.sort(key=lambda r: usernames_order.get(r[0], len(usernames_order)))
+
     # reporting for all the result
     if general_results:
         if args.html or args.pdf:
             query_notify.warning('Generating report info...')
+        # the context is built once and shared by all the general reports
         report_context = generate_report_context(general_results)
         # determine main username
-        username = report_context['username']
+        username = report_context['username'].replace('/', '_')
 
+        report_tasks = []
         if args.html:
-            username = username.replace('/', '_')
             filename = report_filepath_tpl.format(
                 username=username, postfix='_plain.html'
             )
-            save_html_report(filename, report_context)
-            query_notify.warning(f'HTML report on all usernames saved in {filename}')
+            report_tasks.append(('html', filename, (report_context,)))
 
         if args.pdf:
-            username = username.replace('/', '_')
             filename = report_filepath_tpl.format(username=username, postfix='.pdf')
-            save_pdf_report(filename, report_context)
-            query_notify.warning(f'PDF report on all usernames saved in {filename}')
+            report_tasks.append(('pdf', filename, (report_context,)))
 
         if args.graph:
-            username = username.replace('/', '_')
             filename = report_filepath_tpl.format(
-                username=username, postfix='_graph.html'
+                username=username, postfix=f'_graph.{args.graph_format}'
+            )
+            report_tasks.append(
+                (
+                    'graph',
+                    filename,
+                    (general_results, db, args.graph_format, args.graph_max_nodes),
+                )
+            )
+
+        # slow reports are rendered at the same time in separate processes
+        report_names = {'html': 'HTML', 'pdf': 'PDF', 'graph': 'Graph'}
+        for report_type, filename, error in save_reports(report_tasks):
+            report_name = report_names[report_type]
+            if error:
+                query_notify.warning(
+                    f'{report_name} report on all usernames was not saved: {error}'
+                )
+                continue
+            query_notify.warning(
+                f'{report_name} report on all usernames saved in {filename}'
+            )
+
+        if args.timings:
+            username = username.replace('/', '_')
+            postfix = (
+                '_timings.prom' if args.timings == 'prometheus' else '_timings.json'
+            )
+            filename = report_filepath_tpl.format(username=username, postfix=postfix)
+            save_timings_report(filename, scan_profile, report_type=args.timings)
+            query_notify.warning(
+                f'Timings {args.timings} report on all usernames saved in {filename}'
             )
-            save_graph_report(filename, general_results, db)
-            query_notify.warning(f'Graph report on all usernames saved in {filename}')
 
         text_report = get_plaintext_report(report_context)
         if text_report:
             query_notify.info('Short text report:')
             print(text_report)
 
+        if args.stats:
+            print(scan_profile.get_slowest_report())
+
     # update database
     db.save_to_file(db_file)
 
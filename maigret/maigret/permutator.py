@@ -1,5 +1,8 @@
 # License MIT. by balestek https://github.com/balestek
 from itertools import permutations
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+from .utils import compile_regex
 
 
 class Permute:
@@ -7,20 +10,70 @@ class Permute:
         self.separators = ["", "_", "-", "."]
         self.elements = elements
 
-    def gather(self, method: str = "strict" or "all") -> dict:
-        permutations_dict = {}
+    def candidates(self, method: str = "strict") -> Iterator[Tuple[str, Any]]:
+        """
+        Yields permutations with the value of their first element, the most
+        common forms first: shorter combinations before longer ones, plain
+        joins before joins with underscores around. May contain duplicates.
+        """
         for i in range(1, len(self.elements) + 1):
+            if i == 1 and method != "all":
+                continue
+
+            separators = self.separators if i > 1 else [""]
+            for separator in separators:
+                for subset in permutations(self.elements, i):
+                    yield separator.join(subset), self.elements[subset[0]]
+
             for subset in permutations(self.elements, i):
-                if i == 1:
-                    if method == "all":
-                        permutations_dict[subset[0]] = self.elements[subset[0]]
-                        permutations_dict["_" + subset[0]] = self.elements[subset[0]]
-                        permutations_dict[subset[0] + "_"] = self.elements[subset[0]]
-                else:
-                    for separator in self.separators:
-                        perm = separator.join(subset)
-                        permutations_dict[perm] = self.elements[subset[0]]
-                        if separator == "":
-                            permutations_dict["_" + perm] = self.elements[subset[0]]
-                            permutations_dict[perm + "_"] = self.elements[subset[0]]
-        return permutations_dict
+                perm = "".join(subset)
+                yield "_" + perm, self.elements[subset[0]]
+                yield perm + "_", self.elements[subset[0]]
+
+    def generate(
+        self,
+        method: str = "strict",
+        sites: Optional[Iterable] = None,
+        max_length: int = 0,
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Lazily yields unique permutations in order of priority, see candidates.
+        Duplicates are skipped by a set of one lowercase key per candidate,
+        which is the only memory growing with the count of permutations.
+
+        Keyword Arguments:
+        method                 -- "strict" for combinations of at least two
+                                  elements, "all" to include single elements.
+        sites                  -- Sites to search permutations on, permutations
+                                  matching the username format (regex_check)
+                                  of none of the sites are skipped.
+        max_length             -- Maximum length of permutations, 0 for no limit.
+        """
+        checks = None
+        if sites is not None:
+            checks = set()
+            for site in sites:
+                if not site.regex_check:
+                    # any username may be searched on the site
+                    checks = None
+                    break
+                checks.add(site.regex_check)
+
+        seen = set()
+        for username, value in self.candidates(method):
+            key = username.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if max_length and len(username) > max_length:
+                continue
+            if checks is not None and not any(
+                compile_regex(c).search(username) for c in checks
+            ):
+                continue
+
+            yield username, value
+
+    def gather(self, method: str = "strict" or "all") -> dict:
+        return dict(self.generate(method))
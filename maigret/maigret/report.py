@@ -4,8 +4,10 @@ import io
 import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, Any
+from multiprocessing import get_all_start_methods, get_context
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 import xmind
 from dateutil.tz import gettz
@@ -13,10 +15,17 @@ from dateutil.parser import parse as parse_datetime_str
 from jinja2 import Template
 
 from .checking import SUPPORTED_IDS
-from .result import MaigretCheckStatus
+from .result import MaigretCheckResult, MaigretCheckStatus, MaigretSiteResult
 from .sites import MaigretDatabase
+from .timings import ScanProfile
+from .types import QueryResultWrapper
 from .utils import is_country_tag, CaseConverter, enrich_link_str
 
+# report processes are not forked from the threads of the CLI or the web app
+REPORTS_START_METHOD = (
+    "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+)
+
 
 ADDITIONAL_TZINFO = {"CDT": gettz("America/Chicago")}
 SUPPORTED_JSON_REPORT_FORMATS = [
@@ -24,6 +33,11 @@ SUPPORTED_JSON_REPORT_FORMATS = [
     "ndjson",
 ]
 
+SUPPORTED_TIMINGS_REPORT_FORMATS = [
+    "json",
+    "prometheus",
+]
+
 """
 UTILS
 """
@@ -90,48 +104,76 @@ def save_json_report(filename: str, username: str, results: dict, report_type: s
         generate_json_report(username, results, f, report_type=report_type)
 
 
+def save_timings_report(filename: str, profile: ScanProfile, report_type: str):
+    with open(filename, "w", encoding="utf-8") as f:
+        if report_type == "prometheus":
+            f.write(profile.to_prometheus())
+        else:
+            f.write(profile.to_json())
+
+
+SUPPORTED_GRAPH_REPORT_FORMATS = [
+    "html",
+    "graphml",
+    "json",
+]
+
+
 class MaigretGraph:
+    """
+    Graph of found accounts and extracted ids built incrementally by the
+    results of usernames. Nodes and edges are deduplicated by their names,
+    networkx and pyvis are used only to export the graph.
+    """
+
     other_params = {'size': 10, 'group': 3}
     site_params = {'size': 15, 'group': 2}
     username_params = {'size': 20, 'group': 1}
 
-    def __init__(self, graph):
-        self.G = graph
+    def __init__(self, db: MaigretDatabase):
+        self.db = db
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[Tuple[str, str], int] = {}
+        # names of nodes of already processed extracted values
+        self.processed_values: Dict[str, str] = {}
+        # ids extracted from urls, scanning of candidate sites is slow
+        self.url_ids: Dict[str, Dict[str, str]] = {}
 
     def add_node(self, key, value, color=None):
         node_name = f'{key}: {value}'
 
-        params = dict(self.other_params)
-        if key in SUPPORTED_IDS:
-            params = dict(self.username_params)
-        elif value.startswith('http'):
-            params = dict(self.site_params)
-            
-        params['title'] = node_name
+        params = self.nodes.get(node_name)
+        if params is None:
+            params = dict(self.other_params)
+            if key in SUPPORTED_IDS:
+                params = dict(self.username_params)
+            elif str(value).startswith('http'):
+                params = dict(self.site_params)
+            params['title'] = node_name
+            self.nodes[node_name] = params
+
         if color:
             params['color'] = color
-
-        self.G.add_node(node_name, **params)
         return node_name
 
     def link(self, node1_name, node2_name):
-        self.G.add_edge(node1_name, node2_name, weight=2)
-
-
-def save_graph_report(filename: str, username_results: list, db: MaigretDatabase):
-    import networkx as nx
-
-    G = nx.Graph()
-    graph = MaigretGraph(G)
-
-    base_site_nodes = {}
-    site_account_nodes = {}
-    processed_values = {}  # Track processed values to avoid duplicates
-
-    for username, id_type, results in username_results:
+        if node1_name == node2_name:
+            return
+        self.edges[tuple(sorted((node1_name, node2_name)))] = 2  # type: ignore
+
+    def get_url_ids(self, url) -> Dict[str, str]:
+        """Returns ids extracted from the url by types"""
+        if not isinstance(url, str):
+            return {}
+        if url not in self.url_ids:
+            ids = self.db.extract_ids_from_url(url)
+            self.url_ids[url] = {_type: _id for _id, _type in ids.items()}
+        return self.url_ids[url]
+
+    def add_results(self, username: str, id_type: str, results: dict):
         # Add username node, using normalized version directly if different
         norm_username = username.lower()
-        username_node_name = graph.add_node(id_type, norm_username)
+        username_node_name = self.add_node(id_type, norm_username)
 
         for website_name, dictionary in results.items():
             if not dictionary or dictionary.get("is_similar"):
@@ -141,89 +183,164 @@ def save_graph_report(filename: str, username_results: list, db: MaigretDatabase
             if not status or status.status != MaigretCheckStatus.CLAIMED:
                 continue
 
-            # base site node 
-            site_base_url = website_name
-            if site_base_url not in base_site_nodes:
-                base_site_nodes[site_base_url] = graph.add_node('site', site_base_url, color='#28a745')  # Green color
-
-            site_base_node_name = base_site_nodes[site_base_url]
+            # base site node
+            site_node_name = self.add_node('site', website_name, color='#28a745')
 
             # account node
-            account_url = dictionary.get('url_user', f'{site_base_url}/{norm_username}')
-            account_node_id = f"{site_base_url}: {account_url}"
-            if account_node_id not in site_account_nodes:
-                site_account_nodes[account_node_id] = graph.add_node('account', account_url)
-
-            account_node_name = site_account_nodes[account_node_id]
+            account_url = dictionary.get('url_user', f'{website_name}/{norm_username}')
+            account_node_name = self.add_node('account', account_url)
 
             # link username → account → site
-            graph.link(username_node_name, account_node_name)
-            graph.link(account_node_name, site_base_node_name)
+            self.link(username_node_name, account_node_name)
+            self.link(account_node_name, site_node_name)
 
-            def process_ids(parent_node, ids):
-                for k, v in ids.items():
-                    if k.endswith('_count') or k.startswith('is_') or k.endswith('_at') or k in 'image':
+            if status.ids_data:
+                self.add_ids(account_node_name, website_name, status.ids_data)
+
+    def add_ids(self, parent_node, site_name, ids):
+        for k, v in ids.items():
+            if (
+                k.endswith('_count')
+                or k.startswith('is_')
+                or k.endswith('_at')
+                or k in 'image'
+            ):
+                continue
+
+            # Normalize value if string
+            norm_v = v.lower() if isinstance(v, str) else v
+            value_key = f"{k}:{norm_v}"
+
+            ids_data_name = self.processed_values.get(value_key)
+            if ids_data_name is None:
+                v_data = v
+                if isinstance(v, str) and v.startswith('['):
+                    try:
+                        v_data = ast.literal_eval(v)
+                    except Exception as e:
+                        logging.error(e)
                         continue
 
-                    # Normalize value if string
-                    norm_v = v.lower() if isinstance(v, str) else v
-                    value_key = f"{k}:{norm_v}"
-                    
-                    if value_key in processed_values:
-                        ids_data_name = processed_values[value_key]
-                    else:
-                        v_data = v
-                        if isinstance(v, str) and v.startswith('['):
-                            try:
-                                v_data = ast.literal_eval(v)
-                            except Exception as e:
-                                logging.error(e)
-                                continue
-
-                        if isinstance(v_data, list):
-                            list_node_name = graph.add_node(k, site_base_url)
-                            processed_values[value_key] = list_node_name
-                            for vv in v_data:
-                                data_node_name = graph.add_node(vv, site_base_url)
-                                graph.link(list_node_name, data_node_name)
-
-                                add_ids = {a: b for b, a in db.extract_ids_from_url(vv).items()}
-                                if add_ids:
-                                    process_ids(data_node_name, add_ids)
-                            ids_data_name = list_node_name
-                        else:
-                            ids_data_name = graph.add_node(k, norm_v)
-                            processed_values[value_key] = ids_data_name
-
-                            if 'username' in k or k in SUPPORTED_IDS:
-                                new_username_key = f"username:{norm_v}"
-                                if new_username_key not in processed_values:
-                                    new_username_node_name = graph.add_node('username', norm_v)
-                                    processed_values[new_username_key] = new_username_node_name
-                                    graph.link(ids_data_name, new_username_node_name)
-
-                            add_ids = {k: v for v, k in db.extract_ids_from_url(v).items()}
-                            if add_ids:
-                                process_ids(ids_data_name, add_ids)
-
-                    graph.link(parent_node, ids_data_name)
+                if isinstance(v_data, list):
+                    ids_data_name = self.add_node(k, site_name)
+                    self.processed_values[value_key] = ids_data_name
+                    for vv in v_data:
+                        data_node_name = self.add_node(vv, site_name)
+                        self.link(ids_data_name, data_node_name)
+
+                        add_ids = self.get_url_ids(vv)
+                        if add_ids:
+                            self.add_ids(data_node_name, site_name, add_ids)
+                else:
+                    ids_data_name = self.add_node(k, norm_v)
+                    self.processed_values[value_key] = ids_data_name
+
+                    if 'username' in k or k in SUPPORTED_IDS:
+                        new_username_key = f"username:{norm_v}"
+                        if new_username_key not in self.processed_values:
+                            new_username_node_name = self.add_node('username', norm_v)
+                            self.processed_values[new_username_key] = (
+                                new_username_node_name
+                            )
+                            self.link(ids_data_name, new_username_node_name)
+
+                    add_ids = self.get_url_ids(v)
+                    if add_ids:
+                        self.add_ids(ids_data_name, site_name, add_ids)
+
+            self.link(parent_node, ids_data_name)
+
+    def get_degrees(self) -> Dict[str, int]:
+        degrees = {name: 0 for name in self.nodes}
+        for node1_name, node2_name in self.edges:
+            degrees[node1_name] += 1
+            degrees[node2_name] += 1
+        return degrees
+
+    def remove_nodes(self, names):
+        names = set(names)
+        for name in names:
+            self.nodes.pop(name, None)
+        self.edges = {
+            edge: weight
+            for edge, weight in self.edges.items()
+            if edge[0] not in names and edge[1] not in names
+        }
+
+    def prune(self, max_nodes: int = 0, max_name_length: int = 100):
+        """
+        Removes nodes useless for visualization: overly long ones, sites with
+        only one account and, if max_nodes is set, the least connected nodes
+        except usernames to keep the graph size limited.
+        """
+        self.remove_nodes(n for n in self.nodes if len(n) > max_name_length)
+
+        degrees = self.get_degrees()
+        self.remove_nodes(
+            n for n, deg in degrees.items() if n.startswith("site:") and deg <= 1
+        )
 
-            if status.ids_data:
-                process_ids(account_node_name, status.ids_data)
+        if not max_nodes or len(self.nodes) <= max_nodes:
+            return
 
-    # Remove overly long nodes
-    nodes_to_remove = [node for node in G.nodes if len(str(node)) > 100]
-    G.remove_nodes_from(nodes_to_remove)
+        degrees = self.get_degrees()
+        ranked = sorted(
+            self.nodes,
+            key=lambda n: (self.nodes[n]['group'] != 1, -degrees[n]),
+        )
+        self.remove_nodes(ranked[max_nodes:])
 
-    # Remove site nodes with only one connection
-    single_degree_sites = [n for n, deg in G.degree() if n.startswith("site:") and deg <= 1]
-    G.remove_nodes_from(single_degree_sites)
+    def to_networkx(self):
+        import networkx as nx
 
-    # Generate interactive visualization
-    from pyvis.network import Network
-    nt = Network(notebook=True, height="750px", width="100%")
-    nt.from_nx(G)
-    nt.show(filename)
+        G = nx.Graph()
+        G.add_nodes_from(self.nodes.items())
+        G.add_edges_from(
+            (node1_name, node2_name, {'weight': weight})
+            for (node1_name, node2_name), weight in self.edges.items()
+        )
+        return G
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        return {
+            "nodes": [{"id": name, **params} for name, params in self.nodes.items()],
+            "edges": [list(edge) for edge in self.edges],
+        }
+
+    def save(self, filename: str, report_format: str = "html"):
+        if report_format == "json":
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(self.json, f, ensure_ascii=False, separators=(",", ":"))
+            return
+
+        if report_format == "graphml":
+            import networkx as nx
+
+            nx.write_graphml(self.to_networkx(), filename)
+            return
+
+        # Generate interactive visualization
+        from pyvis.network import Network
+
+        nt = Network(notebook=True, height="750px", width="100%")
+        nt.from_nx(self.to_networkx())
+        nt.show(filename)
+
+
+def save_graph_report(
+    filename: str,
+    username_results: list,
+    db: MaigretDatabase,
+    report_format: str = "html",
+    max_nodes: int = 0,
+):
+    graph = MaigretGraph(db)
+    for username, id_type, results in username_results:
+        graph.add_results(username, id_type, results)
+
+    graph.prune(max_nodes=max_nodes)
+    graph.save(filename, report_format)
 
 
 def get_plaintext_report(context: dict) -> str:
@@ -402,71 +519,160 @@ def generate_report_context(username_results: list):
 
 
 def generate_csv_report(username: str, results: dict, csvfile):
-    writer = csv.writer(csvfile)
-    writer.writerow(
-        ["username", "name", "url_main", "url_user", "exists", "http_status"]
-    )
+    writer = CSVReportWriter(username, csvfile)
     for site in results:
+        writer.write(site, results[site])
+    writer.close()
+
+
+def generate_txt_report(username: str, results: dict, file):
+    writer = TXTReportWriter(username, file)
+    for website_name in results:
+        writer.write(website_name, results[website_name])
+    writer.close()
+
+
+def get_json_report_data(site_result: QueryResultWrapper):
+    # TODO: fix no site data issue
+    if not site_result or not site_result.get("status"):
+        return None
+
+    if site_result["status"].status != MaigretCheckStatus.CLAIMED:
+        return None
+
+    data = dict(site_result)
+    data["status"] = data["status"].json()
+    data["site"] = data["site"].json
+    for field in ["future", "checker", "markers", "timings"]:
+        if field in data:
+            del data[field]
+
+    return data
+
+
+def generate_json_report(username: str, results: dict, file, report_type):
+    is_report_per_line = report_type.startswith("ndjson")
+
+    if is_report_per_line:
+        writer = NDJSONReportWriter(username, file)
+        for sitename in results:
+            writer.write(sitename, results[sitename])
+        writer.close()
+        return
+
+    all_json = {}
+    for sitename in results:
+        data = get_json_report_data(results[sitename])
+        if data is not None:
+            all_json[sitename] = data
+
+    file.write(json.dumps(all_json))
+
+
+"""
+STREAMING REPORTS
+"""
+
+
+class CSVReportWriter:
+    """
+    Writes CSV report rows one by one as soon as check results are received
+    """
+
+    def __init__(self, username: str, file):
+        self.username = username
+        self.writer = csv.writer(file)
+        self.writer.writerow(
+            ["username", "name", "url_main", "url_user", "exists", "http_status"]
+        )
+
+    def write(self, sitename: str, result: QueryResultWrapper):
         # TODO: fix the reason
         status = 'Unknown'
-        if "status" in results[site]:
-            status = str(results[site]["status"].status)
-        writer.writerow(
+        if "status" in result:
+            status = str(result["status"].status)
+        self.writer.writerow(
             [
-                username,
-                site,
-                results[site].get("url_main", ""),
-                results[site].get("url_user", ""),
+                self.username,
+                sitename,
+                result.get("url_main", ""),
+                result.get("url_user", ""),
                 status,
-                results[site].get("http_status", 0),
+                result.get("http_status", 0),
             ]
         )
 
+    def close(self):
+        pass
 
-def generate_txt_report(username: str, results: dict, file):
-    exists_counter = 0
-    for website_name in results:
-        dictionary = results[website_name]
+
+class TXTReportWriter:
+    """
+    Writes URLs of found accounts one by one, and the total count at the end
+    """
+
+    def __init__(self, username: str, file):
+        self.username = username
+        self.file = file
+        self.exists_counter = 0
+
+    def write(self, sitename: str, result: QueryResultWrapper):
         # TODO: fix no site data issue
-        if not dictionary:
-            continue
+        if not result:
+            return
         if (
-            dictionary.get("status")
-            and dictionary["status"].status == MaigretCheckStatus.CLAIMED
+            result.get("status")
+            and result["status"].status == MaigretCheckStatus.CLAIMED
         ):
-            exists_counter += 1
-            file.write(dictionary["url_user"] + "\n")
-    file.write(f"Total Websites Username Detected On : {exists_counter}")
+            self.exists_counter += 1
+            self.file.write(result["url_user"] + "\n")
 
+    def close(self):
+        self.file.write(f"Total Websites Username Detected On : {self.exists_counter}")
 
-def generate_json_report(username: str, results: dict, file, report_type):
-    is_report_per_line = report_type.startswith("ndjson")
-    all_json = {}
 
-    for sitename in results:
-        site_result = results[sitename]
-        # TODO: fix no site data issue
-        if not site_result or not site_result.get("status"):
-            continue
+class NDJSONReportWriter:
+    """
+    Writes found accounts one per line as soon as check results are received
+    """
 
-        if site_result["status"].status != MaigretCheckStatus.CLAIMED:
-            continue
+    def __init__(self, username: str, file):
+        self.username = username
+        self.file = file
 
-        data = dict(site_result)
-        data["status"] = data["status"].json()
-        data["site"] = data["site"].json
-        for field in ["future", "checker"]:
-            if field in data:
-                del data[field]
+    def write(self, sitename: str, result: QueryResultWrapper):
+        data = get_json_report_data(result)
+        if data is None:
+            return
+        data["sitename"] = sitename
+        self.file.write(json.dumps(data) + "\n")
 
-        if is_report_per_line:
-            data["sitename"] = sitename
-            file.write(json.dumps(data) + "\n")
-        else:
-            all_json[sitename] = data
+    def close(self):
+        pass
 
-    if not is_report_per_line:
-        file.write(json.dumps(all_json))
+
+async def write_reports_stream(
+    results: AsyncIterator[Tuple[str, QueryResultWrapper]], writers: List[Any]
+) -> AsyncIterator[Tuple[str, QueryResultWrapper]]:
+    """
+    Writes results of a streaming search (see maigret_stream) to reports
+    and passes them through to the caller
+
+    Usage:
+        with open("report.csv", "w", newline="") as csvfile:
+            writers = [CSVReportWriter(username, csvfile)]
+            results = maigret.stream(username, site_dict, logger)
+            async for sitename, result in write_reports_stream(results, writers):
+                ...
+    """
+    try:
+        async for sitename, result in results:
+            for writer in writers:
+                writer.write(sitename, result)
+            yield sitename, result
+    finally:
+        for writer in writers:
+            writer.close()
 
 
 """
@@ -548,3 +754,123 @@ def design_xmind_sheet(sheet, username, results):
         for k, v in filtered_supposed_data.items():
             currentsublabel = undefinedsection.addSubTopic()
             currentsublabel.setTitle("%s: %s" % (k, v))
+
+
+"""
+REPORTS PIPELINE
+"""
+
+
+# arguments of the functions after the filename are in comments
+REPORT_SAVERS = {
+    "csv": save_csv_report,  # username, results
+    "txt": save_txt_report,  # username, results
+    "json": save_json_report,  # username, results, report_type
+    "xmind": save_xmind_report,  # username, results
+    "html": save_html_report,  # context
+    "pdf": save_pdf_report,  # context
+    "graph": save_graph_report,  # username_results, db, report_format, max_nodes
+}
+
+
+# report type, filename and arguments of the saving function
+ReportTask = Tuple[str, str, tuple]
+
+
+def save_report(report_type: str, filename: str, *args) -> str:
+    REPORT_SAVERS[report_type](filename, *args)
+    return filename
+
+
+def save_reports(
+    tasks: List[ReportTask], max_workers: Optional[int] = None
+) -> Iterator[Tuple[str, str, Optional[BaseException]]]:
+    """
+    Saves reports concurrently in a pool of processes, yields the type,
+    the filename and the error of every report in order of completion.
+
+    Keyword Arguments:
+    tasks                  -- Reports to save, arguments are pickled, so the
+                              report context should be generated once and
+                              passed to all the reports using it.
+    max_workers            -- Count of processes, by default the count of
+                              CPUs; with one worker or one task reports are
+                              saved in the current process.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(tasks))
+
+    if max_workers <= 1:
+        for report_type, filename, args in tasks:
+            try:
+                save_report(report_type, filename, *args)
+                yield report_type, filename, None
+            except Exception as e:
+                yield report_type, filename, e
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=get_context(REPORTS_START_METHOD)
+    ) as executor:
+        futures = {
+            executor.submit(save_report, report_type, filename, *args): (
+                report_type,
+                filename,
+            )
+            for report_type, filename, args in tasks
+        }
+        for future in as_completed(futures):
+            report_type, filename = futures[future]
+            yield report_type, filename, future.exception()
+
+
+# fields of the results of sites used by the reports
+RESULTS_DATA_FIELDS = ("url_main", "url_user", "is_similar", "ids_usernames")
+
+
+def save_results_data(filename: str, username_results: list):
+    """
+    Saves the data of the results needed to generate the reports later,
+    as JSON to not load executable data from the disk.
+    """
+    data = []
+    for username, id_type, results in username_results:
+        sites = {}
+        for site_name, site_result in results.items():
+            if not site_result or not site_result.get("status"):
+                continue
+            site_data = {
+                k: site_result[k] for k in RESULTS_DATA_FIELDS if k in site_result
+            }
+            site_data["status"] = site_result["status"].json()
+            sites[site_name] = site_data
+        data.append({"username": username, "id_type": id_type, "results": sites})
+
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+
+
+def load_results_data(filename: str) -> list:
+    """Loads the results saved by save_results_data"""
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    username_results = []
+    for item in data:
+        results = {}
+        for site_name, site_data in item["results"].items():
+            status = site_data.pop("status")
+            results[site_name] = MaigretSiteResult(
+                site_data,
+                status=MaigretCheckResult(
+                    status["username"],
+                    status["site_name"],
+                    status["url"],
+                    MaigretCheckStatus(status["status"]),
+                    ids_data=status["ids"] or None,
+                    tags=status["tags"],
+                ),
+            )
+        username_results.append((item["username"], item["id_type"], results))
+    return username_results
@@ -3,6 +3,7 @@
 This module defines various objects for recording the results of queries.
 """
 
+from collections.abc import MutableMapping
 from enum import Enum
 
 
@@ -34,6 +35,19 @@ class MaigretCheckResult:
     Describes result of checking a given username on a given site
     """
 
+    # results are kept for every site and username, so no __dict__ per object
+    __slots__ = (
+        "username",
+        "site_name",
+        "site_url_user",
+        "status",
+        "query_time",
+        "context",
+        "ids_data",
+        "tags",
+        "error",
+    )
+
     def __init__(
         self,
         username,
@@ -44,7 +58,7 @@ class MaigretCheckResult:
         query_time=None,
         context=None,
         error=None,
-        tags=[],
+        tags=None,
     ):
         """
         Keyword Arguments:
@@ -79,7 +93,7 @@ class MaigretCheckResult:
         self.query_time = query_time
         self.context = context
         self.ids_data = ids_data
-        self.tags = tags
+        self.tags = tags if tags is not None else []
         self.error = error
 
     def json(self):
@@ -114,3 +128,89 @@ class MaigretCheckResult:
             status += f" ({self.context})"
 
         return status
+
+
+class MaigretSiteResult(MutableMapping):
+    """
+    Compact dict-like record of checking a username on a site,
+    see make_site_result in checking.py.
+
+    Known fields are stored in slots, unset fields are missing keys;
+    other keys are stored in a separate dict created on demand.
+    """
+
+    __slots__ = (
+        "site",
+        "username",
+        "parsing_enabled",
+        "url_main",
+        "cookies",
+        "url_user",
+        "status",
+        "http_status",
+        "is_similar",
+        "rank",
+        "response_text",
+        "ids_usernames",
+        "ids_links",
+        "future",
+        "checker",
+        "markers",
+        "timings",
+        "_extra",
+    )
+    _FIELDS = frozenset(__slots__[:-1])
+    # objects of the request in progress, they are not pickled with the result
+    _RUNTIME_FIELDS = frozenset(("future", "checker", "markers"))
+
+    def __init__(self, *args, **kwargs):
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self._FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        try:
+            return self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDS:
+            setattr(self, key, value)
+            return
+        try:
+            self._extra[key] = value
+        except AttributeError:
+            self._extra = {key: value}
+
+    def __delitem__(self, key):
+        if key in self._FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        try:
+            del self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self.__slots__[:-1]:
+            if hasattr(self, key):
+                yield key
+        yield from getattr(self, "_extra", {})
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+    def __reduce__(self):
+        # results are pickled to render reports in other processes
+        data = {k: v for k, v in self.items() if k not in self._RUNTIME_FIELDS}
+        return (self.__class__, (data,))
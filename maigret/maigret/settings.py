@@ -16,6 +16,11 @@ class Settings:
     sites_db_path: str
     timeout: int
     max_connections: int
+    max_connections_per_host: int
+    max_connections_per_engine: int
+    max_response_size: int
+    results_cache: bool
+    results_cache_ttl: int
     recursive_search: bool
     info_extracting: bool
     cookie_jar_file: str
@@ -36,12 +41,15 @@ class Settings:
     show_progressbar: bool
     report_sorting: str
     json_report_type: str
+    timings_report_type: str
     txt_report: bool
     csv_report: bool
     xmind_report: bool
     pdf_report: bool
     html_report: bool
     graph_report: bool
+    graph_report_format: str
+    graph_max_nodes: int
     web_interface_port: int
 
     # submit mode settings
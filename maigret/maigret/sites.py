@@ -2,17 +2,20 @@
 """Maigret Sites Information"""
 import copy
 import json
+import os
 import sys
 from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse
 
 from .utils import CaseConverter, URLMatcher, is_country_tag
 
 
 class MaigretEngine:
-    site: Dict[str, Any] = {}
+    site: Dict[str, Any]
 
     def __init__(self, name, data):
         self.name = name
+        self.site = {}
         self.__dict__.update(data)
 
     @property
@@ -32,6 +35,20 @@ class MaigretSite:
         "urlRegexp",
     ]
 
+    # Fields with mutable values, every site gets its own empty default values
+    # instead of class-level ones shared between all the sites
+    MUTABLE_FIELDS = {
+        "tags": list,
+        "headers": dict,
+        "errors": dict,
+        "activation": dict,
+        "get_params": dict,
+        "presense_strs": list,
+        "absence_strs": list,
+        "stats": dict,
+        "engine_data": dict,
+    }
+
     # Username known to exist on the site
     username_claimed = ""
     # Username known to not exist on the site
@@ -49,16 +66,16 @@ class MaigretSite:
     # Whether to ignore 403 status codes
     ignore403 = False
     # Site category tags
-    tags: List[str] = []
+    tags: List[str]
 
     # Type of identifier (username, gaia_id etc); see SUPPORTED_IDS in checking.py
     type = "username"
     # Custom HTTP headers
-    headers: Dict[str, str] = {}
+    headers: Dict[str, str]
     # Error message substrings
-    errors: Dict[str, str] = {}
+    errors: Dict[str, str]
     # Site activation requirements
-    activation: Dict[str, Any] = {}
+    activation: Dict[str, Any]
     # Regular expression for username validation
     regex_check = None
     # URL to probe site status
@@ -68,19 +85,19 @@ class MaigretSite:
     # Whether to only send HEAD requests (GET by default)
     request_head_only = ""
     # GET parameters to include in requests
-    get_params: Dict[str, Any] = {}
+    get_params: Dict[str, Any]
 
     # Substrings in HTML response that indicate profile exists
-    presense_strs: List[str] = []
+    presense_strs: List[str]
     # Substrings in HTML response that indicate profile doesn't exist
-    absence_strs: List[str] = []
+    absence_strs: List[str]
     # Site statistics
-    stats: Dict[str, Any] = {}
+    stats: Dict[str, Any]
 
     # Site engine name
     engine = None
     # Engine-specific configuration
-    engine_data: Dict[str, Any] = {}
+    engine_data: Dict[str, Any]
     # Engine instance
     engine_obj: Optional["MaigretEngine"] = None
     # Future for async requests
@@ -100,6 +117,11 @@ class MaigretSite:
         for k, v in information.items():
             self.__dict__[CaseConverter.camel_to_snake(k)] = v
 
+        # after the json fields to keep their order in the saved db
+        for field, default_factory in self.MUTABLE_FIELDS.items():
+            if field not in self.__dict__:
+                self.__dict__[field] = default_factory()
+
         if (self.alexa_rank is None) or (self.alexa_rank == 0):
             # We do not know the popularity, so make site go to bottom of list.
             self.alexa_rank = sys.maxsize
@@ -157,17 +179,42 @@ class MaigretSite:
             return self.__is_equal_by_url_or_name(other)
         return False
 
-    def update_detectors(self):
-        if "url" in self.__dict__:
-            url = self.url
-            for group in ["urlMain", "urlSubpath"]:
-                if group in url:
-                    url = url.replace(
-                        "{" + group + "}",
-                        self.__dict__[CaseConverter.camel_to_snake(group)],
-                    )
+    def get_profile_url_template(self) -> str:
+        """
+        Returns profile url with substituted urlMain and urlSubpath,
+        e.g. https://example.com/forum/users/{username}
+        """
+        if "url" not in self.__dict__:
+            return ""
+
+        url = self.url
+        for group in ["urlMain", "urlSubpath"]:
+            if group in url:
+                url = url.replace(
+                    "{" + group + "}",
+                    self.__dict__[CaseConverter.camel_to_snake(group)],
+                )
+        return url
 
-            self.url_regexp = URLMatcher.make_profile_url_regexp(url, self.regex_check)
+    @property
+    def url_regexp(self):
+        # compiled on first use: regexps compilation takes most of the db loading
+        # time, and only a few sites are matched against urls during a search
+        if "_url_regexp" not in self.__dict__:
+            url_regexp = None
+            if "url" in self.__dict__:
+                url = self.get_profile_url_template()
+                url_regexp = URLMatcher.make_profile_url_regexp(url, self.regex_check)
+            self.__dict__["_url_regexp"] = url_regexp
+
+        return self.__dict__["_url_regexp"]
+
+    @url_regexp.setter
+    def url_regexp(self, value):
+        self.__dict__["_url_regexp"] = value
+
+    def update_detectors(self):
+        self.__dict__.pop("_url_regexp", None)
 
     def detect_username(self, url: str) -> Optional[str]:
         if self.url_regexp:
@@ -263,7 +310,7 @@ class MaigretSite:
             return self
 
         self.request_future = None
-        self.url_regexp = None
+        self.update_detectors()
 
         self_copy = copy.deepcopy(self)
         engine_data = self_copy.engine_obj and self_copy.engine_obj.site or {}
@@ -289,6 +336,41 @@ class MaigretSite:
 
         return self_copy
 
+    def copy(self) -> "MaigretSite":
+        """
+        Returns a copy of the site to change it during a scan, top-level
+        lists and dicts (tags, stats, errors, etc.) are copied too
+        """
+        site_copy = copy.copy(self)
+        for k, v in self.__dict__.items():
+            if isinstance(v, (list, dict)):
+                site_copy.__dict__[k] = copy.copy(v)
+
+        return site_copy
+
+
+def get_url_hosts(url: str) -> List[str]:
+    """
+    Returns host keys of a profile url (or url template) for the database
+    domain index, e.g. ["example.com"] for https://www.example.com/{username}
+    """
+    hosts = []
+
+    # the same way as site url regexps are made, see URLMatcher
+    main_part = URLMatcher.extract_main_part(url)
+    if main_part:
+        hosts.append(main_part.split("/")[0].lower())
+
+    host = urlparse(url).netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+            break
+    if host and host not in hosts:
+        hosts.append(host)
+
+    return hosts
+
 
 class MaigretDatabase:
     def __init__(self):
@@ -296,15 +378,48 @@ class MaigretDatabase:
         self._sites: list = []
         self._engines: list = []
 
+        # indexes, updated incrementally by update_site / update_engine
+        self._sites_by_name: Dict[str, MaigretSite] = {}
+        self._sites_by_lower_name: Dict[str, MaigretSite] = {}
+        self._sites_positions: Dict[str, int] = {}
+        self._engines_by_name: Dict[str, MaigretEngine] = {}
+        self._sites_by_tag: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_engine: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_domain: Dict[str, Dict[str, MaigretSite]] = {}
+        # sites with templated hosts, e.g. https://{username}.example.com
+        self._sites_without_domain: Dict[str, MaigretSite] = {}
+        # index keys of every site to remove it from indexes after changes
+        self._sites_index_keys: Dict[str, Tuple[List[str], Any, List[str]]] = {}
+
     @property
     def sites(self):
         return self._sites
 
     @property
     def sites_dict(self):
-        return {site.name: site for site in self._sites}
+        return self._sites_by_name
+
+    def get_site(self, name: str) -> Optional[MaigretSite]:
+        return self._sites_by_name.get(name)
+
+    def get_sites_by_tag(self, tag: str) -> List[MaigretSite]:
+        return list(self._sites_by_tag.get(tag, {}).values())
+
+    def get_sites_by_engine(self, engine: str) -> List[MaigretSite]:
+        return list(self._sites_by_engine.get(engine, {}).values())
+
+    def get_sites_by_domain(self, domain: str) -> List[MaigretSite]:
+        return list(self._sites_by_domain.get(domain.lower(), {}).values())
 
     def has_site(self, site: MaigretSite):
+        if isinstance(site, MaigretSite):
+            indexed_site = self._sites_by_name.get(site.name)
+            return indexed_site is not None and site == indexed_site
+
+        if isinstance(site, str) and site.lower() in self._sites_by_lower_name:
+            return True
+
+        # partial url matching, see MaigretSite.__eq__
         for s in self._sites:
             if site == s:
                 return True
@@ -379,17 +494,104 @@ class MaigretDatabase:
 
     @property
     def engines_dict(self):
-        return {engine.name: engine for engine in self._engines}
+        return self._engines_by_name
+
+    def _index_site(self, site: MaigretSite):
+        tags = list(site.tags)
+        engine = site.engine
+        url = site.get_profile_url_template()
+        hosts = get_url_hosts(url) if url else []
+        if any("{" in host for host in hosts):
+            hosts = []
+
+        for tag in tags:
+            self._sites_by_tag.setdefault(tag, {})[site.name] = site
+        if engine:
+            self._sites_by_engine.setdefault(engine, {})[site.name] = site
+        for host in hosts:
+            self._sites_by_domain.setdefault(host, {})[site.name] = site
+        if url and not hosts:
+            self._sites_without_domain[site.name] = site
+
+        self._sites_by_name[site.name] = site
+        self._sites_by_lower_name.setdefault(site.name.lower(), site)
+        self._sites_index_keys[site.name] = (tags, engine, hosts)
+
+    def _unindex_site(self, name: str):
+        tags, engine, hosts = self._sites_index_keys.pop(name)
+
+        for index, keys in (
+            (self._sites_by_tag, tags),
+            (self._sites_by_engine, [engine] if engine else []),
+            (self._sites_by_domain, hosts),
+        ):
+            for key in keys:
+                index[key].pop(name, None)
+                if not index[key]:
+                    del index[key]
+        self._sites_without_domain.pop(name, None)
+
+        site = self._sites_by_name.pop(name)
+        if self._sites_by_lower_name.get(name.lower()) is site:
+            del self._sites_by_lower_name[name.lower()]
 
     def update_site(self, site: MaigretSite) -> "MaigretDatabase":
-        for s in self._sites:
-            if s.name == site.name:
-                s = site
-                return self
+        """
+        Adds a new site or replaces the site with the same name,
+        indexes are updated for the changed site only
+        """
+        if site.name in self._sites_by_name:
+            self._unindex_site(site.name)
+            self._sites[self._sites_positions[site.name]] = site
+        else:
+            self._sites_positions[site.name] = len(self._sites)
+            self._sites.append(site)
+
+        self._index_site(site)
+        return self
+
+    def update_engine(self, engine: MaigretEngine) -> "MaigretDatabase":
+        if engine.name in self._engines_by_name:
+            position = self._engines.index(self._engines_by_name[engine.name])
+            self._engines[position] = engine
+        else:
+            self._engines.append(engine)
 
-        self._sites.append(site)
+        self._engines_by_name[engine.name] = engine
         return self
 
+    def copy(self) -> "MaigretDatabase":
+        """
+        Returns a copy of the database with copies of all the sites,
+        which can be safely changed during a scan; engines are shared
+        """
+        db = MaigretDatabase()
+        db._tags = list(self._tags)
+        db._engines = list(self._engines)
+        db._engines_by_name = dict(self._engines_by_name)
+
+        # indexes are copied as is instead of reindexing of all the sites
+        sites = {name: site.copy() for name, site in self._sites_by_name.items()}
+        db._sites = [sites[site.name] for site in self._sites]
+        db._sites_by_name = sites
+        db._sites_by_lower_name = {
+            name: sites[site.name] for name, site in self._sites_by_lower_name.items()
+        }
+        db._sites_positions = dict(self._sites_positions)
+        db._sites_index_keys = dict(self._sites_index_keys)
+        db._sites_without_domain = {
+            name: sites[name] for name in self._sites_without_domain
+        }
+        for index, index_copy in (
+            (self._sites_by_tag, db._sites_by_tag),
+            (self._sites_by_engine, db._sites_by_engine),
+            (self._sites_by_domain, db._sites_by_domain),
+        ):
+            for key, names in index.items():
+                index_copy[key] = {name: sites[name] for name in names}
+
+        return db
+
     def save_to_file(self, filename: str) -> "MaigretDatabase":
         if '://' in filename:
             return self
@@ -416,7 +618,7 @@ class MaigretDatabase:
         self._tags += tags
 
         for engine_name in engines_data:
-            self._engines.append(MaigretEngine(engine_name, engines_data[engine_name]))
+            self.update_engine(MaigretEngine(engine_name, engines_data[engine_name]))
 
         for site_name in site_data:
             try:
@@ -424,9 +626,9 @@ class MaigretDatabase:
 
                 engine = site_data[site_name].get("engine")
                 if engine:
-                    maigret_site.update_from_engine(self.engines_dict[engine])
+                    maigret_site.update_from_engine(self._engines_by_name[engine])
 
-                self._sites.append(maigret_site)
+                self.update_site(maigret_site)
             except KeyError as error:
                 raise ValueError(
                     f"Problem parsing json content for site {site_name}: "
@@ -510,9 +712,21 @@ class MaigretDatabase:
 
         return found_flags
 
+    def get_url_candidate_sites(self, url: str) -> List[MaigretSite]:
+        """
+        Returns sites which profile url regexps could match the url:
+        sites of the same domain and sites with templated hosts
+        """
+        candidates: Dict[str, MaigretSite] = {}
+        for host in get_url_hosts(url):
+            candidates.update(self._sites_by_domain.get(host, {}))
+        candidates.update(self._sites_without_domain)
+
+        return list(candidates.values())
+
     def extract_ids_from_url(self, url: str) -> dict:
         results = {}
-        for s in self._sites:
+        for s in self.get_url_candidate_sites(url):
             result = s.extract_id_from_url(url)
             if not result:
                 continue
@@ -609,3 +823,39 @@ class MaigretDatabase:
                 else f"{count}\t{item}{mark}\n"
             )
         return output
+
+
+# parsed databases by file path: (file state, database)
+_loaded_databases: Dict[str, Tuple[Tuple[int, int, int], MaigretDatabase]] = {}
+
+
+def load_database(path: str, use_cache: bool = True) -> MaigretDatabase:
+    """
+    Loads the sites database from a file or url.
+
+    Parsed db files are kept in memory until the file changes (its size
+    or modification time), there is no on-disk cache to not load executable
+    data, e.g. pickles, from a writable directory.
+
+    Every call returns a separate copy of the database, see MaigretDatabase.copy:
+    sites are changed during scans (stats, disabled state, etc.), so instead of
+    a copy-on-write of every site attribute all the sites are copied shallowly,
+    which is still much faster than parsing the JSON and making sites again.
+    """
+    if not use_cache or '://' in path:
+        return MaigretDatabase().load_from_path(path)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError as error:
+        raise FileNotFoundError(
+            f"Problem while attempting to access " f"data file '{path}'."
+        ) from error
+
+    key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    loaded_key, db = _loaded_databases.get(path, (None, None))
+    if db is None or loaded_key != key:
+        db = MaigretDatabase().load_from_file(path)
+        _loaded_databases[path] = (key, db)
+
+    return db.copy()
@@ -3,6 +3,7 @@ import json
 import re
 import os
 import logging
+from collections import Counter
 from typing import Any, Dict, List, Optional, Tuple
 
 from aiohttp import ClientSession, TCPConnector
@@ -47,9 +48,12 @@ class Submitter:
     }
 
     SEPARATORS = "\"'\n"
+    TOKENS_RE = re.compile(f'[{SEPARATORS}]')
 
     RATIO = 0.6
     TOP_FEATURES = 5
+    # pages of random usernames to compare, features must be stable on all
+    UNCLAIMED_PAGES_COUNT = 2
     URL_RE = re.compile(r"https?://(www\.)?")
 
     def __init__(self, db: MaigretDatabase, settings: Settings, logger, args):
@@ -57,6 +61,8 @@ class Submitter:
         self.args = args
         self.db = db
         self.logger = logger
+        # pages fetched by the engine detection to reuse in the features check
+        self.pages_cache: Dict[Tuple[str, bool], Tuple[str, int]] = {}
 
         from aiohttp_socks import ProxyConnector
 
@@ -130,9 +136,10 @@ class Submitter:
     ) -> [List[MaigretSite], str]:
 
         session = session or self.session
-        resp_text, _ = await self.get_html_response_to_compare(
+        resp_text, status = await self.get_html_response_to_compare(
             url_exists, session, follow_redirects, headers
         )
+        self.pages_cache = {(url_exists, follow_redirects): (resp_text, status)}
 
         for engine in self.db.engines:
             strs_to_check = engine.__dict__.get("presenseStrs")
@@ -206,6 +213,102 @@ class Submitter:
                     html_response = await response.text(errors='ignore')
             return html_response, response.status
 
+    async def get_html_responses_to_compare(
+        self,
+        urls: List[str],
+        session: ClientSession = None,
+        redirects=False,
+        headers: Dict = None,
+    ) -> List[Tuple[str, int]]:
+        """
+        Fetches pages concurrently, pages fetched by the engine detection
+        are taken from the cache.
+        """
+
+        async def get_response(url):
+            cache_key = (url, redirects)
+            if cache_key in self.pages_cache:
+                return self.pages_cache.pop(cache_key)
+            return await self.get_html_response_to_compare(
+                url, session, redirects, headers
+            )
+
+        return list(await asyncio.gather(*map(get_response, urls)))
+
+    @classmethod
+    def get_tokens(cls, html: str) -> Counter:
+        """Counts tokens of the page split by separators, unescaped"""
+        return Counter(t.strip('\\') for t in cls.TOKENS_RE.split(html))
+
+    @staticmethod
+    def is_feature_token(token: str, other_html: str) -> bool:
+        is_in_html = token in other_html
+        is_long_str = len(token) >= 50
+        is_number = re.match(r'^\d\.?\d+$', token) or re.match(r':^\d+$', token)
+        is_whitelisted_number = token in ['200', '404', '403']
+
+        return not (
+            is_in_html or is_long_str or (is_number and not is_whitelisted_number)
+        )
+
+    @classmethod
+    def get_features_diff(
+        cls,
+        claimed_html: str,
+        unclaimed_htmls: List[str],
+        username: str,
+        random_usernames: List[str],
+        presence_strings: List[str],
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Diffs token sets of the page of the existing account and pages of the
+        non-existing accounts. Returns the top presence and absence features:
+
+        - presence features are found only on the page of the existing account,
+          the more times they are found the better;
+        - absence features are found on pages of non-existing accounts only,
+          the more of these pages contain them the better.
+
+        Features most similar to the known presence strings go first.
+        """
+        claimed_tokens = cls.get_tokens(claimed_html)
+        unclaimed_tokens = [cls.get_tokens(html) for html in unclaimed_htmls]
+
+        # count of pages of non-existing accounts with the token
+        unclaimed_frequency: Counter = Counter()
+        for tokens in unclaimed_tokens:
+            unclaimed_frequency.update(tokens.keys())
+
+        presence = {
+            t: n
+            for t, n in claimed_tokens.items()
+            if t not in unclaimed_frequency and username.lower() not in t.lower()
+        }
+        absence = {
+            t: n
+            for t, n in unclaimed_frequency.items()
+            if t not in claimed_tokens
+            and not any(u.lower() in t.lower() for u in random_usernames)
+        }
+
+        presence = {
+            t: n
+            for t, n in presence.items()
+            if all(cls.is_feature_token(t, html) for html in unclaimed_htmls)
+        }
+        absence = {
+            t: n for t, n in absence.items() if cls.is_feature_token(t, claimed_html)
+        }
+
+        match_fun = get_match_ratio(presence_strings)
+
+        def get_top(features: Dict[str, int]) -> List[str]:
+            return sorted(
+                features, key=lambda t: (match_fun(t), features[t]), reverse=True
+            )[: cls.TOP_FEATURES]
+
+        return get_top(presence), get_top(absence)
+
     async def check_features_manually(
         self,
         username: str,
@@ -216,20 +319,21 @@ class Submitter:
         headers: dict = None,
     ) -> Tuple[List[str], List[str], str, str]:
 
-        random_username = generate_random_username()
-        url_of_non_existing_account = url_exists.lower().replace(
-            username.lower(), random_username
-        )
+        random_usernames = [
+            generate_random_username() for _ in range(self.UNCLAIMED_PAGES_COUNT)
+        ]
+        random_username = random_usernames[0]
+        urls_of_non_existing_accounts = [
+            url_exists.lower().replace(username.lower(), u) for u in random_usernames
+        ]
 
         try:
             session = session or self.session
-            first_html_response, first_status = await self.get_html_response_to_compare(
-                url_exists, session, follow_redirects, headers
-            )
-            second_html_response, second_status = (
-                await self.get_html_response_to_compare(
-                    url_of_non_existing_account, session, follow_redirects, headers
-                )
+            responses = await self.get_html_responses_to_compare(
+                [url_exists] + urls_of_non_existing_accounts,
+                session,
+                follow_redirects,
+                headers,
             )
             await session.close()
         except Exception as e:
@@ -239,6 +343,7 @@ class Submitter:
             )
             return None, None, str(e), random_username
 
+        first_html_response, first_status = responses[0]
         self.logger.info(f"URL with existing account: {url_exists}")
         self.logger.info(
             f"HTTP response status for URL with existing account: {first_status}"
@@ -248,14 +353,17 @@ class Submitter:
         )
         self.logger.debug(first_html_response)
 
-        self.logger.info(f"URL with existing account: {url_of_non_existing_account}")
-        self.logger.info(
-            f"HTTP response status for URL with non-existing account: {second_status}"
-        )
-        self.logger.info(
-            f"HTTP response length URL with non-existing account: {len(second_html_response)}"
-        )
-        self.logger.debug(second_html_response)
+        for url, (html_response, status) in zip(
+            urls_of_non_existing_accounts, responses[1:]
+        ):
+            self.logger.info(f"URL with non-existing account: {url}")
+            self.logger.info(
+                f"HTTP response status for URL with non-existing account: {status}"
+            )
+            self.logger.info(
+                f"HTTP response length URL with non-existing account: {len(html_response)}"
+            )
+            self.logger.debug(html_response)
 
         # TODO: filter by errors, move to dialog function
         if (
@@ -266,37 +374,15 @@ class Submitter:
             self.logger.info("Cloudflare detected, skipping")
             return None, None, "Cloudflare detected, skipping", random_username
 
-        tokens_a = set(re.split(f'[{self.SEPARATORS}]', first_html_response))
-        tokens_b = set(re.split(f'[{self.SEPARATORS}]', second_html_response))
-
-        a_minus_b = tokens_a.difference(tokens_b)
-        b_minus_a = tokens_b.difference(tokens_a)
-
-        a_minus_b = list(map(lambda x: x.strip('\\'), a_minus_b))
-        b_minus_a = list(map(lambda x: x.strip('\\'), b_minus_a))
-
-        # Filter out strings containing usernames
-        a_minus_b = [s for s in a_minus_b if username.lower() not in s.lower()]
-        b_minus_a = [s for s in b_minus_a if random_username.lower() not in s.lower()]
-
-        def filter_tokens(token: str, html_response: str) -> bool:
-            is_in_html = token in html_response
-            is_long_str = len(token) >= 50
-            is_number = re.match(r'^\d\.?\d+$', token) or re.match(r':^\d+$', token)
-            is_whitelisted_number = token in ['200', '404', '403']
-
-            return not (
-                is_in_html or is_long_str or (is_number and not is_whitelisted_number)
-            )
-
-        a_minus_b = list(
-            filter(lambda t: filter_tokens(t, second_html_response), a_minus_b)
-        )
-        b_minus_a = list(
-            filter(lambda t: filter_tokens(t, first_html_response), b_minus_a)
+        presence_list, absence_list = self.get_features_diff(
+            first_html_response,
+            [html for html, _ in responses[1:]],
+            username,
+            random_usernames,
+            self.settings.presence_strings,
         )
 
-        if len(a_minus_b) == len(b_minus_a) == 0:
+        if not presence_list and not absence_list:
             return (
                 None,
                 None,
@@ -304,15 +390,6 @@ class Submitter:
                 random_username,
             )
 
-        match_fun = get_match_ratio(self.settings.presence_strings)
-
-        presence_list = sorted(a_minus_b, key=match_fun, reverse=True)[
-            : self.TOP_FEATURES
-        ]
-        absence_list = sorted(b_minus_a, key=match_fun, reverse=True)[
-            : self.TOP_FEATURES
-        ]
-
         self.logger.info(f"Detected presence features: {presence_list}")
         self.logger.info(f"Detected absence features: {absence_list}")
 
@@ -0,0 +1,240 @@
+"""Maigret Timings Module
+
+This module measures phases of site checks requests with aiohttp tracing
+and aggregates the timings of a scan into a profile by sites.
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import TraceConfig
+
+from .types import QueryResultWrapper
+
+# timings of a check in seconds, see make_trace_config and check_site_for_username
+TIMING_PHASES = ("queue_wait", "dns", "connect", "ttfb", "total")
+
+
+async def on_dns_resolvehost_start(session, context, params):
+    if context.trace_request_ctx is not None:
+        context.trace_request_ctx["_dns_started"] = time.monotonic()
+
+
+async def on_dns_resolvehost_end(session, context, params):
+    timings = context.trace_request_ctx
+    if timings is not None and "_dns_started" in timings:
+        elapsed = time.monotonic() - timings.pop("_dns_started")
+        timings["dns"] = timings.get("dns", 0) + elapsed
+
+
+async def on_connection_create_start(session, context, params):
+    timings = context.trace_request_ctx
+    if timings is not None:
+        timings["_connect_started"] = time.monotonic()
+        timings["_dns_before_connect"] = timings.get("dns", 0)
+
+
+async def on_connection_create_end(session, context, params):
+    timings = context.trace_request_ctx
+    if timings is not None and "_connect_started" in timings:
+        elapsed = time.monotonic() - timings.pop("_connect_started")
+        # DNS resolving is a part of connection creation
+        elapsed -= timings.get("dns", 0) - timings.pop("_dns_before_connect", 0)
+        timings["connect"] = timings.get("connect", 0) + max(elapsed, 0)
+
+
+async def on_request_end(session, context, params):
+    # response headers are received, in case of redirects the last ones
+    timings = context.trace_request_ctx
+    if timings is not None and "_started" in timings:
+        timings["ttfb"] = time.monotonic() - timings["_started"]
+
+
+def make_trace_config() -> TraceConfig:
+    """
+    Trace config collecting timings of requests made with the
+    `trace_request_ctx` dict argument to this dict, see start_timings.
+    """
+    trace_config = TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def start_timings(timings: Dict[str, Any]):
+    timings["_started"] = time.monotonic()
+
+
+def finish_timings(timings: Dict[str, Any]):
+    """Calculates the total time of the request and removes service fields"""
+    started = timings.get("_started")
+    if started is not None:
+        timings["total"] = time.monotonic() - started
+    for key in [k for k in timings if k.startswith("_")]:
+        del timings[key]
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class ScanProfile:
+    """
+    Timings and outcomes of site checks of a scan aggregated by sites.
+    """
+
+    def __init__(self):
+        self.sites: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, sitename: str, result: QueryResultWrapper):
+        timings = result.get("timings")
+        status = result.get("status")
+        # no request was made: illegal username, disabled site, cached result
+        if not timings or "total" not in timings:
+            return
+
+        stats = self.sites.setdefault(
+            sitename,
+            {
+                "checks": 0,
+                "errors": 0,
+                "statuses": {},
+                "bytes": 0,
+                "retries": 0,
+                "max_total": 0.0,
+                **{f"{phase}_sum": 0.0 for phase in TIMING_PHASES},
+            },
+        )
+
+        stats["checks"] += 1
+        if status:
+            status_name = str(status.status)
+            stats["statuses"][status_name] = stats["statuses"].get(status_name, 0) + 1
+            if status.error:
+                stats["errors"] += 1
+        stats["bytes"] += timings.get("bytes", 0)
+        stats["retries"] += timings.get("retries", 0)
+        stats["max_total"] = max(stats["max_total"], timings["total"])
+        for phase in TIMING_PHASES:
+            stats[f"{phase}_sum"] += timings.get(phase, 0)
+
+    def add_results(self, results: Dict[str, QueryResultWrapper]):
+        for sitename, result in results.items():
+            self.add(sitename, result)
+
+    def get_site_profile(self, sitename: str) -> Dict[str, Any]:
+        stats = self.sites[sitename]
+        checks = stats["checks"]
+        profile = {
+            "checks": checks,
+            "errors": stats["errors"],
+            "statuses": dict(stats["statuses"]),
+            "bytes": stats["bytes"],
+            "retries": stats["retries"],
+            "max_total": round(stats["max_total"], 4),
+        }
+        for phase in TIMING_PHASES:
+            profile[f"avg_{phase}"] = round(stats[f"{phase}_sum"] / checks, 4)
+        return profile
+
+    def get_slowest(self, count: Optional[int] = 10) -> List[str]:
+        """Returns names of sites with the biggest average time of checks"""
+        names = sorted(
+            self.sites,
+            key=lambda s: self.sites[s]["total_sum"] / self.sites[s]["checks"],
+            reverse=True,
+        )
+        return names[:count]
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        return {
+            "sites": {
+                name: self.get_site_profile(name) for name in self.get_slowest(None)
+            }
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.json, indent=4, ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """Profile in the Prometheus text exposition format"""
+        metrics = [
+            (
+                "maigret_site_checks_total",
+                "counter",
+                "Count of site checks by statuses.",
+            ),
+            (
+                "maigret_site_check_phase_seconds_total",
+                "counter",
+                "Summary time of site checks phases in seconds.",
+            ),
+            (
+                "maigret_site_check_max_seconds",
+                "gauge",
+                "Maximum time of a site check in seconds.",
+            ),
+            (
+                "maigret_site_response_bytes_total",
+                "counter",
+                "Size of read site responses in bytes.",
+            ),
+            (
+                "maigret_site_retries_total",
+                "counter",
+                "Count of site checks retries.",
+            ),
+        ]
+        lines: Dict[str, List[str]] = {name: [] for name, _, _ in metrics}
+
+        for sitename in sorted(self.sites):
+            stats = self.sites[sitename]
+            site = f'site="{escape_label(sitename)}"'
+            for status, count in sorted(stats["statuses"].items()):
+                lines["maigret_site_checks_total"].append(
+                    f'maigret_site_checks_total{{{site},status="{status}"}} {count}'
+                )
+            for phase in TIMING_PHASES:
+                lines["maigret_site_check_phase_seconds_total"].append(
+                    f'maigret_site_check_phase_seconds_total{{{site},phase="{phase}"}} '
+                    f'{stats[f"{phase}_sum"]:.6f}'
+                )
+            lines["maigret_site_check_max_seconds"].append(
+                f'maigret_site_check_max_seconds{{{site}}} {stats["max_total"]:.6f}'
+            )
+            lines["maigret_site_response_bytes_total"].append(
+                f'maigret_site_response_bytes_total{{{site}}} {stats["bytes"]}'
+            )
+            lines["maigret_site_retries_total"].append(
+                f'maigret_site_retries_total{{{site}}} {stats["retries"]}'
+            )
+
+        output = []
+        for name, metric_type, description in metrics:
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines[name])
+        return "\n".join(output) + "\n"
+
+    def get_slowest_report(self, count=10) -> str:
+        """Human-readable report on the slowest sites"""
+        if not self.sites:
+            return "No sites timings collected."
+
+        output = [f"Top {count} slowest sites (average time of checks):"]
+        for sitename in self.get_slowest(count):
+            p = self.get_site_profile(sitename)
+            output.append(
+                f"{sitename}: {p['avg_total']:.2f}s "
+                f"(dns {p['avg_dns']:.2f}s, connect {p['avg_connect']:.2f}s, "
+                f"first byte {p['avg_ttfb']:.2f}s), "
+                f"queue wait {p['avg_queue_wait']:.2f}s, "
+                f"max {p['max_total']:.2f}s, {p['checks']} checks, "
+                f"{p['errors']} errors, {p['retries']} retries, {p['bytes']} bytes"
+            )
+        return "\n".join(output)
@@ -1,4 +1,4 @@
-from typing import Callable, List, Dict, Tuple, Any
+from typing import Callable, List, Dict, Tuple, Any, MutableMapping
 
 
 # search query
@@ -8,4 +8,5 @@ QueryDraft = Tuple[Callable, List, Dict]
 QueryOptions = Dict[str, Any]
 
 # TODO: throw out
-QueryResultWrapper = Dict[str, Any]
+# result of a site check, see MaigretSiteResult
+QueryResultWrapper = MutableMapping[str, Any]
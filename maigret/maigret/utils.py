@@ -4,6 +4,7 @@ import difflib
 import re
 import random
 import string
+from functools import lru_cache
 from typing import Any
 
 
@@ -30,6 +31,12 @@ class CaseConverter:
         return " ".join(words)
 
 
+@lru_cache(maxsize=None)
+def compile_regex(pattern: str) -> "re.Pattern":
+    """Compiled regexps of the sites db, unlike re module cache never evicted"""
+    return re.compile(pattern)
+
+
 def is_country_tag(tag: str) -> bool:
     """detect if tag represent a country"""
     return bool(re.match("^([a-zA-Z]){2}$", tag)) or tag == "global"
@@ -107,17 +114,30 @@ def get_random_user_agent():
     return random.choice(DEFAULT_USER_AGENTS)
 
 
-def get_match_ratio(base_strs: list):
+def get_match_ratio(base_strs: list, cache_size: int = 4096):
+    """
+    Returns a function of the max similarity ratio of a string to the base
+    strings, rounded to 2 digits. Matchers of the base strings are prepared
+    once, cheap upper bounds of the ratio skip full comparisons that can't
+    improve the result, and results for repeated strings are cached.
+    """
+    matchers = []
+    for s2 in base_strs:
+        matcher = difflib.SequenceMatcher()
+        # the matcher caches the index of the second sequence
+        matcher.set_seq2(s2.lower())
+        matchers.append(matcher)
+
+    @lru_cache(maxsize=cache_size)
     def get_match_inner(s: str):
-        return round(
-            max(
-                [
-                    difflib.SequenceMatcher(a=s.lower(), b=s2.lower()).ratio()
-                    for s2 in base_strs
-                ]
-            ),
-            2,
-        )
+        best = 0.0
+        s = s.lower()
+        for matcher in matchers:
+            matcher.set_seq1(s)
+            if matcher.real_quick_ratio() <= best or matcher.quick_ratio() <= best:
+                continue
+            best = max(best, matcher.ratio())
+        return round(best, 2)
 
     return get_match_inner
 
@@ -5,35 +5,67 @@ from flask import (
     send_file,
     Response,
     flash,
+    jsonify,
     redirect,
     url_for,
 )
 import logging
 import os
 import asyncio
+import threading
 from datetime import datetime
-from threading import Thread
 import maigret
+import maigret.checking
 import maigret.settings
-from maigret.sites import MaigretDatabase
-from maigret.report import generate_report_context
+from maigret.sites import load_database
+from maigret.report import (
+    generate_report_context,
+    load_results_data,
+    save_report,
+    save_reports,
+    save_results_data,
+)
+from maigret.web.jobs import JobScheduler, JobsQueueFull, JOB_COMPLETED, JOB_FAILED
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
-#add background job tracking
-background_jobs = {}
-job_results = {}
-
 # Configuration
 MAIGRET_DB_FILE = os.path.join('maigret', 'resources', 'data.json')
 COOKIES_FILE = "cookies.txt"
 UPLOAD_FOLDER = 'uploads'
 REPORTS_FOLDER = os.path.abspath('/tmp/maigret_reports')
+JOBS_DB_FILE = os.path.join(REPORTS_FOLDER, 'jobs.sqlite3')
+# searches running at the same time and waiting for their turn
+JOBS_WORKERS = int(os.getenv('MAIGRET_JOBS_WORKERS', '2'))
+JOBS_QUEUE_SIZE = int(os.getenv('MAIGRET_JOBS_QUEUE_SIZE', '20'))
+# time in seconds to keep results of searches
+JOBS_RETENTION = int(os.getenv('MAIGRET_JOBS_RETENTION', str(7 * 24 * 60 * 60)))
+# processes rendering reports of a search at the same time
+REPORTS_WORKERS = int(os.getenv('MAIGRET_REPORTS_WORKERS', '0')) or None
+# slow reports generated on the first download from the saved search results
+LAZY_REPORTS = {
+    'combined_report.pdf': 'pdf',
+    'combined_graph.html': 'graph',
+}
+RESULTS_DATA_FILE = 'results.json'
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(REPORTS_FOLDER, exist_ok=True)
 
+# background search jobs
+jobs = JobScheduler(
+    JOBS_DB_FILE,
+    workers=JOBS_WORKERS,
+    max_queued=JOBS_QUEUE_SIZE,
+    retention=JOBS_RETENTION,
+    files_folder=REPORTS_FOLDER,
+)
+
+# lazy reports being generated, to render every report once
+lazy_reports_lock = threading.Lock()
+lazy_reports_locks = {}
+
 
 def setup_logger(log_level, name):
     logger = logging.getLogger(name)
@@ -41,155 +73,191 @@ def setup_logger(log_level, name):
     return logger
 
 
-async def maigret_search(username, options):
+def get_sites_for_search(options):
     logger = setup_logger(logging.WARNING, 'maigret')
+    db = load_database(MAIGRET_DB_FILE)
+
+    top_sites = int(options.get('top_sites') or 500)
+    if options.get('all_sites'):
+        top_sites = 999999999  # effectively all
+
+    tags = options.get('tags', [])
+    site_list = options.get('site_list', [])
+    logger.info(f"Filtering sites by tags: {tags}")
+
+    sites = db.ranked_sites_dict(
+        top=top_sites,
+        tags=tags,
+        names=site_list,
+        disabled=False,
+        id_type='username',
+    )
+
+    logger.info(f"Found {len(sites)} sites matching the tag criteria")
+    return sites
+
+
+async def search_multiple_usernames(usernames, options, progress=None):
+    logger = setup_logger(logging.WARNING, 'maigret')
+    usernames = [u.strip() for u in usernames]
+    results = []
     try:
-        db = MaigretDatabase().load_from_path(MAIGRET_DB_FILE)
-        
-        top_sites = int(options.get('top_sites') or 500) 
-        if options.get('all_sites'):
-            top_sites = 999999999  # effectively all
-        
-        tags = options.get('tags', [])
-        site_list= options.get('site_list', [])
-        logger.info(f"Filtering sites by tags: {tags}")
-        
-        sites = db.ranked_sites_dict(
-            top=top_sites,
-            tags=tags,
-            names=site_list,
-            disabled=False,
-            id_type='username'
-        )
-        
-        logger.info(f"Found {len(sites)} sites matching the tag criteria")
+        sites = get_sites_for_search(options)
+        if progress:
+            progress(0, len(usernames), 'searching')
 
-        results = await maigret.search(
-            username=username,
+        # all usernames are checked at once over the same connections pool
+        async for username, id_type, search_results in maigret.checking.maigret_batch(
+            usernames={u: 'username' for u in usernames},
             site_dict=sites,
             timeout=int(options.get('timeout', 30)),
             logger=logger,
-            id_type='username',
+            no_progressbar=True,
             cookies=COOKIES_FILE if options.get('use_cookies') else None,
-            is_parsing_enabled=(not options.get('disable_extracting', False)),  
-            recursive_search_enabled=(not options.get('disable_recursive_search', False)),
+            is_parsing_enabled=(not options.get('disable_extracting', False)),
             check_domains=options.get('with_domains', False),
             proxy=options.get('proxy', None),
             tor_proxy=options.get('tor_proxy', None),
             i2p_proxy=options.get('i2p_proxy', None),
-        )
-        return results
+        ):
+            results.append((username, id_type, search_results))
+            if progress:
+                progress(len(results), len(usernames), 'searching')
     except Exception as e:
-        logger.error(f"Error during search: {str(e)}")
+        # errors of sites are in the results, this one stops the whole batch,
+        # so the job is failed instead of completed with partial results
+        logging.error(f"Error searching usernames {usernames}: {str(e)}")
         raise
 
-
-async def search_multiple_usernames(usernames, options):
-    results = []
-    for username in usernames:
-        try:
-            search_results = await maigret_search(username.strip(), options)
-            results.append((username.strip(), 'username', search_results))
-        except Exception as e:
-            logging.error(f"Error searching username {username}: {str(e)}")
+    # keep the order of usernames as they were entered
+    results.sort(key=lambda r: usernames.index(r[0]))
     return results
 
 
-def process_search_task(usernames, options, timestamp):
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+def process_search_task(timestamp, progress, usernames, options):
+    # event loop of the jobs worker thread
+    loop = asyncio.get_event_loop()
 
-        general_results = loop.run_until_complete(
-            search_multiple_usernames(usernames, options)
-        )
+    general_results = loop.run_until_complete(
+        search_multiple_usernames(usernames, options, progress)
+    )
+
+    session_folder = os.path.join(REPORTS_FOLDER, f"search_{timestamp}")
+    os.makedirs(session_folder, exist_ok=True)
+    progress(0, len(general_results), 'generating reports')
+
+    # results are kept for the lazy reports, see download_report
+    save_results_data(os.path.join(session_folder, RESULTS_DATA_FILE), general_results)
+
+    # the context is built once for all the usernames
+    report_tasks = []
+    if general_results:
+        context = generate_report_context(general_results)
+        html_path = os.path.join(session_folder, "combined_report.html")
+        report_tasks.append(('html', html_path, (context,)))
 
-        session_folder = os.path.join(REPORTS_FOLDER, f"search_{timestamp}")
-        os.makedirs(session_folder, exist_ok=True)
+    individual_reports = []
+    for username, id_type, results in general_results:
+        report_base = os.path.join(session_folder, f"report_{username}")
 
-        graph_path = os.path.join(session_folder, "combined_graph.html")
-        maigret.report.save_graph_report(
-            graph_path,
-            general_results,
-            MaigretDatabase().load_from_path(MAIGRET_DB_FILE),
+        report_tasks.append(('csv', f"{report_base}.csv", (username, results)))
+        report_tasks.append(
+            ('json', f"{report_base}.json", (username, results, 'ndjson'))
         )
 
-        individual_reports = []
-        for username, id_type, results in general_results:
-            report_base = os.path.join(session_folder, f"report_{username}")
-
-            csv_path = f"{report_base}.csv"
-            json_path = f"{report_base}.json"
-            pdf_path = f"{report_base}.pdf"
-            html_path = f"{report_base}.html"
-
-            context = generate_report_context(general_results)
-
-            maigret.report.save_csv_report(csv_path, username, results)
-            maigret.report.save_json_report(
-                json_path, username, results, report_type='ndjson'
-            )
-            maigret.report.save_pdf_report(pdf_path, context)
-            maigret.report.save_html_report(html_path, context)
-
-            claimed_profiles = []
-            for site_name, site_data in results.items():
-                if (
-                    site_data.get('status')
-                    and site_data['status'].status
-                    == maigret.result.MaigretCheckStatus.CLAIMED
-                ):
-                    claimed_profiles.append(
-                        {
-                            'site_name': site_name,
-                            'url': site_data.get('url_user', ''),
-                            'tags': (
-                                site_data.get('status').tags
-                                if site_data.get('status')
-                                else []
-                            ),
-                        }
-                    )
-
-            individual_reports.append(
-                {
-                    'username': username,
-                    'csv_file': os.path.join(
-                        f"search_{timestamp}", f"report_{username}.csv"
-                    ),
-                    'json_file': os.path.join(
-                        f"search_{timestamp}", f"report_{username}.json"
-                    ),
-                    'pdf_file': os.path.join(
-                        f"search_{timestamp}", f"report_{username}.pdf"
-                    ),
-                    'html_file': os.path.join(
-                        f"search_{timestamp}", f"report_{username}.html"
-                    ),
-                    'claimed_profiles': claimed_profiles,
-                }
-            )
-
-        # save results and mark job as complete using timestamp as key
-        job_results[timestamp] = {
-            'status': 'completed',
-            'session_folder': f"search_{timestamp}",
-            'graph_file': os.path.join(f"search_{timestamp}", "combined_graph.html"),
-            'usernames': usernames,
-            'individual_reports': individual_reports,
-        }
+        claimed_profiles = []
+        for site_name, site_data in results.items():
+            if (
+                site_data.get('status')
+                and site_data['status'].status
+                == maigret.result.MaigretCheckStatus.CLAIMED
+            ):
+                claimed_profiles.append(
+                    {
+                        'site_name': site_name,
+                        'url': site_data.get('url_user', ''),
+                        'tags': (
+                            site_data.get('status').tags
+                            if site_data.get('status')
+                            else []
+                        ),
+                    }
+                )
+
+        individual_reports.append(
+            {
+                'username': username,
+                'csv_file': os.path.join(
+                    f"search_{timestamp}", f"report_{username}.csv"
+                ),
+                'json_file': os.path.join(
+                    f"search_{timestamp}", f"report_{username}.json"
+                ),
+                'claimed_profiles': claimed_profiles,
+            }
+        )
 
-    except Exception as e:
-        logging.error(f"Error in search task for timestamp {timestamp}: {str(e)}")
-        job_results[timestamp] = {'status': 'failed', 'error': str(e)}
-    finally:
-        background_jobs[timestamp]['completed'] = True
+    saved_count = 0
+    for report_type, filename, error in save_reports(
+        report_tasks, max_workers=REPORTS_WORKERS
+    ):
+        if error:
+            logging.error(f"Error saving {report_type} report {filename}: {error}")
+        saved_count += 1
+        progress(saved_count, len(report_tasks), 'generating reports')
+
+    # results are saved by the jobs scheduler
+    return {
+        'session_folder': f"search_{timestamp}",
+        'html_file': os.path.join(f"search_{timestamp}", "combined_report.html"),
+        'pdf_file': os.path.join(f"search_{timestamp}", "combined_report.pdf"),
+        'graph_file': os.path.join(f"search_{timestamp}", "combined_graph.html"),
+        'usernames': usernames,
+        'individual_reports': individual_reports,
+    }
+
+
+def generate_lazy_report(file_path):
+    """Generates the slow report of the search session from its saved results"""
+    session_folder, name = os.path.split(file_path)
+    report_type = LAZY_REPORTS.get(name)
+    results_path = os.path.join(session_folder, RESULTS_DATA_FILE)
+    if not report_type or not os.path.exists(results_path):
+        return
+
+    with lazy_reports_lock:
+        lock = lazy_reports_locks.setdefault(file_path, threading.Lock())
+
+    # other requests of the same report wait for it
+    with lock:
+        if os.path.exists(file_path):
+            return
+
+        general_results = load_results_data(results_path)
+        if not general_results:
+            return
+
+        if report_type == 'pdf':
+            args = (generate_report_context(general_results),)
+        else:
+            args = (general_results, load_database(MAIGRET_DB_FILE))
+
+        try:
+            save_report(report_type, file_path, *args)
+        except Exception:
+            # don't serve a partially written report
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        finally:
+            with lazy_reports_lock:
+                lazy_reports_locks.pop(file_path, None)
 
 
 @app.route('/')
 def index():
     #load site data for autocomplete
-    db = MaigretDatabase().load_from_path(MAIGRET_DB_FILE)
+    db = load_database(MAIGRET_DB_FILE)
     site_options = []
     
     for site in db.sites:
@@ -217,8 +285,8 @@ def search():
         u.strip() for u in usernames_input.replace(',', ' ').split() if u.strip()
     ]
 
-    # Create timestamp for this search session
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Create timestamp for this search session, it's an id of the search job
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
 
     # Get selected tags - ensure it's a list
     selected_tags = request.form.getlist('tags')
@@ -243,13 +311,17 @@ def search():
     logging.info(f"Starting search for usernames: {usernames} with tags: {selected_tags}")
 
     # Start background job
-    background_jobs[timestamp] = {
-        'completed': False,
-        'thread': Thread(
-            target=process_search_task, args=(usernames, options, timestamp)
-        ),
-    }
-    background_jobs[timestamp]['thread'].start()
+    try:
+        jobs.submit(
+            timestamp,
+            process_search_task,
+            {'usernames': usernames, 'options': options},
+            usernames,
+            options,
+        )
+    except JobsQueueFull as e:
+        flash(f'{e}, please try again later.', 'warning')
+        return redirect(url_for('index'))
 
     return redirect(url_for('status', timestamp=timestamp))
 
@@ -257,65 +329,69 @@ def search():
 def status(timestamp):
     logging.info(f"Status check for timestamp: {timestamp}")
 
+    job = jobs.get(timestamp)
+    is_json = request.args.get('format') == 'json'
+    if is_json:
+        if not job:
+            return jsonify({'error': 'Invalid search session.'}), 404
+        return jsonify(
+            {
+                key: job.get(key)
+                for key in ('id', 'status', 'stage', 'done', 'total', 'position', 'error')
+            }
+        )
+
     # Validate timestamp
-    if timestamp not in background_jobs:
+    if not job:
         flash('Invalid search session.', 'danger')
         logging.error(f"Invalid search session: {timestamp}")
         return redirect(url_for('index'))
 
     # Check if job is completed
-    if background_jobs[timestamp]['completed']:
-        result = job_results.get(timestamp)
-        if not result:
-            flash('No results found for this search session.', 'warning')
-            logging.error(f"No results found for completed session: {timestamp}")
-            return redirect(url_for('index'))
-
-        if result['status'] == 'completed':
-            # Note: use the session_folder from the results to redirect
-            return redirect(url_for('results', session_id=result['session_folder']))
-        else:
-            error_msg = result.get('error', 'Unknown error occurred.')
-            flash(f'Search failed: {error_msg}', 'danger')
-            logging.error(f"Search failed for session {timestamp}: {error_msg}")
-            return redirect(url_for('index'))
+    if job['status'] == JOB_COMPLETED:
+        # Note: use the session_folder from the results to redirect
+        return redirect(url_for('results', session_id=job['result']['session_folder']))
+
+    if job['status'] == JOB_FAILED:
+        error_msg = job.get('error') or 'Unknown error occurred.'
+        flash(f'Search failed: {error_msg}', 'danger')
+        logging.error(f"Search failed for session {timestamp}: {error_msg}")
+        return redirect(url_for('index'))
 
     # If job is still running, show a status page
-    return render_template('status.html', timestamp=timestamp)
+    return render_template('status.html', timestamp=timestamp, job=job)
 
 
 @app.route('/results/<session_id>')
 def results(session_id):
-    # Find completed results that match this session_folder
-    result_data = next(
-        (
-            r
-            for r in job_results.values()
-            if r.get('status') == 'completed' and r['session_folder'] == session_id
-        ),
-        None,
-    )
+    # session folder is named by the search job id
+    job = jobs.get(session_id.replace('search_', '', 1))
+    result_data = job and job['status'] == JOB_COMPLETED and job['result']
 
     if not result_data:
         flash('No results found for this session ID.', 'danger')
-        logging.error(f"Results for session {session_id} not found in job_results.")
+        logging.error(f"Results for session {session_id} not found in jobs.")
         return redirect(url_for('index'))
 
     return render_template(
         'results.html',
         usernames=result_data['usernames'],
+        html_file=result_data.get('html_file'),
+        pdf_file=result_data.get('pdf_file'),
         graph_file=result_data['graph_file'],
         individual_reports=result_data['individual_reports'],
         timestamp=session_id.replace('search_', ''),
     )
 
 
-@app.route('/reports/<path:filename>')
+@app.route('/download/<path:filename>')
 def download_report(filename):
     try:
         file_path = os.path.normpath(os.path.join(REPORTS_FOLDER, filename))
-        if not file_path.startswith(REPORTS_FOLDER):
+        if not file_path.startswith(REPORTS_FOLDER + os.sep):
             raise Exception("Invalid file path")
+        if not os.path.exists(file_path):
+            generate_lazy_report(file_path)
         return send_file(file_path)
     except Exception as e:
         logging.error(f"Error serving file {filename}: {str(e)}")
@@ -0,0 +1,246 @@
+"""Background jobs of the Maigret web interface
+
+Jobs are run by a fixed pool of worker threads, each with its own event
+loop, from a bounded queue. State of jobs is kept in a SQLite file, so it
+doesn't grow in memory and survives restarts of the app.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+UNFINISHED_JOBS = (JOB_QUEUED, JOB_RUNNING)
+
+# unfinished jobs are touched by their scheduler while it is alive
+HEARTBEAT_INTERVAL = 60
+
+
+class JobsQueueFull(Exception):
+    pass
+
+
+class JobScheduler:
+    """
+    Bounded queue of jobs processed by a fixed number of workers.
+
+    Job function is called in a worker thread with the job id, a function
+    to report the progress of the job and the submitted arguments. The
+    returned dict is saved as the result of the job.
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        workers=2,
+        max_queued=20,
+        retention=7 * 24 * 60 * 60,
+        files_folder: Optional[str] = None,
+        stale_timeout=5 * 60,
+    ):
+        """
+        Keyword Arguments:
+        db_file                -- Path to the SQLite file with jobs state.
+        workers                -- Count of jobs running at the same time.
+        max_queued             -- Count of jobs waiting for a worker, new jobs
+                                  are rejected if the queue is full.
+        retention              -- Time in seconds to keep finished jobs.
+        files_folder           -- Folder with subfolders of jobs files named
+                                  `search_<job id>`, removed with the jobs.
+        stale_timeout          -- Time in seconds after which unfinished jobs
+                                  of other schedulers sharing the file are
+                                  failed as their process is gone, longer
+                                  than HEARTBEAT_INTERVAL.
+        """
+        self.workers_count = workers
+        self.retention = retention
+        self.files_folder = files_folder
+        self.stale_timeout = stale_timeout
+        # jobs are run by the scheduler which queued them
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex}'
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self.workers: list = []
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    stage TEXT,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT
+                )
+                """
+            )
+            # files of the previous versions
+            columns = [
+                row['name'] for row in self.db.execute("PRAGMA table_info(jobs)")
+            ]
+            if 'owner' not in columns:
+                self.db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.cleanup()
+
+    def start(self):
+        if self.workers:
+            return
+        self.recover()
+        for i in range(self.workers_count):
+            worker = threading.Thread(
+                target=self.worker, name=f'maigret-job-worker-{i}', daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+        threading.Thread(
+            target=self.heartbeat, name='maigret-job-heartbeat', daemon=True
+        ).start()
+
+    def submit(self, job_id: str, func: Callable, params: Dict[str, Any], *args):
+        """Queues the job, raises JobsQueueFull if there are too many jobs"""
+        self.start()
+        self.cleanup()
+
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, params, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, now, now, json.dumps(params), self.owner),
+            )
+        try:
+            self.queue.put_nowait((job_id, func, args))
+        except queue.Full:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            raise JobsQueueFull(
+                f'Too many searches in progress ({self.queue.maxsize} are waiting)'
+            )
+
+    def update(self, job_id: str, **fields):
+        fields['updated_at'] = time.time()
+        for key in ('params', 'result'):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        columns = ', '.join(f'{key} = ?' for key in fields)
+        with self.lock, self.db:
+            self.db.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        if row['status'] in UNFINISHED_JOBS and row['owner'] != self.owner:
+            # the job can be left by a stopped process
+            if self.recover():
+                return self.get(job_id)
+
+        job = dict(row)
+        for key in ('params', 'result'):
+            job[key] = json.loads(job[key]) if job[key] else None
+        if job['status'] == JOB_QUEUED:
+            job['position'] = self.get_queue_position(job)
+        return job
+
+    def get_queue_position(self, job: Dict[str, Any]) -> int:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                (JOB_QUEUED, job['created_at']),
+            ).fetchone()
+        return row[0] + 1
+
+    def recover(self) -> int:
+        """
+        Fails unfinished jobs of other schedulers not touched for the stale
+        timeout, returns the count of failed jobs
+        """
+        stale_at = time.time() - self.stale_timeout
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                "WHERE status IN (?, ?) AND updated_at < ? "
+                "AND (owner IS NULL OR owner != ?)",
+                (
+                    JOB_FAILED,
+                    'Interrupted by restart',
+                    time.time(),
+                    *UNFINISHED_JOBS,
+                    stale_at,
+                    self.owner,
+                ),
+            )
+        return cursor.rowcount
+
+    def heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self.lock, self.db:
+                self.db.execute(
+                    "UPDATE jobs SET updated_at = ? WHERE status IN (?, ?) AND owner = ?",
+                    (time.time(), *UNFINISHED_JOBS, self.owner),
+                )
+
+    def cleanup(self):
+        """Removes finished jobs older than the retention time with their files"""
+        expired_at = time.time() - self.retention
+        with self.lock, self.db:
+            rows = self.db.execute(
+                "SELECT id FROM jobs WHERE updated_at < ? AND status IN (?, ?)",
+                (expired_at, JOB_COMPLETED, JOB_FAILED),
+            ).fetchall()
+            self.db.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in rows]
+            )
+
+        if not self.files_folder:
+            return
+        for row in rows:
+            folder = os.path.join(self.files_folder, f"search_{row['id']}")
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def worker(self):
+        # one event loop for all the jobs of the worker
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        while True:
+            job_id, func, args = self.queue.get()
+            self.update(job_id, status=JOB_RUNNING)
+
+            def progress(done: int, total: int, stage: Optional[str] = None):
+                self.update(job_id, done=done, total=total, stage=stage)
+
+            try:
+                result = func(job_id, progress, *args)
+                self.update(job_id, status=JOB_COMPLETED, result=result)
+            except Exception as e:
+                logging.error(f"Error in job {job_id}: {str(e)}", exc_info=True)
+                self.update(job_id, status=JOB_FAILED, error=str(e))
+            finally:
+                self.queue.task_done()
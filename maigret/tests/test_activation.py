@@ -1,6 +1,8 @@
 """Maigret activation test functions"""
 
+import asyncio
 import json
+import time
 import yarl
 
 import aiohttp
@@ -8,7 +10,12 @@ import pytest
 from mock import Mock
 
 from tests.conftest import LOCAL_SERVER_PORT
-from maigret.activation import ParsingActivator, import_aiohttp_cookies
+from maigret.activation import (
+    ParsingActivator,
+    SiteActivator,
+    import_aiohttp_cookies,
+)
+from maigret.sites import MaigretSite
 
 COOKIES_TXT = """# HTTP Cookie File downloaded with cookies.txt by Genuinous @genuinous
 # This file can be used by wget, curl, aria2c and other standard compliant tools.
@@ -31,7 +38,11 @@ def test_vimeo_activation(default_db):
     vimeo_site = default_db.sites_dict['Vimeo']
     token1 = vimeo_site.headers['Authorization']
 
-    ParsingActivator.vimeo(vimeo_site, Mock())
+    async def activate():
+        async with aiohttp.ClientSession() as session:
+            await ParsingActivator.vimeo(vimeo_site, Mock(), session)
+
+    asyncio.run(activate())
     token2 = vimeo_site.headers['Authorization']
 
     assert token1 != token2
@@ -56,3 +67,43 @@ async def test_import_aiohttp_cookies(cookie_test_server):
             print(f"Server response: {result}")
 
     assert result == {'cookies': {'a': 'b'}}
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_site_activator_single_flight(httpserver):
+    httpserver.expect_oneshot_request('/activate').respond_with_json({'jwt': 'new'})
+
+    site = MaigretSite(
+        'Vimeo',
+        {
+            'url': 'http://localhost:8989/{username}',
+            'headers': {'Authorization': 'jwt old'},
+            'activation': {
+                'url': 'http://localhost:8989/activate',
+                'method': 'vimeo',
+            },
+        },
+    )
+    tokens = {}
+    activator = SiteActivator(tokens=tokens)
+    requested_at = time.monotonic()
+
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(
+            *[activator.activate(site, Mock(), session, requested_at) for _ in range(5)]
+        )
+
+    assert results == [True] * 5
+    assert len(httpserver.log) == 1
+    assert site.headers['Authorization'] == 'jwt new'
+
+    # activated headers are reused by other copies of the site
+    site_copy = MaigretSite('Vimeo', {'headers': {'Authorization': 'jwt old'}})
+    SiteActivator(tokens=tokens).apply(site_copy)
+    assert site_copy.headers['Authorization'] == 'jwt new'
+
+    # expired headers are not reused
+    site_copy.headers['Authorization'] = 'jwt old'
+    SiteActivator(ttl=0, tokens=tokens).apply(site_copy)
+    assert site_copy.headers['Authorization'] == 'jwt old'
@@ -0,0 +1,96 @@
+"""Maigret results cache test functions"""
+
+import time
+
+from mock import Mock
+import pytest
+
+from maigret import search
+from maigret.cache import ResultsCache
+from maigret.result import MaigretCheckResult, MaigretCheckStatus
+from maigret.errors import CheckError
+
+
+def make_result(status, **kwargs):
+    return MaigretCheckResult('alex', 'Site', 'https://site.com/alex', status, **kwargs)
+
+
+def test_results_cache_round_trip(tmp_path):
+    filename = str(tmp_path / 'results.sqlite3')
+    cache = ResultsCache(filename)
+
+    ids_data = {'uid': '123', 'username': 'alex'}
+    cache.set(
+        'Site',
+        'alex',
+        'username',
+        make_result(MaigretCheckStatus.CLAIMED, ids_data=ids_data),
+        200,
+        parsing=True,
+    )
+    cache.close()
+
+    cache = ResultsCache(filename)
+    cached = cache.get('Site', 'alex', 'username', parsing=True)
+
+    assert cached['status'] == MaigretCheckStatus.CLAIMED
+    assert cached['http_status'] == 200
+    assert cached['ids_data'] == ids_data
+    assert cache.get('Site', 'alex', 'gaia_id') is None
+    assert cache.get('Site', 'Alex', 'username') is None
+    cache.close()
+
+
+def test_results_cache_statuses(tmp_path):
+    cache = ResultsCache(str(tmp_path / 'results.sqlite3'), ttl=100)
+
+    cache.set('Claimed', 'alex', 'username', make_result(MaigretCheckStatus.CLAIMED))
+    cache.set(
+        'Available', 'alex', 'username', make_result(MaigretCheckStatus.AVAILABLE)
+    )
+    cache.set('Illegal', 'alex', 'username', make_result(MaigretCheckStatus.ILLEGAL))
+    cache.set(
+        'Unknown',
+        'alex',
+        'username',
+        make_result(MaigretCheckStatus.UNKNOWN, error=CheckError('Request timeout')),
+    )
+
+    assert cache.get('Claimed', 'alex', 'username')
+    assert cache.get('Available', 'alex', 'username')
+    assert cache.get('Illegal', 'alex', 'username') is None
+    assert cache.get('Unknown', 'alex', 'username') is None
+
+    # found accounts without extracted data are rechecked with parsing
+    assert cache.get('Claimed', 'alex', 'username', parsing=True) is None
+    assert cache.get('Available', 'alex', 'username', parsing=True)
+
+    # not found accounts expire earlier
+    checked_at = time.time() - 50
+    for key, row in cache.pending.items():
+        cache.pending[key] = row[:-1] + (checked_at,)
+
+    assert cache.get('Claimed', 'alex', 'username')
+    assert cache.get('Available', 'alex', 'username') is None
+    cache.close()
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_search_uses_results_cache(httpserver, local_test_db, tmp_path):
+    sites_dict = {'StatusCode': local_test_db.sites_dict['StatusCode']}
+    cache = ResultsCache(str(tmp_path / 'results.sqlite3'))
+
+    httpserver.expect_oneshot_request(
+        '/url', query_string='id=claimed'
+    ).respond_with_data(status=200)
+
+    result = await search('claimed', site_dict=sites_dict, logger=Mock(), cache=cache)
+    assert result['StatusCode']['status'].is_found() is True
+
+    # no more requests to the server
+    result = await search('claimed', site_dict=sites_dict, logger=Mock(), cache=cache)
+    assert result['StatusCode']['status'].is_found() is True
+    assert result['StatusCode']['http_status'] == 200
+    assert len(httpserver.log) == 1
+    cache.close()
@@ -0,0 +1,77 @@
+"""Maigret engines detection test functions"""
+
+from mock import Mock
+
+from maigret.sites import MaigretDatabase, MaigretEngine, MaigretSite
+from utils.check_engines import (
+    EngineSignatures,
+    apply_engines_diff,
+    detect_engines,
+    get_engines_diff,
+)
+
+ENGINES = [
+    MaigretEngine('phpBB', {'presenseStrs': ['phpBB']}),
+    MaigretEngine('phpBB2/Search', {'presenseStrs': ['phpBB 2.0']}),
+    MaigretEngine(
+        'XenForo', {'presenseStrs': ['XenForo'], 'site': {'checkType': 'message'}}
+    ),
+    MaigretEngine('uCoz', {'site': {}}),
+]
+
+
+def test_engine_signatures_match():
+    signatures = EngineSignatures(ENGINES)
+
+    assert signatures.names == ['phpBB2/Search', 'XenForo', 'phpBB']
+    # the shorter marker is overlapped by the longer one
+    assert signatures.match('<a>Powered by phpBB 2.0</a>') == ['phpBB2/Search', 'phpBB']
+    assert signatures.match('XenForo forum') == ['XenForo']
+    assert signatures.match('plain page') == []
+    assert signatures.match('') == []
+
+
+async def test_detect_engines(httpserver):
+    httpserver.expect_request('/forum').respond_with_data('Powered by XenForo')
+    httpserver.expect_request('/blog').respond_with_data('Hello world')
+    url = httpserver.url_for('/forum')
+    sites = [
+        MaigretSite('Forum', {'urlMain': url, 'url': url}),
+        MaigretSite('Forum2', {'urlMain': url, 'url': url}),
+        MaigretSite('Blog', {'urlMain': httpserver.url_for('/blog'), 'url': url}),
+        MaigretSite('Down', {'urlMain': 'http://localhost:1/', 'url': url}),
+    ]
+
+    detected = await detect_engines(
+        sites, EngineSignatures(ENGINES), Mock(), timeout=2, no_progressbar=True
+    )
+
+    assert detected == {
+        'Forum': ['XenForo'],
+        'Forum2': ['XenForo'],
+        'Blog': [],
+        'Down': None,
+    }
+    # the same main page is fetched once
+    assert len(httpserver.log) == 2
+
+
+def test_engines_diff_and_apply():
+    db = MaigretDatabase()
+    for engine in ENGINES:
+        db.update_engine(engine)
+    for name, engine in (('New', None), ('Same', 'XenForo'), ('Other', 'uCoz')):
+        data = {'urlMain': f'https://{name}.com/', 'url': 'https://x.com/{username}'}
+        if engine:
+            data['engine'] = engine
+        db.update_site(MaigretSite(name, data))
+
+    detected = {'New': ['XenForo'], 'Same': ['XenForo'], 'Other': ['XenForo']}
+    diff = get_engines_diff(db.sites_dict, detected, EngineSignatures(ENGINES).names)
+
+    # engines without signatures are not changed
+    assert diff == {'New': {'old': None, 'new': 'XenForo', 'candidates': ['XenForo']}}
+
+    apply_engines_diff(db, diff)
+    assert db.sites_dict['New'].engine == 'XenForo'
+    assert 'checkType' not in db.sites_dict['New'].json
@@ -1,7 +1,15 @@
 from mock import Mock
 import pytest
 
-from maigret import search
+from maigret import search, stream
+from maigret.checking import (
+    RESPONSE_CHUNK_SIZE,
+    ResponseMarkersSearch,
+    SimpleAiohttpChecker,
+    get_site_timeout,
+    maigret_batch,
+)
+from maigret.sites import MaigretSite
 
 
 def site_result_except(server, username, **kwargs):
@@ -67,3 +75,184 @@ async def test_checking_by_message_negative(httpserver, local_test_db):
 
     result = await search('unclaimed', site_dict=sites_dict, logger=Mock())
     assert result['Message']['status'].is_found() is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checker_reuses_pooled_session(httpserver):
+    httpserver.expect_request('/url').respond_with_data("user profile")
+
+    checker = SimpleAiohttpChecker(logger=Mock(), connections_per_host=2)
+
+    checker.prepare(url=httpserver.url_for('/url'))
+    text, status, error = await checker.check()
+    assert (text, status, error) == ("user profile", 200, None)
+
+    session = checker.session
+    assert session.connector.limit_per_host == 2
+
+    checker.prepare(url=httpserver.url_for('/url'))
+    await checker.check()
+    assert checker.session is session
+
+    await checker.close()
+    assert session.closed
+    assert checker.session is None
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checker_stops_reading_body(httpserver):
+    page = "user profile" + " " * RESPONSE_CHUNK_SIZE * 4 + "not found"
+    httpserver.expect_request('/url').respond_with_data(page)
+    checker = SimpleAiohttpChecker(logger=Mock())
+
+    checker.prepare(url=httpserver.url_for('/url'))
+    text, _, _ = await checker.check()
+    assert text == page
+
+    checker.prepare(url=httpserver.url_for('/url'), max_size=RESPONSE_CHUNK_SIZE)
+    text, _, _ = await checker.check()
+    assert len(text) < len(page)
+
+    checker.prepare(url=httpserver.url_for('/url'), stop_reading=lambda t: True)
+    text, _, _ = await checker.check()
+    assert len(text) < len(page)
+    await checker.close()
+
+
+def test_response_markers_search():
+    site = MaigretSite(
+        'Example',
+        {
+            'checkType': 'message',
+            'presenseStrs': ['profile'],
+            'absenceStrs': ['not found'],
+        },
+    )
+
+    search = ResponseMarkersSearch(site)
+    assert search.feed('user profile') is False
+    # the marker is split between chunks
+    assert search.feed('... not fo') is False
+    assert search.feed('und') is True
+
+    site.errors = {'Please log in': 'Login required'}
+    search = ResponseMarkersSearch(site)
+    assert search.feed('not found') is False
+    assert search.feed('Please log in') is True
+
+    site.check_type = 'status_code'
+    site.errors = {}
+    assert ResponseMarkersSearch(site).feed('') is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_batch_checking(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    site_result_except(httpserver, 'claimed', status=200, response_data="profile")
+    site_result_except(httpserver, 'unclaimed', status=404, response_data="404")
+    site_result_except(httpserver, 'other', status=200, response_data="profile")
+
+    def extract_new_usernames(username, results):
+        return {'other': 'username', 'Claimed': 'username'}
+
+    results = {}
+    async for username, id_type, result in maigret_batch(
+        {'claimed': 'username', 'unclaimed': 'username'},
+        site_dict=sites_dict,
+        logger=Mock(),
+        no_progressbar=True,
+        extract_new_usernames=extract_new_usernames,
+    ):
+        assert id_type == 'username'
+        assert list(result.keys()) == ['StatusCode', 'Message']
+        results[username] = result
+
+    # usernames are checked once, including recursively found ones
+    assert sorted(results.keys()) == ['claimed', 'other', 'unclaimed']
+    assert results['claimed']['StatusCode']['status'].is_found() is True
+    assert results['claimed']['Message']['status'].is_found() is True
+    assert results['unclaimed']['StatusCode']['status'].is_found() is False
+    assert results['unclaimed']['Message']['status'].is_found() is False
+    assert results['other']['Message']['status'].is_found() is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_batch_checking_lazy_usernames(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    site_result_except(httpserver, 'claimed', status=200, response_data="profile")
+    site_result_except(httpserver, 'unclaimed', status=404, response_data="404")
+    site_result_except(httpserver, 'other', status=200, response_data="profile")
+
+    taken = []
+
+    def usernames():
+        for username in ['claimed', 'Claimed', 'unclaimed', 'other']:
+            taken.append(username)
+            yield username, 'username'
+
+    results, taken_counts = [], []
+    async for username, _, result in maigret_batch(
+        usernames(),
+        site_dict=sites_dict,
+        logger=Mock(),
+        no_progressbar=True,
+        max_active_usernames=1,
+    ):
+        taken_counts.append(len(taken))
+        results.append(username)
+
+    # the next username is taken only after the search is finished,
+    # duplicates are skipped
+    assert results == ['claimed', 'unclaimed', 'other']
+    assert taken_counts == [3, 4, 4]
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_stream_checking(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    site_result_except(httpserver, 'claimed', status=200, response_data="profile")
+
+    results = {}
+    async for sitename, result in stream(
+        'claimed', site_dict=sites_dict, logger=Mock(), no_progressbar=True
+    ):
+        results[sitename] = result
+
+    assert sorted(results.keys()) == ['Message', 'StatusCode']
+    assert results['StatusCode']['status'].is_found() is True
+    assert results['Message']['status'].is_found() is True
+
+
+def test_adaptive_site_timeout(local_test_db):
+    site = local_test_db.sites_dict['StatusCode']
+
+    # not enough data about response times
+    assert get_site_timeout(site, 30) == 30
+
+    site.stats['response_times'] = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert get_site_timeout(site, 30) == pytest.approx(1.2)
+    assert get_site_timeout(site, 1) == 1
+    assert get_site_timeout(site, 30, retry=1) == 30
+
+    site.stats['response_times'] = [0.01] * 5
+    assert get_site_timeout(site, 30) == 1.0
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_rate_limited(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    site_result_except(httpserver, 'claimed', status=429)
+
+    result = await search('claimed', site_dict=sites_dict, logger=Mock())
+    assert result['StatusCode']['status'].is_found() is False
+    assert result['StatusCode']['status'].error.type == 'Too many requests'
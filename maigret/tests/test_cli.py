@@ -3,22 +3,34 @@
 from argparse import Namespace
 from typing import Dict, Any
 
+from maigret.maigret import setup_arguments_parser
+from maigret.settings import Settings
+
+from tests.conftest import SETTINGS_FILE
+
 DEFAULT_ARGS: Dict[str, Any] = {
     'all_sites': False,
+    'cache_ttl': 86400,
     'connections': 100,
+    'connections_per_engine': 0,
+    'connections_per_host': 10,
     'cookie_file': None,
     'csv': False,
     'db_file': 'resources/data.json',
     'debug': False,
+    'disable_cache': True,
     'disable_extracting': False,
     'disable_recursive_search': False,
     'folderoutput': 'reports',
     'html': False,
     'graph': False,
+    'graph_format': 'html',
+    'graph_max_nodes': 0,
     'id_type': 'username',
     'ignore_ids_list': [],
     'info': False,
     'json': '',
+    'max_response_size': 2097152,
     'new_site_to_submit': False,
     'no_color': False,
     'no_progressbar': False,
@@ -35,6 +47,7 @@ DEFAULT_ARGS: Dict[str, Any] = {
     'stats': False,
     'tags': '',
     'timeout': 30,
+    'timings': '',
     'tor_proxy': 'socks5://127.0.0.1:9050',
     'i2p_proxy': 'http://127.0.0.1:4444',
     'top_sites': 500,
@@ -72,6 +85,22 @@ def test_args_search_mode_several_usernames(argparser):
         assert getattr(args, arg) == want_args[arg]
 
 
+def test_args_results_cache():
+    settings = Settings()
+    settings.load([SETTINGS_FILE])
+    assert setup_arguments_parser(settings).parse_args([]).disable_cache
+
+    argparser = setup_arguments_parser(settings)
+    assert not argparser.parse_args(['--cache']).disable_cache
+    assert argparser.parse_args(['--cache', '--no-cache']).disable_cache
+
+    # --no-cache disables the cache enabled in settings
+    settings.results_cache = True
+    argparser = setup_arguments_parser(settings)
+    assert not argparser.parse_args([]).disable_cache
+    assert argparser.parse_args(['--no-cache']).disable_cache
+
+
 def test_args_self_check_mode(argparser):
     args = argparser.parse_args('--self-check --site GitHub'.split())
 
@@ -1,7 +1,11 @@
 import pytest
-from maigret.errors import notify_about_errors, CheckError
+from maigret.errors import extract_and_group, notify_about_errors, CheckError
 from maigret.types import QueryResultWrapper
-from maigret.result import MaigretCheckResult, MaigretCheckStatus
+from maigret.result import (
+    MaigretCheckResult,
+    MaigretCheckStatus,
+    MaigretSiteResult,
+)
 
 
 def test_notify_about_errors():
@@ -56,3 +60,25 @@ def test_notify_about_errors():
         ('You can see detailed site check errors with a flag `--print-errors`', '-'),
     ]
     assert results == expected_output
+
+
+def test_extract_and_group_site_results():
+    def site_result(error):
+        status = MaigretCheckStatus.UNKNOWN if error else MaigretCheckStatus.CLAIMED
+        return MaigretSiteResult(
+            username='test',
+            status=MaigretCheckResult('test', '', '', status, error=error),
+        )
+
+    results = {
+        'site1': site_result(CheckError('Captcha')),
+        'site2': site_result(CheckError('Captcha')),
+        'site3': site_result(CheckError('Access denied')),
+        'site4': site_result(None),
+        'site5': MaigretSiteResult(username='test'),
+    }
+
+    assert extract_and_group(results) == [
+        {'err': 'Captcha', 'count': 2, 'perc': 40.0},
+        {'err': 'Access denied', 'count': 1, 'perc': 20.0},
+    ]
@@ -9,6 +9,8 @@ from maigret.executors import (
     AsyncioProgressbarSemaphoreExecutor,
     AsyncioProgressbarQueueExecutor,
     AsyncioQueueGeneratorExecutor,
+    AsyncioDynamicQueueExecutor,
+    KeyedLimiter,
 )
 
 logger = logging.getLogger(__name__)
@@ -109,3 +111,91 @@ async def test_asyncio_queue_generator_executor():
     assert results == [0, 3, 6, 9, 1, 4, 7, 2, 5, 8]
     assert executor.execution_time > 0.2
     assert executor.execution_time < 0.3
+
+
+@pytest.mark.asyncio
+async def test_asyncio_dynamic_queue_executor():
+    tasks = [(func, [n], {}) for n in range(10)]
+
+    executor = AsyncioDynamicQueueExecutor(logger=logger, in_parallel=10)
+    results = []
+    async for result in executor.run(tasks):
+        results.append(result)
+        # add new tasks while running
+        if result < 10:
+            executor.add([(func, [result + 10], {})])
+
+    assert sorted(results) == list(range(20))
+    assert executor.execution_time > 0.25
+    assert executor.execution_time < 0.4
+
+
+@pytest.mark.asyncio
+async def test_asyncio_dynamic_queue_executor_timeout():
+    async def func_with_default(n, default=None):
+        return await func(n)
+
+    tasks = [(func_with_default, [n], {'default': -1}) for n in range(3)]
+
+    executor = AsyncioDynamicQueueExecutor(logger=logger, in_parallel=3, timeout=0.15)
+    results = [result async for result in executor.run(tasks)]
+
+    assert sorted(results) == [-1, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_asyncio_dynamic_queue_executor_slots():
+    running = {'a': 0, 'b': 0}
+    max_running = {'a': 0, 'b': 0}
+
+    async def slot_func(key, slots=None):
+        running[key] += 1
+        max_running[key] = max(max_running[key], running[key])
+        await asyncio.sleep(0.05)
+        running[key] -= 1
+        return key
+
+    tasks = [(slot_func, [k], {'slots': {k: 2}}) for k in 'ab' * 5]
+
+    executor = AsyncioDynamicQueueExecutor(logger=logger, in_parallel=10)
+    results = [result async for result in executor.run(tasks)]
+
+    assert sorted(results) == ['a'] * 5 + ['b'] * 5
+    assert max_running == {'a': 2, 'b': 2}
+    # 5 tasks with 2 slots are processed in 3 rounds
+    assert executor.execution_time > 0.15
+    assert executor.execution_time < 0.25
+
+
+@pytest.mark.asyncio
+async def test_asyncio_dynamic_queue_executor_back_off():
+    limiter = KeyedLimiter(backoff_base=0.2)
+    limiter.back_off('a')
+
+    async def slot_func(n, slots=None):
+        return await func(n)
+
+    tasks = [(slot_func, [n], {'slots': {'a': 0}}) for n in range(3)]
+
+    executor = AsyncioDynamicQueueExecutor(logger=logger, limiter=limiter)
+    results = [result async for result in executor.run(tasks)]
+
+    # tasks are started only after the pause
+    assert sorted(results) == [0, 1, 2]
+    assert executor.execution_time > 0.35
+    assert executor.execution_time < 0.5
+
+
+def test_keyed_limiter_back_off():
+    limiter = KeyedLimiter(backoff_base=1, backoff_max=3)
+
+    assert limiter.back_off('a') == 1
+    assert limiter.back_off('a') == 2
+    assert limiter.back_off('a') == 3
+
+    key, delay = limiter.get_pause({'a': 0, 'b': 0})
+    assert key == 'a'
+    assert 2 < delay <= 3
+
+    limiter.reset('a')
+    assert limiter.back_off('a') == 1
@@ -0,0 +1,97 @@
+"""Maigret sites health test functions"""
+
+from mock import Mock
+import pytest
+
+from maigret.checking import self_check
+from maigret.health import (
+    SELF_CHECK_ERROR,
+    SELF_CHECK_FAILED,
+    SELF_CHECK_OK,
+    SiteHealthHistory,
+    is_site_broken,
+)
+
+
+def test_is_site_broken():
+    ok, failed, error = SELF_CHECK_OK, SELF_CHECK_FAILED, SELF_CHECK_ERROR
+
+    assert is_site_broken([failed], disabled=False) is True
+    assert is_site_broken([ok], disabled=True) is False
+    assert is_site_broken([ok, ok, ok, failed], disabled=False) is False
+    assert is_site_broken([ok, failed, failed, error], disabled=False) is True
+    # no majority, keep the current state
+    assert is_site_broken([ok, failed], disabled=True) is True
+    assert is_site_broken([ok, failed], disabled=False) is False
+    assert is_site_broken([error, error], disabled=True) is True
+    assert is_site_broken([], disabled=False) is False
+
+
+def test_site_health_history(tmp_path):
+    filename = str(tmp_path / 'health.sqlite3')
+    history = SiteHealthHistory(filename)
+
+    for outcome in (SELF_CHECK_FAILED, SELF_CHECK_OK, SELF_CHECK_ERROR):
+        history.add('Site', outcome, elapsed=1.5)
+    history.add('Other', SELF_CHECK_OK)
+
+    # outcomes are saved before the history is closed
+    with SiteHealthHistory(filename) as other:
+        assert other.get_outcomes('Other') == [SELF_CHECK_OK]
+    history.close()
+
+    history = SiteHealthHistory(filename)
+    assert history.get_outcomes('Site') == [
+        SELF_CHECK_FAILED,
+        SELF_CHECK_OK,
+        SELF_CHECK_ERROR,
+    ]
+    assert history.get_outcomes('Site', 2) == [SELF_CHECK_OK, SELF_CHECK_ERROR]
+    assert history.get_stats('Site') == {
+        'checks': 3,
+        'failed': 1,
+        'errors': 1,
+        'avg_elapsed': 1.5,
+    }
+    history.close()
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_self_check_with_history(httpserver, local_test_db, tmp_path):
+    httpserver.expect_request('/url', query_string='id=claimed').respond_with_data(
+        'user profile', status=200
+    )
+    # status code check can't detect an unclaimed account
+    httpserver.expect_request('/url', query_string='id=unclaimed').respond_with_data(
+        'not found', status=200
+    )
+
+    sites = local_test_db.sites_dict
+    history = SiteHealthHistory(str(tmp_path / 'health.sqlite3'))
+    for _ in range(3):
+        history.add('StatusCode', SELF_CHECK_OK)
+
+    async def check():
+        return await self_check(
+            local_test_db,
+            sites,
+            Mock(),
+            silent=True,
+            history=history,
+            no_progressbar=True,
+        )
+
+    # single failure after successful checks doesn't disable the site
+    assert await check() is False
+    assert sites['StatusCode'].disabled is False
+    assert history.get_outcomes('StatusCode')[-1] == SELF_CHECK_FAILED
+    assert history.get_outcomes('Message') == [SELF_CHECK_OK]
+
+    await check()
+    assert sites['StatusCode'].disabled is False
+
+    assert await check() is True
+    assert sites['StatusCode'].disabled is True
+    assert sites['Message'].disabled is False
+    history.close()
@@ -0,0 +1,104 @@
+"""Maigret batch import of sites test functions"""
+
+import re
+
+from mock import Mock
+
+from maigret.sites import MaigretDatabase, MaigretSite
+from utils.import_sites import (
+    get_new_urls,
+    import_sites,
+    make_derived_candidates,
+    merge_sites,
+)
+
+
+def test_get_new_urls():
+    db = MaigretDatabase()
+    db.update_site(
+        MaigretSite(
+            'Known',
+            {'urlMain': 'https://known.com/', 'url': 'https://known.com/u/{username}'},
+        )
+    )
+
+    urls = [
+        'https://www.known.com/',
+        'https://new.com/',
+        'https://new.com/users/{username}',
+        'https://other.org/{username}',
+        'https://"bad.com/',
+        '',
+    ]
+
+    assert get_new_urls(urls, db, logger=Mock()) == {
+        'new.com': 'https://new.com/',
+        'other.org': 'https://other.org/{username}',
+    }
+    assert get_new_urls(urls, db, url_filter='.org', logger=Mock()) == {
+        'other.org': 'https://other.org/{username}',
+    }
+
+
+def test_make_derived_candidates():
+    url = 'https://site.com/{username}'
+    pages = {
+        'https://site.com/alex': ('"Profile"\n"alex"\n"Followers"', 200),
+        'https://site.com/god': ('"Not found"', 200),
+        'https://site.com/rnd1': ('"Not found"\n"rnd1"', 200),
+        'https://site.com/rnd2': ('"Not found"\n"rnd2"', 200),
+    }
+
+    candidates = make_derived_candidates(
+        'site.com', url, pages, ['alex', 'god'], ['rnd1', 'rnd2'], ['profile']
+    )
+
+    # the page of "god" is the same as pages of random usernames
+    assert len(candidates) == 1
+    site = candidates[0]
+    assert site.check_type == 'message'
+    assert site.username_claimed == 'alex'
+    assert site.presense_strs[0] == 'Profile'
+    assert site.absence_strs == ['Not found']
+
+    pages['https://site.com/rnd1'] = ('', 404)
+    pages['https://site.com/rnd2'] = ('', 404)
+    candidates = make_derived_candidates(
+        'site.com', url, pages, ['alex'], ['rnd1', 'rnd2'], []
+    )
+    assert candidates[0].check_type == 'status_code'
+
+
+def test_merge_sites():
+    db = MaigretDatabase()
+    sites = [
+        MaigretSite('a.com', {'url': 'https://a.com/{username}', 'usernameClaimed': 'x'}),
+        MaigretSite('a.com', {'url': 'https://a.com/{username}', 'usernameClaimed': 'y'}),
+        MaigretSite('b.com', {'url': 'https://b.com/{username}'}),
+    ]
+
+    added = merge_sites(db, sites)
+
+    assert [s.name for s in added] == ['a.com', 'b.com']
+    assert db.sites_dict['a.com'].username_claimed == 'x'
+    assert db.get_sites_by_domain('b.com')
+
+
+async def test_import_sites(httpserver):
+    httpserver.expect_request('/').respond_with_data('Main page')
+    httpserver.expect_request('/users/alex').respond_with_data('Profile of alex')
+    httpserver.expect_request(re.compile('^/users/.+')).respond_with_data(
+        'Not found', status=404
+    )
+    url = httpserver.url_for('/users/{username}')
+
+    db = MaigretDatabase()
+    urls = get_new_urls([url], db, logger=Mock())
+    sites = await import_sites(
+        urls, db, Mock(), ['john', 'alex'], [], timeout=2, no_progressbar=True
+    )
+
+    assert len(sites) == 1
+    assert sites[0].check_type == 'status_code'
+    assert sites[0].username_claimed == 'alex'
+    assert db.sites_dict[sites[0].name] is sites[0]
@@ -48,3 +48,49 @@ def test_gather_all():
         'ba_': 2,
     }
     assert result == expected
+
+
+def test_generate_priority_order():
+    permute = Permute({'a': 1, 'b': 2, 'c': 3})
+    result = [username for username, _ in permute.generate(method="strict")]
+
+    # two elements joined without separators first, affixed forms later
+    assert result[:6] == ['ab', 'ac', 'ba', 'bc', 'ca', 'cb']
+    assert result.index('a_b') < result.index('_ab')
+    two_elements = [u for u in result if sum(c.isalpha() for c in u) == 2]
+    assert len(two_elements) == 6 * 6
+    assert result[: len(two_elements)] == two_elements
+    assert len(result) == len(set(result))
+
+
+def test_generate_dedup_and_max_length():
+    permute = Permute({'a': 1, 'A': 2, 'b': 3})
+    result = dict(permute.generate(method="all", max_length=2))
+
+    assert 'a' in result and 'A' not in result
+    assert all(len(u) <= 2 for u in result)
+
+
+def test_generate_pruned_by_sites():
+    class Site:
+        def __init__(self, regex_check):
+            self.regex_check = regex_check
+
+    permute = Permute({'a': 1, 'b': 2})
+
+    result = [u for u, _ in permute.generate(sites=[Site('^[^.]+$'), Site('^[a-z]+$')])]
+    assert 'a.b' not in result
+    assert 'a_b' in result
+
+    result = [u for u, _ in permute.generate(sites=[Site('^[a-z]+$')])]
+    assert result == ['ab', 'ba']
+
+    result = [u for u, _ in permute.generate(sites=[Site('^[a-z]+$'), Site(None)])]
+    assert 'a.b' in result
+
+
+def test_generate_is_lazy():
+    permute = Permute({str(i): i for i in range(12)})
+    generator = permute.generate()
+
+    assert next(generator) == ('01', 0)
@@ -3,6 +3,7 @@
 import copy
 import json
 import os
+import pickle
 import pytest
 from io import StringIO
 
@@ -15,13 +16,22 @@ from maigret.report import (
     save_xmind_report,
     save_html_report,
     save_pdf_report,
+    save_reports,
+    save_results_data,
+    save_graph_report,
+    MaigretGraph,
     generate_report_template,
     generate_report_context,
     generate_json_report,
     get_plaintext_report,
+    load_results_data,
+    write_reports_stream,
+    CSVReportWriter,
+    NDJSONReportWriter,
+    TXTReportWriter,
 )
-from maigret.result import MaigretCheckResult, MaigretCheckStatus
-from maigret.sites import MaigretSite
+from maigret.result import MaigretCheckResult, MaigretCheckStatus, MaigretSiteResult
+from maigret.sites import MaigretDatabase, MaigretSite
 
 
 GOOD_RESULT = MaigretCheckResult('', '', '', MaigretCheckStatus.CLAIMED)
@@ -365,6 +375,46 @@ def test_generate_json_ndjson_report():
     assert json.loads(data[0])['sitename'] == 'GitHub'
 
 
+def test_generate_json_report_from_site_results():
+    jsonfile = StringIO()
+    site_result = MaigretSiteResult(EXAMPLE_RESULTS['GitHub'], checker=object())
+    generate_json_report('test', {'GitHub': site_result}, jsonfile, 'ndjson')
+
+    jsonfile.seek(0)
+    data = json.loads(jsonfile.read())
+
+    assert data['sitename'] == 'GitHub'
+    assert data['url_user'] == 'https://www.github.com/test'
+    assert 'checker' not in data
+    assert 'ids_usernames' not in data
+
+
+@pytest.mark.asyncio
+async def test_write_reports_stream():
+    async def results_stream():
+        yield 'GitHub', EXAMPLE_RESULTS['GitHub']
+        yield 'GitHub2', BROKEN_RESULTS['GitHub']
+
+    csvfile, txtfile, jsonfile = StringIO(), StringIO(), StringIO()
+    writers = [
+        CSVReportWriter('test', csvfile),
+        TXTReportWriter('test', txtfile),
+        NDJSONReportWriter('test', jsonfile),
+    ]
+
+    sitenames = [
+        sitename
+        async for sitename, _ in write_reports_stream(results_stream(), writers)
+    ]
+
+    assert sitenames == ['GitHub', 'GitHub2']
+    assert len(csvfile.getvalue().splitlines()) == 3
+    assert txtfile.getvalue() == (
+        'https://www.github.com/test\nTotal Websites Username Detected On : 1'
+    )
+    assert json.loads(jsonfile.getvalue())['sitename'] == 'GitHub'
+
+
 def test_save_xmind_report():
     filename = 'report_test.xmind'
     save_xmind_report(filename, 'test', EXAMPLE_RESULTS)
@@ -456,3 +506,118 @@ def test_text_report_broken():
         assert brief_part in report_text
     assert 'us' in report_text
     assert 'photo' in report_text
+
+
+def test_site_result_pickle():
+    site_result = MaigretSiteResult(
+        EXAMPLE_RESULTS['GitHub'], checker=object(), future=object()
+    )
+
+    restored = pickle.loads(pickle.dumps(site_result))
+
+    assert restored['url_user'] == 'https://www.github.com/test'
+    assert restored['status'].status == MaigretCheckStatus.CLAIMED
+    assert 'checker' not in restored
+    assert 'future' not in restored
+
+
+def test_results_data(tmp_path):
+    filename = str(tmp_path / 'results.json')
+    save_results_data(filename, TEST)
+    restored = load_results_data(filename)
+
+    assert [(u, t) for u, t, _ in restored] == [(u, t) for u, t, _ in TEST]
+    site_result = restored[0][2]['500px']
+    assert isinstance(site_result, MaigretSiteResult)
+    assert site_result['status'].status == MaigretCheckStatus.CLAIMED
+    assert site_result['status'].ids_data == GOOD_500PX_RESULT.ids_data
+
+    # the same reports are generated from the saved data
+    report_text = get_plaintext_report(generate_report_context(TEST))
+    assert get_plaintext_report(generate_report_context(restored)) == report_text
+
+
+def test_save_reports(tmp_path):
+    context = generate_report_context(TEST)
+    tasks = [
+        ('html', str(tmp_path / 'report.html'), (context,)),
+        ('csv', str(tmp_path / 'report.csv'), ('test', EXAMPLE_RESULTS)),
+        ('json', str(tmp_path / 'report.json'), ('test', EXAMPLE_RESULTS, 'simple')),
+        ('txt', str(tmp_path / 'broken' / 'report.txt'), ('test', EXAMPLE_RESULTS)),
+    ]
+
+    saved = {
+        report_type: error
+        for report_type, _, error in save_reports(tasks, max_workers=2)
+    }
+
+    assert set(saved) == {'html', 'csv', 'json', 'txt'}
+    assert saved['html'] is None and saved['csv'] is None and saved['json'] is None
+    assert isinstance(saved['txt'], FileNotFoundError)
+    assert SUPPOSED_BRIEF in (tmp_path / 'report.html').read_text()
+    assert 'GitHub' in json.loads((tmp_path / 'report.json').read_text())
+
+
+def test_save_reports_in_current_process(tmp_path):
+    filename = str(tmp_path / 'report.csv')
+
+    saved = list(
+        save_reports([('csv', filename, ('test', EXAMPLE_RESULTS))], max_workers=0)
+    )
+
+    assert saved == [('csv', filename, None)]
+    assert os.path.exists(filename)
+
+
+def test_graph_report_json(tmp_path):
+    db = MaigretDatabase()
+    filename = str(tmp_path / 'graph.json')
+    save_graph_report(filename, copy.deepcopy(TEST), db, report_format='json')
+
+    data = json.loads(open(filename).read())
+    nodes = {node['id']: node for node in data['nodes']}
+    edges = {tuple(edge) for edge in data['edges']}
+
+    assert nodes['username: alexaimephotography']['group'] == 1
+    assert 'account: https://www.instagram.com/alexaimephotography' in nodes
+    assert (
+        'account: https://www.instagram.com/alexaimephotography',
+        'username: alexaimephotography',
+    ) in edges
+    # one node for the value extracted from several accounts
+    assert len([n for n in nodes if n == 'fullname: alexaimephotography']) == 1
+    assert len(edges) == len(data['edges'])
+
+
+def test_graph_memoizes_url_ids():
+    db = MaigretDatabase()
+    calls = []
+    db.extract_ids_from_url = lambda url: calls.append(url) or {'alex': 'username'}
+    graph = MaigretGraph(db)
+
+    assert graph.get_url_ids('https://example.com/alex') == {'username': 'alex'}
+    assert graph.get_url_ids('https://example.com/alex') == {'username': 'alex'}
+    assert graph.get_url_ids(42) == {}
+    assert calls == ['https://example.com/alex']
+
+
+def test_graph_prune():
+    graph = MaigretGraph(MaigretDatabase())
+    username = graph.add_node('username', 'alex')
+    accounts = [
+        graph.add_node('account', f'https://site{i}.com/alex') for i in range(3)
+    ]
+    for account in accounts:
+        graph.link(username, account)
+    site = graph.add_node('site', 'Site0')
+    graph.link(accounts[0], site)
+    long_node = graph.add_node('bio', 'x' * 200)
+    graph.link(accounts[1], long_node)
+
+    graph.prune(max_nodes=2)
+
+    assert username in graph.nodes
+    assert site not in graph.nodes
+    assert long_node not in graph.nodes
+    assert len(graph.nodes) == 2
+    assert all(a in graph.nodes and b in graph.nodes for a, b in graph.edges)
@@ -1,6 +1,9 @@
 """Maigret Database test functions"""
 
-from maigret.sites import MaigretDatabase, MaigretSite
+import copy
+import json
+
+from maigret.sites import MaigretDatabase, MaigretSite, load_database
 
 EXAMPLE_DB = {
     'engines': {
@@ -72,6 +75,29 @@ def test_site_correct_initialization():
     assert amperka.check_type == 'message'
 
 
+def test_site_mutable_fields_are_not_shared():
+    first_site = MaigretSite('first', {})
+    second_site = MaigretSite('second', {})
+
+    first_site.tags.append('us')
+    first_site.stats['presense_flag'] = 'user'
+
+    assert second_site.tags == []
+    assert second_site.stats == {}
+
+
+def test_site_unknown_fields_round_trip():
+    db = MaigretDatabase()
+    db.load_from_json(EXAMPLE_DB)
+    amperka = db.sites[0]
+    amperka.update({'mirrors': ['https://amperka.com'], 'error_url': 'x'})
+
+    stripped_json = amperka.strip_engine_data().json
+    assert stripped_json['mirrors'] == ['https://amperka.com']
+    assert stripped_json['errorUrl'] == 'x'
+    assert 'absenceStrs' not in stripped_json
+
+
 def test_site_strip_engine_data():
     db = MaigretDatabase()
     db.load_from_json(EXAMPLE_DB)
@@ -220,3 +246,73 @@ def test_has_site_url_or_name(default_db):
     # false
     assert default_db.has_site("https://aeifgoai3h4g8a3u4g5") == False
     assert default_db.has_site("aeifgoai3h4g8a3u4g5") == False
+
+
+def test_update_site_replaces_and_reindexes():
+    db = MaigretDatabase()
+    db.load_from_json(EXAMPLE_DB)
+
+    site = db.sites_dict['Amperka']
+    assert db.has_site(site)
+    assert db.get_sites_by_tag('ru') == [site]
+    assert db.get_sites_by_engine('XenForo') == [site]
+    assert db.get_sites_by_domain('forum.amperka.ru') == [site]
+
+    new_site = MaigretSite(
+        'Amperka',
+        {
+            'urlMain': 'https://amperka.ru',
+            'url': 'https://amperka.ru/users/{username}',
+            'tags': ['us'],
+        },
+    )
+    db.update_site(new_site)
+
+    assert db.sites == [new_site]
+    assert db.get_site('Amperka') is new_site
+    assert db.get_sites_by_tag('ru') == []
+    assert db.get_sites_by_tag('us') == [new_site]
+    assert db.get_sites_by_engine('XenForo') == []
+    assert db.get_sites_by_domain('forum.amperka.ru') == []
+    assert db.get_sites_by_domain('amperka.ru') == [new_site]
+
+
+def test_extract_ids_from_url():
+    db = MaigretDatabase()
+    db.update_site(
+        MaigretSite('Example', {'url': 'https://example.com/users/{username}'})
+    )
+    db.update_site(MaigretSite('Subdomain', {'url': 'https://{username}.example.org'}))
+
+    assert db.extract_ids_from_url('https://www.example.com/users/alex') == {
+        'alex': 'username'
+    }
+    assert db.extract_ids_from_url('https://alex.example.org') == {'alex': 'username'}
+    assert db.extract_ids_from_url('https://example.net/users/alex') == {}
+    assert db.get_url_candidate_sites('https://example.net/users/alex') == [
+        db.get_site('Subdomain')
+    ]
+
+
+def test_load_database_cache(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB))
+
+    db = load_database(str(db_file))
+    assert db.sites_dict['Amperka'].engine_obj.name == 'XenForo'
+
+    # every load returns a separate copy
+    db.sites_dict['Amperka'].tags.append('forum')
+    db.sites_dict['Amperka'].disabled = True
+    other_db = load_database(str(db_file))
+    assert other_db.sites_dict['Amperka'].tags == ['ru']
+    assert other_db.sites_dict['Amperka'].disabled is False
+    assert other_db.get_sites_by_tag('ru') == [other_db.sites_dict['Amperka']]
+
+    # changes of the db file invalidate the cache
+    changed_db = copy.deepcopy(EXAMPLE_DB)
+    changed_db['sites']['Amperka']['tags'] = ['us', 'ru']
+    db_file.write_text(json.dumps(changed_db))
+
+    db = load_database(str(db_file))
+    assert db.sites_dict['Amperka'].tags == ['us', 'ru']
@@ -4,6 +4,7 @@ from maigret.submit import Submitter
 from aiohttp import ClientSession
 from maigret.sites import MaigretDatabase
 import logging
+import re
 
 
 @pytest.mark.slow
@@ -275,3 +276,48 @@ async def test_dialog_adds_site_negative(settings):
         await submitter.close()
 
     assert result is False
+
+
+@pytest.mark.asyncio
+async def test_check_features_manually_local(settings, httpserver):
+    httpserver.expect_request('/users/alice').respond_with_data(
+        '<div class="profile">\n"Followers"\n"alice"\n"Joined"\n</div>'
+    )
+    httpserver.expect_request(
+        re.compile('^/users/(?!alice$).+')
+    ).respond_with_data('<div class="profile">\n"User not found"\n</div>')
+
+    args = type('Args', (object,), {'proxy': None, 'cookie_file': None})()
+    submitter = Submitter(MaigretDatabase(), settings, logging.getLogger(), args)
+
+    presence_list, absence_list, status, random_username = (
+        await submitter.check_features_manually(
+            username='alice',
+            url_exists=httpserver.url_for('/users/alice'),
+            follow_redirects=False,
+            headers=None,
+        )
+    )
+    await submitter.close()
+
+    assert status == "Found"
+    assert set(presence_list) == {'Followers', 'Joined'}
+    assert absence_list == ['User not found']
+    assert random_username not in ''.join(presence_list + absence_list)
+    # all the pages of non-existing accounts are compared
+    assert len(httpserver.log) == 1 + Submitter.UNCLAIMED_PAGES_COUNT
+
+
+def test_get_features_diff(settings):
+    presence_list, absence_list = Submitter.get_features_diff(
+        '"Profile"\n"Profile"\n"Posts"\n"bob"',
+        ['"Not found"\n"random1"\n"Try again"', '"Not found"\n"random2"'],
+        'bob',
+        ['random1', 'random2'],
+        settings.presence_strings,
+    )
+
+    assert set(presence_list) == {'Profile', 'Posts'}
+    # the feature found on all the pages of non-existing accounts goes first
+    assert absence_list[0] == 'Not found'
+    assert set(absence_list) == {'Not found', 'Try again'}
@@ -0,0 +1,73 @@
+"""Maigret timings test functions"""
+
+from mock import Mock
+import pytest
+
+from maigret import search
+from maigret.errors import CheckError
+from maigret.result import MaigretCheckResult, MaigretCheckStatus
+from maigret.timings import ScanProfile
+
+
+def make_result(status, total, **kwargs):
+    return {
+        'status': MaigretCheckResult('alex', 'Site', '', status, **kwargs),
+        'timings': {'dns': 0.1, 'ttfb': total / 2, 'total': total, 'bytes': 100},
+    }
+
+
+def test_scan_profile():
+    profile = ScanProfile()
+    profile.add('Fast', make_result(MaigretCheckStatus.CLAIMED, 0.5))
+    profile.add('Fast', make_result(MaigretCheckStatus.AVAILABLE, 1.5))
+    profile.add(
+        'Slow "one"',
+        make_result(MaigretCheckStatus.UNKNOWN, 3, error=CheckError('Request timeout')),
+    )
+    # no request was made
+    profile.add('Illegal', {'status': Mock(), 'timings': {}})
+
+    assert profile.get_slowest() == ['Slow "one"', 'Fast']
+    assert profile.json['sites']['Fast'] == {
+        'checks': 2,
+        'errors': 0,
+        'statuses': {'Claimed': 1, 'Available': 1},
+        'bytes': 200,
+        'retries': 0,
+        'max_total': 1.5,
+        'avg_queue_wait': 0.0,
+        'avg_dns': 0.1,
+        'avg_connect': 0.0,
+        'avg_ttfb': 0.5,
+        'avg_total': 1.0,
+    }
+
+    prometheus = profile.to_prometheus()
+    assert '# TYPE maigret_site_checks_total counter' in prometheus
+    assert 'maigret_site_checks_total{site="Fast",status="Claimed"} 1' in prometheus
+    assert (
+        r'maigret_site_check_phase_seconds_total{site="Slow \"one\"",phase="total"} 3.000000'
+        in prometheus
+    )
+
+    assert profile.get_slowest_report(1).splitlines()[1].startswith('Slow "one": 3.00s')
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_check_timings(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    httpserver.expect_request('/url', query_string='id=claimed').respond_with_data(
+        'user profile', status=200
+    )
+
+    results = await search('claimed', site_dict=sites_dict, logger=Mock())
+
+    for result in results.values():
+        timings = result['timings']
+        assert timings['total'] >= timings['ttfb'] > 0
+        assert timings['queue_wait'] >= 0
+        assert timings['retries'] == 0
+        assert result['status'].query_time == timings['total']
+
+    assert results['Message']['timings']['bytes'] == len('user profile')
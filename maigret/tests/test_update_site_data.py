@@ -0,0 +1,104 @@
+"""Maigret sites ranks updater test functions"""
+
+import io
+import json
+import zipfile
+
+import pytest
+
+from utils.update_site_data import (
+    AlexaRankProvider,
+    RankProvider,
+    TrancoRankProvider,
+    fetch_ranks,
+    get_site_domain,
+    update_sites_ranks,
+)
+
+ALEXA_XML = '<ALEXA><SD><REACH RANK="{rank}"/></SD></ALEXA>'
+
+
+def alexa_url(httpserver):
+    return httpserver.url_for('/data') + '?url={domain}'
+
+
+def test_rank_provider_without_get_rank():
+    class NoRankProvider(RankProvider):
+        name = 'none'
+
+    with pytest.raises(TypeError):
+        NoRankProvider()
+
+
+def test_get_site_domain():
+    assert get_site_domain('https://www.github.com/') == 'github.com'
+    assert get_site_domain('http://localhost:8989/') == 'localhost'
+
+
+async def test_fetch_ranks_alexa(httpserver, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    for domain, rank in (('a.com', 10), ('b.com', 20)):
+        httpserver.expect_request(
+            '/data', query_string=f'url={domain}'
+        ).respond_with_data(ALEXA_XML.format(rank=rank))
+    httpserver.expect_request('/data', query_string='url=c.com').respond_with_data(
+        'no rank'
+    )
+
+    ranks = await fetch_ranks(
+        ['a.com', 'b.com', 'c.com', 'a.com'],
+        AlexaRankProvider(alexa_url(httpserver)),
+        checkpoint_file=checkpoint,
+    )
+
+    assert ranks == {'a.com': 10, 'b.com': 20, 'c.com': None}
+    assert len(httpserver.log) == 3
+    assert json.load(open(checkpoint))['ranks'] == ranks
+
+
+async def test_fetch_ranks_resume(httpserver, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    checkpoint.write_text(
+        json.dumps({'provider': 'alexa', 'ranks': {'a.com': 10, 'c.com': None}})
+    )
+    httpserver.expect_request('/data', query_string='url=b.com').respond_with_data(
+        ALEXA_XML.format(rank=20)
+    )
+
+    ranks = await fetch_ranks(
+        ['a.com', 'b.com', 'c.com'],
+        AlexaRankProvider(alexa_url(httpserver)),
+        checkpoint_file=str(checkpoint),
+    )
+
+    # only the rank missing in the checkpoint is fetched
+    assert ranks == {'a.com': 10, 'b.com': 20, 'c.com': None}
+    assert len(httpserver.log) == 1
+
+
+async def test_fetch_ranks_tranco(httpserver):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('top-1m.csv', '1,google.com\n2,a.com\n3,b.com\n')
+    httpserver.expect_request('/top-1m.csv.zip').respond_with_data(data.getvalue())
+
+    ranks = await fetch_ranks(
+        ['a.com', 'unknown.com'],
+        TrancoRankProvider(httpserver.url_for('/top-1m.csv.zip')),
+        checkpoint_file=None,
+    )
+
+    assert ranks == {'a.com': 2, 'unknown.com': None}
+    assert len(httpserver.log) == 1
+
+
+def test_update_sites_ranks(local_test_db):
+    status_site, message_site = local_test_db.sites
+    message_site.alexa_rank = 5
+
+    changed = update_sites_ranks(local_test_db.sites, {'localhost': 5})
+
+    # unknown ranks don't reset known ones
+    assert changed == [status_site]
+    assert status_site.alexa_rank == 5
+    assert update_sites_ranks(local_test_db.sites, {'localhost': None}) == []
@@ -10,6 +10,7 @@ from maigret.utils import (
     URLMatcher,
     get_dict_ascii_tree,
     get_match_ratio,
+    compile_regex,
 )
 
 
@@ -144,3 +145,25 @@ def test_get_match_ratio():
     fun = get_match_ratio(["test", "maigret", "username"])
 
     assert fun("test") == 1
+
+
+def test_compile_regex_is_cached():
+    regexp = compile_regex(r'^[a-z]+$')
+
+    assert regexp is compile_regex(r'^[a-z]+$')
+    assert regexp.search('maigret')
+    assert not regexp.search('Maigret')
+
+
+def test_get_match_ratio_is_max_ratio():
+    import difflib
+
+    base_strs = ["profile", "followers", "Last seen"]
+    fun = get_match_ratio(base_strs)
+
+    for s in ["Profile", "followed", "last_seen_at", "404", ""]:
+        expected = max(
+            difflib.SequenceMatcher(a=s.lower(), b=b.lower()).ratio()
+            for b in base_strs
+        )
+        assert fun(s) == round(expected, 2)
@@ -0,0 +1,152 @@
+"""Maigret web interface jobs test functions"""
+
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from maigret.web.jobs import (
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JobScheduler,
+    JobsQueueFull,
+)
+
+
+def wait_for(scheduler, job_id, timeout=5):
+    started = time.time()
+    while time.time() - started < timeout:
+        job = scheduler.get(job_id)
+        if job['status'] in (JOB_COMPLETED, JOB_FAILED):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def test_job_scheduler(tmp_path):
+    scheduler = JobScheduler(str(tmp_path / 'jobs.sqlite3'), workers=1)
+
+    def task(job_id, progress, usernames):
+        for i, _ in enumerate(usernames):
+            progress(i + 1, len(usernames), 'searching')
+        return {'job': job_id, 'usernames': usernames}
+
+    def failing_task(job_id, progress):
+        raise ValueError('no sites')
+
+    scheduler.submit('1', task, {'usernames': ['alex']}, ['alex', 'soxoj'])
+    scheduler.submit('2', failing_task, {})
+
+    job = wait_for(scheduler, '1')
+    assert job['status'] == JOB_COMPLETED
+    assert job['result'] == {'job': '1', 'usernames': ['alex', 'soxoj']}
+    assert job['params'] == {'usernames': ['alex']}
+    assert (job['stage'], job['done'], job['total']) == ('searching', 2, 2)
+
+    job = wait_for(scheduler, '2')
+    assert job['status'] == JOB_FAILED
+    assert job['error'] == 'no sites'
+
+    assert scheduler.get('3') is None
+
+
+def test_job_scheduler_queue_limit(tmp_path):
+    scheduler = JobScheduler(str(tmp_path / 'jobs.sqlite3'), workers=1, max_queued=1)
+    release = threading.Event()
+
+    def task(job_id, progress):
+        release.wait(5)
+        return {}
+
+    scheduler.submit('running', task, {})
+    # wait for the worker to take the first job
+    while scheduler.get('running')['status'] == JOB_QUEUED:
+        time.sleep(0.01)
+
+    scheduler.submit('queued', task, {})
+    assert scheduler.get('queued')['position'] == 1
+
+    with pytest.raises(JobsQueueFull):
+        scheduler.submit('rejected', task, {})
+    assert scheduler.get('rejected') is None
+
+    release.set()
+    assert wait_for(scheduler, 'queued')['status'] == JOB_COMPLETED
+
+
+def test_job_scheduler_retention(tmp_path):
+    db_file = str(tmp_path / 'jobs.sqlite3')
+    scheduler = JobScheduler(db_file, retention=0, files_folder=str(tmp_path))
+
+    def task(job_id, progress):
+        os.makedirs(tmp_path / f'search_{job_id}')
+        return {}
+
+    scheduler.submit('old', task, {})
+    wait_for(scheduler, 'old')
+    assert os.path.exists(tmp_path / 'search_old')
+
+    scheduler.cleanup()
+    assert scheduler.get('old') is None
+    assert not os.path.exists(tmp_path / 'search_old')
+
+
+def test_job_scheduler_recovery(tmp_path):
+    db_file = str(tmp_path / 'jobs.sqlite3')
+    scheduler = JobScheduler(db_file, workers=1)
+    release = threading.Event()
+
+    def task(job_id, progress):
+        release.wait(5)
+        return {}
+
+    scheduler.submit('running', task, {})
+    scheduler.submit('queued', task, {})
+
+    # jobs of the schedulers of other processes are left to them
+    other = JobScheduler(db_file)
+    other.start()
+    assert other.get('queued')['status'] == JOB_QUEUED
+
+    # unless they are not touched for the stale timeout
+    with scheduler.db:
+        scheduler.db.execute("UPDATE jobs SET updated_at = 0")
+    assert scheduler.recover() == 0
+    # checked by another scheduler on a request of a job
+    job = JobScheduler(db_file).get('queued')
+    assert job['status'] == JOB_FAILED
+    assert job['error'] == 'Interrupted by restart'
+    assert other.get('running')['status'] == JOB_FAILED
+    release.set()
+
+
+def test_search_error_fails_job(tmp_path):
+    from maigret.web import app
+
+    async def broken_batch(*args, **kwargs):
+        yield 'alex', 'username', {}
+        raise RuntimeError('connections pool is closed')
+
+    scheduler = JobScheduler(str(tmp_path / 'jobs.sqlite3'), workers=1)
+
+    def task(job_id, progress, usernames):
+        loop = asyncio.get_event_loop()
+        return {
+            'results': loop.run_until_complete(
+                app.search_multiple_usernames(usernames, {}, progress)
+            )
+        }
+
+    with patch.object(app, 'get_sites_for_search', lambda options: {}), patch(
+        'maigret.checking.maigret_batch', broken_batch
+    ):
+        scheduler.submit('1', task, {}, ['alex', 'soxoj'])
+        job = wait_for(scheduler, '1')
+
+    # the search is not saved as completed with the results of one username
+    assert job['status'] == JOB_FAILED
+    assert job['error'] == 'connections pool is closed'
@@ -1,28 +1,154 @@
 #!/usr/bin/env python3
-"""Maigret: Supported Site Listing with Alexa ranking and country tags
-This module generates the listing of supported sites in file `SITES.md`
-and pretty prints file with sites data.
+"""Maigret: detection of engines of supported sites
+This module fetches main pages of sites over a shared connections pool,
+matches them with signatures of all the engines at once and shows which
+sites could be moved to engines (and saves it with `--apply`).
 """
 import asyncio
 import json
 import logging
+import re
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from alive_progress import alive_bar
+
+from maigret.checking import close_checkers, setup_checkers
+from maigret.executors import AsyncioDynamicQueueExecutor
+from maigret.sites import MaigretDatabase, MaigretEngine, MaigretSite
+
+# engine markers are usually in the head of a page
+MAIN_PAGE_MAX_SIZE = 512 * 1024
+
+
+class EngineSignatures:
+    """
+    Presence strings of engines matched in a page in one pass: a page belongs
+    to the engine if all the strings of the engine are found in it.
+    """
+
+    def __init__(self, engines: Iterable[MaigretEngine]):
+        self.engines: List[Tuple[str, List[str]]] = []
+        for engine in engines:
+            markers = engine.__dict__.get("presenseStrs")
+            if markers:
+                self.engines.append((engine.name, markers))
+
+        # the most specific engines first: more and longer markers
+        self.engines.sort(key=lambda e: (len(e[1]), sum(map(len, e[1]))), reverse=True)
+
+        all_markers = sorted(
+            {m for _, markers in self.engines for m in markers}, key=len, reverse=True
+        )
+        self.regexp = re.compile('|'.join(map(re.escape, all_markers)))
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self.engines]
+
+    def match(self, html: str) -> List[str]:
+        """Returns names of matched engines, the most specific first"""
+        if not self.engines or not html:
+            return []
+
+        found = set(self.regexp.findall(html))
+        # markers overlapped by longer ones are not found by the regexp
+        return [
+            name
+            for name, markers in self.engines
+            if all(m in found or m in html for m in markers)
+        ]
+
+
+async def detect_engines(
+    sites: Iterable[MaigretSite],
+    signatures: EngineSignatures,
+    logger,
+    connections=100,
+    timeout=10,
+    proxy=None,
+    no_progressbar=False,
+) -> Dict[str, Optional[List[str]]]:
+    """
+    Returns names of matched engines by sites names, None if the main page
+    of the site is not available. Main pages shared by several sites are
+    fetched once.
+    """
+    checkers = setup_checkers(logger, proxy=proxy, max_connections=connections)
+    checker = checkers['']
+
+    sites_by_page: Dict[str, List[str]] = {}
+    for site in sites:
+        sites_by_page.setdefault(site.url_main, []).append(site.name)
+
+    # executor passes the task kwargs (default result) to the function
+    async def check_page(url, **kwargs):
+        checker.prepare(url=url, timeout=timeout, max_size=MAIN_PAGE_MAX_SIZE)
+        html, status_code, error = await checker.check()
+        if error or not html:
+            logger.info(f"Main page {url} is not available: {error or status_code}")
+            return url, None
+        return url, signatures.match(html)
+
+    executor = AsyncioDynamicQueueExecutor(
+        logger=logger, in_parallel=connections, timeout=timeout + 0.5
+    )
+    tasks = [(check_page, [url], {'default': (url, None)}) for url in sites_by_page]
+
+    results: Dict[str, Optional[List[str]]] = {}
+    try:
+        with alive_bar(
+            len(tasks), title='Detecting engines', force_tty=True, disable=no_progressbar
+        ) as progress:
+            async for url, engines in executor.run(tasks):
+                for site_name in sites_by_page[url]:
+                    results[site_name] = engines
+                progress()
+    finally:
+        await close_checkers(checkers)
+
+    return results
+
+
+def get_engines_diff(
+    sites: Dict[str, MaigretSite],
+    detected: Dict[str, Optional[List[str]]],
+    known_engines: List[str],
+) -> Dict[str, Dict[str, object]]:
+    """
+    Proposed engines of sites: the most specific matched engine, if the site
+    has no engine or its engine is detectable and doesn't match the page.
+    """
+    diff: Dict[str, Dict[str, object]] = {}
+    for site_name, engines in detected.items():
+        if not engines:
+            continue
 
-from maigret.maigret import get_response
-from maigret.sites import MaigretDatabase, MaigretEngine
+        old_engine = sites[site_name].engine
+        if old_engine in engines:
+            continue
+        # engines without signatures can't be confirmed or disproved
+        if old_engine and old_engine not in known_engines:
+            continue
 
-async def check_engine_of_site(site_name, sites_with_engines, future, engine_name, semaphore, logger):
-    async with semaphore:
-        response = await get_response(request_future=future,
-                                      site_name=site_name,
-                                      logger=logger)
+        diff[site_name] = {
+            "old": old_engine,
+            "new": engines[0],
+            "candidates": engines,
+        }
+    return diff
 
-        html_text, status_code, error_text, expection_text = response
 
-        if html_text and engine_name in html_text:
-            sites_with_engines.append(site_name)
-            return True
-    return False
+def apply_engines_diff(
+    db: MaigretDatabase, diff: Dict[str, Dict[str, object]]
+) -> MaigretDatabase:
+    for site_name, change in diff.items():
+        site = db.sites_dict[site_name]
+        engine = db.engines_dict[change["new"]]
+        site.engine = engine.name
+        site.update_from_engine(engine)
+        db.update_site(site.strip_engine_data())
+    return db
 
 
 if __name__ == '__main__':
@@ -33,10 +159,22 @@ if __name__ == '__main__':
                         help="JSON file with sites data to update.")
 
     parser.add_argument('--engine', '-e', help='check only selected engine', type=str)
+    parser.add_argument('--all', action='store_true', dest='check_all',
+                        help='check sites with engines too, to find wrong engines')
+    parser.add_argument('--connections', type=int, default=100,
+                        help='count of main pages fetched at the same time')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='time in seconds to wait for a main page')
+    parser.add_argument('--proxy', type=str, default=None,
+                        help='make requests over a proxy, e.g. socks5://127.0.0.1:1080')
+    parser.add_argument('--output', '-o', type=str, default=None,
+                        help='save proposed engines of sites to a JSON file')
+    parser.add_argument('--apply', action='store_true',
+                        help='save proposed engines of sites to the base file')
 
     args = parser.parse_args()
 
-    log_level = logging.INFO
+    log_level = logging.WARNING
     logging.basicConfig(
         format='[%(filename)s:%(lineno)d] %(levelname)-3s  %(asctime)s %(message)s',
         datefmt='%H:%M:%S',
@@ -45,100 +183,42 @@ if __name__ == '__main__':
     logger = logging.getLogger('engines-check')
     logger.setLevel(log_level)
 
-    db = MaigretDatabase()
-    sites_subset = db.load_from_file(args.base_file).sites
-    sites = {site.name: site for site in sites_subset}
-
-    with open(args.base_file, "r", encoding="utf-8") as data_file:
-        sites_info = json.load(data_file)
-        engines = sites_info['engines']
-
-    for engine_name, engine_data in engines.items():
-        if args.engine and args.engine != engine_name:
-            continue
-
-        if not 'presenseStrs' in engine_data:
-            print(f'No features to automatically detect sites on engine {engine_name}')
-            continue
-
-        engine_obj = MaigretEngine(engine_name, engine_data)
-
-        # setup connections for checking both engine and usernames
-        connector = aiohttp.TCPConnector(ssl=False)
-        connector.verify_ssl=False
-        session = aiohttp.ClientSession(connector=connector)
-
-        sem = asyncio.Semaphore(100)
-        loop = asyncio.get_event_loop()
-        tasks = []
-
-        # check sites without engine if they look like sites on this engine
-        new_engine_sites = []
-        for site_name, site_data in sites.items():
-            if site_data.engine:
-                continue
-
-            future = session.get(url=site_data.url_main,
-                                 allow_redirects=True,
-                                 timeout=10,
-                                 )
-
-            check_engine_coro = check_engine_of_site(site_name, new_engine_sites, future, engine_name, sem, logger)
-            future = asyncio.ensure_future(check_engine_coro)
-            tasks.append(future)
-
-        # progress bar
-        with alive_progress(len(tasks), title='Checking sites') as progress:
-            for f in asyncio.as_completed(tasks):
-                loop.run_until_complete(f)
-                progress()
-
-        print(f'Total detected {len(new_engine_sites)} sites on engine {engine_name}')
-        # dict with new found engine sites
-        new_sites = {site_name: sites[site_name] for site_name in new_engine_sites}
-
-        # update sites obj from engine
-        for site_name, site in new_sites.items():
-            site.request_future = None
-            site.engine = engine_name
-            site.update_from_engine(engine_obj)
-
-        async def update_site_data(site_name, site_data, all_sites, logger, no_progressbar):
-            updates = await site_self_check(site_name, site_data, logger, no_progressbar)
-            all_sites[site_name].update(updates)
-
-        tasks = []
-        # for new_site_name, new_site_data in new_sites.items():
-            # coro = update_site_data(new_site_name, new_site_data, new_sites, logger)
-            # future = asyncio.ensure_future(coro)
-            # tasks.append(future)
-
-        # asyncio.gather(*tasks)
-        for new_site_name, new_site_data in new_sites.items():
-            coro = update_site_data(new_site_name, new_site_data, new_sites, logger, no_progressbar=True)
-            loop.run_until_complete(coro)
-
-        updated_sites_count = 0
-
-        for s in new_sites:
-            site = new_sites[s]
-            site.request_future = None
-
-            if site.disabled:
-                print(f'{site.name} failed username checking of engine {engine_name}')
-                continue
-
-            site = site.strip_engine_data()
-
-            db.update_site(site)
-            updated_sites_count += 1
-            db.save_to_file(args.base_file)
-
-            print(f'Site "{s}": ' + json.dumps(site.json, indent=4))
-
-        print(f'Updated total {updated_sites_count} sites!')
-        print(f'Checking all sites on engine {engine_name}')
-
-        loop.run_until_complete(session.close())
-
-    print("\nFinished updating supported site listing!")
+    db = MaigretDatabase().load_from_file(args.base_file)
+    sites = db.sites_dict
+
+    engines = [e for e in db.engines if not args.engine or e.name == args.engine]
+    signatures = EngineSignatures(engines)
+    if not signatures.engines:
+        print('No features to automatically detect sites on the selected engines')
+        raise SystemExit(1)
+    print(f'Detecting engines {", ".join(signatures.names)}...')
+
+    sites_to_check = [s for s in sites.values() if args.check_all or not s.engine]
+    detected = asyncio.run(detect_engines(
+        sites_to_check,
+        signatures,
+        logger,
+        connections=args.connections,
+        timeout=args.timeout,
+        proxy=args.proxy,
+    ))
+
+    diff = get_engines_diff(sites, detected, signatures.names)
+    for site_name, change in sorted(diff.items()):
+        candidates = ', '.join(change['candidates'][1:])
+        note = f' (also matches {candidates})' if candidates else ''
+        print(f'{site_name} ({sites[site_name].url_main}): '
+              f'{change["old"] or "no engine"} -> {change["new"]}{note}')
+
+    unavailable = sum(1 for engines in detected.values() if engines is None)
+    print(f'\nChecked {len(detected)} sites, {unavailable} are not available, '
+          f'{len(diff)} engines changes are proposed')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(diff, f, indent=4)
+
+    if args.apply and diff:
+        apply_engines_diff(db, diff).save_to_file(args.base_file)
+        print(f'Engines of {len(diff)} sites are saved to {args.base_file}, '
+              'check them with `maigret --self-check --site <name>`')
@@ -1,92 +1,378 @@
 #!/usr/bin/env python3
-import json
+"""Maigret: batch import of new sites
+This module imports sites from a file with URLs, one per line: main pages
+of sites with known engines or profile URLs with `{username}` placeholder.
+
+All the pages are fetched concurrently over one pool of connections.
+Engines are detected by main pages, check types and markers of other sites
+are derived from pages of claimed and random usernames. Checks of claimed
+and unclaimed usernames of all the candidates are verified in parallel,
+and working sites are merged into the database file at once.
+
+Run from the root of the repository: `python3 -m utils.import_sites urls.txt`
+"""
+import asyncio
+import logging
 import random
 import re
-
-import alive_progress
-from mock import Mock
-import requests
-
-from maigret.maigret import *
+import sys
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from alive_progress import alive_bar
+
+from maigret.checking import (
+    close_checkers,
+    get_self_check_outcome,
+    get_site_slots,
+    make_failed_result,
+    setup_checkers,
+    site_self_check_probe,
+)
+from maigret.executors import AsyncioDynamicQueueExecutor, KeyedLimiter
+from maigret.health import SELF_CHECK_OK
 from maigret.result import MaigretCheckStatus
-from maigret.sites import MaigretSite
+from maigret.settings import Settings
+from maigret.sites import MaigretDatabase, MaigretSite, get_url_hosts
+from maigret.submit import Submitter
+from maigret.utils import generate_random_username
+from utils.check_engines import MAIN_PAGE_MAX_SIZE, EngineSignatures
 
 URL_RE = re.compile(r"https?://(www\.)?")
-TIMEOUT = 200
-
-
-async def maigret_check(site, site_data, username, status, logger):
-    query_notify = Mock()
-    logger.debug(f'Checking {site}...')
-
-    for username, status in [(username, status)]:
-        results = await maigret(
-            username,
-            {site: site_data},
-            logger,
-            query_notify,
-            timeout=TIMEOUT,
-            forced=True,
-            no_progressbar=True,
-        )
-
-        if results[site]['status'].status != status:
-            if results[site]['status'].status == MaigretCheckStatus.UNKNOWN:
-                msg = site_data.absence_strs
-                etype = site_data.check_type
-                context = results[site]['status'].context
-
-                logger.debug(f'Error while searching {username} in {site}, must be claimed. Context: {context}')
-                # if site_data.get('errors'):
-                #     continue
-                return False
-
-            if status == MaigretCheckStatus.CLAIMED:
-                logger.debug(f'Not found {username} in {site}, must be claimed')
-                logger.debug(results[site])
-                pass
-            else:
-                logger.debug(f'Found {username} in {site}, must be available')
-                logger.debug(results[site])
-                pass
-            return False
-
-    return site_data
-
-
-async def check_and_add_maigret_site(site_data, semaphore, logger, ok_usernames, bad_usernames):
-    async with semaphore:
-        sitename = site_data.name
-        positive = False
-        negative = False
-
-        for ok_username in ok_usernames:
-            site_data.username_claimed = ok_username
-            status = MaigretCheckStatus.CLAIMED
-            if await maigret_check(sitename, site_data, ok_username, status, logger):
-                # print(f'{sitename} positive case is okay')
-                positive = True
-                break
-
-        for bad_username in bad_usernames:
-            site_data.username_unclaimed = bad_username
-            status = MaigretCheckStatus.AVAILABLE
-            if await maigret_check(sitename, site_data, bad_username, status, logger):
-                # print(f'{sitename} negative case is okay')
-                negative = True
-                break
-
-        if positive and negative:
-            site_data = site_data.strip_engine_data()
-
-            db.update_site(site_data)
-            print(site_data.json)
-            try:
-                db.save_to_file(args.base_file)
-            except Exception as e:
-                logging.error(e, exc_info=True)
-            print(f'Saved new site {sitename}...')
-            ok_sites.append(site_data)
+USERNAME_PLACEHOLDER = "{username}"
+BAD_USERNAME = "noonewouldeverusethis7"
+# count of random usernames to derive absence markers
+RANDOM_USERNAMES_COUNT = 2
+
+Page = Tuple[Optional[str], int]
+
+
+def get_url_domain(url: str) -> str:
+    domain = URL_RE.sub("", url.lower()).strip().strip("/")
+    return domain.split("/")[0]
+
+
+def get_main_page_url(url: str) -> str:
+    return "/".join(url.split("/", 3)[:3])
+
+
+def get_new_urls(
+    urls: Iterable[str], db: MaigretDatabase, url_filter: str = "", logger=logging
+) -> Dict[str, str]:
+    """
+    Returns URLs of sites to import by their domains: sites already known
+    by the database domain index, duplicates and invalid URLs are skipped.
+    """
+    new_urls: Dict[str, str] = {}
+    for url in urls:
+        url = url.strip()
+        domain = get_url_domain(url)
+        if not domain or '"' in domain:
+            logger.debug(f"Invalid site {url}")
+            continue
+
+        if url_filter and url_filter not in domain:
+            logger.debug(f'Site {domain} skipped due to filtering by "{url_filter}"')
+            continue
+
+        if domain in new_urls:
+            continue
+
+        hosts = get_url_hosts(url.replace(USERNAME_PLACEHOLDER, "")) or [domain]
+        if any(db.get_sites_by_domain(host) for host in hosts):
+            logger.debug(f"Site {domain} already exists in the Maigret database!")
+            continue
+
+        new_urls[domain] = url
+    return new_urls
+
+
+async def fetch_pages(
+    urls: Iterable[str],
+    logger,
+    connections=100,
+    timeout=10,
+    proxy=None,
+    no_progressbar=False,
+) -> Dict[str, Page]:
+    """
+    Fetches pages concurrently, returns their texts and status codes,
+    text is None if the page is not available.
+    """
+    checkers = setup_checkers(logger, proxy=proxy, max_connections=connections)
+    checker = checkers['']
+
+    # executor passes the task kwargs (default result) to the function
+    async def fetch_page(url, **kwargs):
+        checker.prepare(url=url, timeout=timeout, max_size=MAIN_PAGE_MAX_SIZE)
+        html, status_code, error = await checker.check()
+        if error:
+            logger.info(f"Page {url} is not available: {error}")
+            return url, (None, status_code)
+        return url, (html, status_code)
+
+    executor = AsyncioDynamicQueueExecutor(
+        logger=logger, in_parallel=connections, timeout=timeout + 0.5
+    )
+    urls = list(dict.fromkeys(urls))
+    tasks = [(fetch_page, [url], {'default': (url, (None, 0))}) for url in urls]
+
+    pages: Dict[str, Page] = {}
+    try:
+        with alive_bar(
+            len(tasks), title='Fetching pages', force_tty=True, disable=no_progressbar
+        ) as progress:
+            async for url, page in executor.run(tasks):
+                pages[url] = page
+                progress()
+    finally:
+        await close_checkers(checkers)
+
+    return pages
+
+
+def make_engine_candidates(
+    domain: str,
+    url: str,
+    engines: List[str],
+    db: MaigretDatabase,
+    usernames: List[str],
+) -> List[MaigretSite]:
+    """Sites of the detected engines, one for every claimed username to try"""
+    candidates = []
+    for engine_name in engines:
+        for username in usernames:
+            site = MaigretSite(
+                domain,
+                {
+                    'urlMain': get_main_page_url(url),
+                    'usernameClaimed': username,
+                    'usernameUnclaimed': BAD_USERNAME,
+                },
+            )
+            site.update_from_engine(db.engines_dict[engine_name])
+            site.engine = engine_name
+            candidates.append(site)
+    return candidates
+
+
+def make_derived_candidates(
+    domain: str,
+    url: str,
+    pages: Dict[str, Page],
+    usernames: List[str],
+    random_usernames: List[str],
+    presence_strings: List[str],
+) -> List[MaigretSite]:
+    """
+    Sites with check types derived from profile pages: status codes check
+    if pages of random usernames are not found, otherwise markers check with
+    features of the token diff of the pages.
+    """
+    unclaimed_pages = [
+        pages.get(url.replace(USERNAME_PLACEHOLDER, u), (None, 0))
+        for u in random_usernames
+    ]
+    if any(html is None for html, _ in unclaimed_pages):
+        return []
+
+    candidates = []
+    for username in usernames:
+        profile_url = url.replace(USERNAME_PLACEHOLDER, username)
+        html, status = pages.get(profile_url, (None, 0))
+        if html is None:
+            continue
+
+        site_data = {
+            'url': url,
+            'urlMain': get_main_page_url(url),
+            'usernameClaimed': username,
+            'usernameUnclaimed': random_usernames[0],
+        }
+
+        if status == 200 and all(s >= 400 for _, s in unclaimed_pages):
+            site_data['checkType'] = 'status_code'
+        else:
+            presence_list, absence_list = Submitter.get_features_diff(
+                html,
+                [h for h, _ in unclaimed_pages],
+                username,
+                random_usernames,
+                presence_strings,
+            )
+            if not presence_list and not absence_list:
+                continue
+            site_data.update(
+                {
+                    'checkType': 'message',
+                    'presenseStrs': presence_list,
+                    'absenceStrs': absence_list,
+                }
+            )
+
+        candidates.append(MaigretSite(domain, site_data))
+    return candidates
+
+
+async def verify_sites(
+    candidates: List[MaigretSite],
+    logger,
+    connections=100,
+    timeout=10,
+    proxy=None,
+    no_progressbar=False,
+) -> List[bool]:
+    """
+    Checks claimed and unclaimed usernames of all the candidates in parallel,
+    returns whether both checks of every candidate are successful.
+    """
+    checkers = setup_checkers(logger, proxy=proxy, max_connections=connections)
+    limiter = KeyedLimiter()
+    options = {
+        "cookies": None,
+        "checkers": checkers,
+        "parsing": False,
+        "timeout": timeout,
+        "id_type": "username",
+        "forced": True,
+        "limiter": limiter,
+        "activator": None,
+        "max_connections_per_host": 0,
+    }
+
+    executor = AsyncioDynamicQueueExecutor(
+        logger=logger, in_parallel=connections, timeout=timeout + 0.5, limiter=limiter
+    )
+    tasks = []
+    for i, site in enumerate(candidates):
+        # candidates of the same site have the same name, index is the key
+        site_checks = [
+            (site.username_claimed, MaigretCheckStatus.CLAIMED),
+            (site.username_unclaimed, MaigretCheckStatus.AVAILABLE),
+        ]
+        for username, status in site_checks:
+            # the status is passed through the probe as is, with the index
+            key = (i, status)
+            default_result = make_failed_result(site, username)
+            tasks.append(
+                (
+                    site_self_check_probe,
+                    [site, username, key, options, logger],
+                    {
+                        'default': (site.name, username, key, default_result, 0.0),
+                        'slots': get_site_slots(site, options),
+                        'queued_at': time.monotonic(),
+                    },
+                )
+            )
+
+    outcomes: Dict[int, List[str]] = {}
+    try:
+        with alive_bar(
+            len(tasks), title='Verifying sites', force_tty=True, disable=no_progressbar
+        ) as progress:
+            async for _, username, (i, status), result, _ in executor.run(tasks):
+                site = candidates[i]
+                outcome = get_self_check_outcome(
+                    site, username, status, result["status"], logger, skip_errors=True
+                )
+                outcomes.setdefault(i, []).append(outcome)
+                progress()
+    finally:
+        await close_checkers(checkers)
+
+    return [outcomes.get(i, []) == [SELF_CHECK_OK] * 2 for i in range(len(candidates))]
+
+
+def merge_sites(db: MaigretDatabase, sites: Iterable[MaigretSite]) -> List[MaigretSite]:
+    """
+    Adds new sites to the database, the first site of every domain wins.
+    Returns the added sites.
+    """
+    added = []
+    for site in sites:
+        if site.name in db.sites_dict:
+            continue
+        site = site.strip_engine_data()
+        db.update_site(site)
+        added.append(site)
+    return added
+
+
+async def import_sites(
+    urls: Dict[str, str],
+    db: MaigretDatabase,
+    logger,
+    usernames: List[str],
+    presence_strings: List[str],
+    add_engine: Optional[str] = None,
+    only_engine: Optional[str] = None,
+    connections=100,
+    timeout=10,
+    proxy=None,
+    check_only=False,
+    no_progressbar=False,
+) -> List[MaigretSite]:
+    """
+    Keyword Arguments:
+    urls                   -- URLs of sites to import by domains, see get_new_urls.
+    usernames              -- Usernames supposed to be claimed on the sites,
+                              in order of preference.
+    add_engine             -- Engine to try for sites without detected engines.
+    only_engine            -- Engine to use only if it's among detected ones.
+    check_only             -- Don't verify and merge candidates, return them.
+
+    Return Value:
+    Verified sites added to the database (candidates if check_only is set).
+    """
+    random_usernames = [
+        generate_random_username() for _ in range(RANDOM_USERNAMES_COUNT)
+    ]
+
+    pages_urls = []
+    for url in urls.values():
+        pages_urls.append(get_main_page_url(url))
+        if USERNAME_PLACEHOLDER in url:
+            pages_urls.extend(
+                url.replace(USERNAME_PLACEHOLDER, u)
+                for u in usernames + random_usernames
+            )
+
+    pages = await fetch_pages(
+        pages_urls, logger, connections, timeout, proxy, no_progressbar
+    )
+
+    signatures = EngineSignatures(db.engines)
+    candidates: List[MaigretSite] = []
+    for domain, url in urls.items():
+        main_page, _ = pages.get(get_main_page_url(url), (None, 0))
+        engines = signatures.match(main_page) if main_page else []
+        for engine_name in engines:
+            logger.info(f"Detected engine {engine_name} for site {url}")
+
+        if only_engine and only_engine in engines:
+            engines = [only_engine]
+        elif not engines and add_engine:
+            logger.debug(f"Could not detect any engine, applying {add_engine}...")
+            engines = [add_engine]
+
+        if engines:
+            candidates += make_engine_candidates(domain, url, engines, db, usernames)
+        elif USERNAME_PLACEHOLDER in url:
+            candidates += make_derived_candidates(
+                domain, url, pages, usernames, random_usernames, presence_strings
+            )
+
+    print(f"Found {len(set(s.name for s in candidates))}/{len(urls)} new sites")
+    if check_only or not candidates:
+        return candidates
+
+    verified = await verify_sites(
+        candidates, logger, connections, timeout, proxy, no_progressbar
+    )
+    # candidates are in order of preference of engines and usernames
+    return merge_sites(db, [s for s, ok in zip(candidates, verified) if ok])
 
 
 if __name__ == '__main__':
@@ -110,6 +396,13 @@ if __name__ == '__main__':
 
     parser.add_argument('--username', help='preferable username to check with', type=str)
 
+    parser.add_argument('--connections', type=int, default=100,
+                        help='count of requests to sites at the same time')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='time in seconds to wait for a response')
+    parser.add_argument('--proxy', type=str, default=None,
+                        help='make requests over a proxy, e.g. socks5://127.0.0.1:1080')
+
     parser.add_argument(
         "--info",
         "-vv",
@@ -139,7 +432,7 @@ if __name__ == '__main__':
     parser.add_argument("urls_file",
                         metavar='URLS_FILE',
                         action="store",
-                        help="File with base site URLs"
+                        help="File with base site URLs or profile URLs with {username}"
                         )
 
     args = parser.parse_args()
@@ -157,126 +450,46 @@ if __name__ == '__main__':
         datefmt='%H:%M:%S',
         level=log_level
     )
-    logger = logging.getLogger('engines-check')
+    logger = logging.getLogger('import-sites')
     logger.setLevel(log_level)
 
-    db = MaigretDatabase()
-    sites_subset = db.load_from_file(args.base_file).sites
-    sites = {site.name: site for site in sites_subset}
-    engines = db.engines
+    settings = Settings()
+    settings.load()
+
+    db = MaigretDatabase().load_from_file(args.base_file)
 
     # TODO: usernames extractors
-    ok_usernames = ['alex', 'god', 'admin', 'red', 'blue', 'john']
+    ok_usernames = list(settings.supposed_usernames)
     if args.username:
         ok_usernames = [args.username] + ok_usernames
 
-    bad_usernames = ['noonewouldeverusethis7']
-
     with open(args.urls_file, 'r') as urls_file:
         urls = urls_file.read().splitlines()
         if args.random:
             random.shuffle(urls)
         urls = urls[:args.top]
 
-    raw_maigret_data = json.dumps({site.name: site.json for site in sites_subset})
-
-    new_sites = []
-    for site in alive_progress.alive_it(urls):
-        site_lowercase = site.lower()
-
-        domain_raw = URL_RE.sub('', site_lowercase).strip().strip('/')
-        domain_raw = domain_raw.split('/')[0]
-
-        if args.filter and args.filter not in domain_raw:
-            logger.debug('Site %s skipped due to filtering by "%s"', domain_raw, args.filter)
-            continue
-
-        if domain_raw in raw_maigret_data:
-            logger.debug(f'Site {domain_raw} already exists in the Maigret database!')
-            continue
-
-        if '"' in domain_raw:
-            logger.debug(f'Invalid site {domain_raw}')
-            continue
-
-        main_page_url = '/'.join(site.split('/', 3)[:3])
-
-        site_data = {
-            'url': site,
-            'urlMain': main_page_url,
-            'name': domain_raw,
-        }
-
-        try:
-            r = requests.get(main_page_url, timeout=5)
-        except:
-            r = None
-            pass
-
-        detected_engines = []
-
-        for e in engines:
-            strs_to_check = e.__dict__.get('presenseStrs')
-            if strs_to_check and r and r.text:
-                all_strs_in_response = True
-                for s in strs_to_check:
-                    if not s in r.text:
-                        all_strs_in_response = False
-                if all_strs_in_response:
-                    engine_name = e.__dict__.get('name')
-                    detected_engines.append(engine_name)
-                    logger.info(f'Detected engine {engine_name} for site {main_page_url}')
-
-        if args.only_engine and args.only_engine in detected_engines:
-            detected_engines = [args.only_engine]
-        elif not detected_engines and args.add_engine:
-            logging.debug('Could not detect any engine, applying default engine %s...', args.add_engine)
-            detected_engines = [args.add_engine]
-
-        def create_site_from_engine(sitename, data, e):
-            site = MaigretSite(sitename, data)
-            site.update_from_engine(db.engines_dict[e])
-            site.engine = e
-            return site
-
-        for engine_name in detected_engines:
-            site = create_site_from_engine(domain_raw, site_data, engine_name)
-            new_sites.append(site)
-            logger.debug(site.json)
-
-            # if engine_name == "phpBB":
-            #     site_data_with_subpath = dict(site_data)
-            #     site_data_with_subpath["urlSubpath"] = "/forum"
-            #     site = create_site_from_engine(domain_raw, site_data_with_subpath, engine_name)
-            #     new_sites.append(site)
-
-        # except Exception as e:
-        #     print(f'Error: {str(e)}')
-        #     pass
-
-    print(f'Found {len(new_sites)}/{len(urls)} new sites')
+    new_urls = get_new_urls(urls, db, args.filter, logger)
+
+    sites = asyncio.run(import_sites(
+        new_urls,
+        db,
+        logger,
+        ok_usernames,
+        settings.presence_strings,
+        add_engine=args.add_engine,
+        only_engine=args.only_engine,
+        connections=args.connections,
+        timeout=args.timeout,
+        proxy=args.proxy,
+        check_only=args.check,
+    ))
 
     if args.check:
-        for s in new_sites:
+        for s in sites:
             print(s.url_main)
         sys.exit(0)
 
-    sem = asyncio.Semaphore(20)
-    loop = asyncio.get_event_loop()
-
-    ok_sites = []
-    tasks = []
-    for site in new_sites:
-        check_coro = check_and_add_maigret_site(site, sem, logger, ok_usernames, bad_usernames)
-        future = asyncio.ensure_future(check_coro)
-        tasks.append(future)
-
-    with alive_progress(len(tasks), title='Checking sites') as progress:
-        for f in asyncio.as_completed(tasks):
-            progress()
-        try:
-            loop.run_until_complete(f)
-        except asyncio.exceptions.TimeoutError:
-            pass
-
-    print(f'Found and saved {len(ok_sites)} sites!')
+    if sites:
+        db.save_to_file(args.base_file)
+    print(f'Found and saved {len(sites)} sites!')
@@ -2,15 +2,29 @@
 """Maigret: Supported Site Listing with Alexa ranking and country tags
 This module generates the listing of supported sites in file `SITES.md`
 and pretty prints file with sites data.
+
+Ranks are fetched concurrently over one pool of connections from a rank
+provider. Fetched ranks are saved to a checkpoint file, so an interrupted
+update is resumed from the last fetched site.
 """
-import sys
-import requests
+import asyncio
+import csv
+import io
+import json
 import logging
-import threading
+import os
+import sys
 import xml.etree.ElementTree as ET
+import zipfile
+from abc import ABC, abstractmethod
 from datetime import datetime, timezone
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
 
+from maigret.executors import AsyncioDynamicQueueExecutor
 from maigret.maigret import MaigretDatabase
 
 RANKS = {str(i):str(i) for i in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 50, 100, 500]}
@@ -24,36 +38,181 @@ RANKS.update({
     '100000000': '100M',
 })
 
-SEMAPHORE = threading.Semaphore(20)
+ALEXA_URL = "http://data.alexa.com/data?cli=10&url={domain}"
+TRANCO_URL = "https://tranco-list.eu/top-1m.csv.zip"
+
+CHECKPOINT_FILE = "update_site_data.checkpoint.json"
+# count of fetched ranks between checkpoint saves
+CHECKPOINT_EVERY = 100
+
+
+class RankProvider(ABC):
+    """
+    Source of sites ranks, `get_rank` returns the rank of the domain
+    or None if it's unknown.
+    """
+
+    name = ""
 
+    def __init__(self, url: Optional[str] = None):
+        self.url = url
 
-def get_rank(domain_to_query, site, print_errors=True):
-    with SEMAPHORE:
-        # Retrieve ranking data via alexa API
-        url = f"http://data.alexa.com/data?cli=10&url={domain_to_query}"
-        xml_data = requests.get(url).text
-        root = ET.fromstring(xml_data)
+    async def prepare(self, session: aiohttp.ClientSession, domains: List[str]):
+        """Called once before getting ranks of the domains"""
+        pass
+
+    @abstractmethod
+    async def get_rank(
+        self, session: aiohttp.ClientSession, domain: str
+    ) -> Optional[int]:
+        pass
+
+
+class AlexaRankProvider(RankProvider):
+    """Rank of every domain is requested from the Alexa XML API"""
+
+    name = "alexa"
+
+    async def get_rank(self, session, domain):
+        url = (self.url or ALEXA_URL).format(domain=domain)
+        async with session.get(url) as response:
+            xml_data = await response.text()
 
         try:
-            #Get ranking for this site.
-            site.alexa_rank = int(root.find('.//REACH').attrib['RANK'])
-            # country = root.find('.//COUNTRY')
-            # if not country is None and country.attrib:
-            #     country_code = country.attrib['CODE']
-            #     tags = set(site.tags)
-            #     if country_code:
-            #         tags.add(country_code.lower())
-            #     site.tags = sorted(list(tags))
-            #     if site.type != 'username':
-            #         site.disabled = False
-        except Exception as e:
-            if print_errors:
-                logging.error(e)
-                # We did not find the rank for some reason.
-                print(f"Error retrieving rank information for '{domain_to_query}'")
-                print(f"     Returned XML is |{xml_data}|")
+            # Get ranking for this site.
+            return int(ET.fromstring(xml_data).find('.//REACH').attrib['RANK'])
+        except Exception:
+            # We did not find the rank for some reason.
+            logging.debug(f"No rank for '{domain}' in returned XML |{xml_data}|")
+            return None
+
 
+class TrancoRankProvider(RankProvider):
+    """
+    Ranks are taken from the Tranco top sites list downloaded once,
+    the list is a CSV file of `rank,domain` lines, may be zipped.
+    """
+
+    name = "tranco"
+
+    def __init__(self, url: Optional[str] = None):
+        super().__init__(url)
+        self.ranks: Dict[str, int] = {}
+
+    async def prepare(self, session, domains):
+        async with session.get(self.url or TRANCO_URL) as response:
+            response.raise_for_status()
+            data = await response.read()
+
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                data = archive.read(archive.namelist()[0])
+
+        # only ranks of the needed domains are kept from the big list
+        needed = set(domains)
+        for row in csv.reader(io.StringIO(data.decode('utf-8'))):
+            if len(row) == 2 and row[1] in needed:
+                self.ranks[row[1]] = int(row[0])
+
+    async def get_rank(self, session, domain):
+        return self.ranks.get(domain)
+
+
+RANK_PROVIDERS = {p.name: p for p in (AlexaRankProvider, TrancoRankProvider)}
+
+
+def get_site_domain(url_main: str) -> str:
+    host = urlparse(url_main).hostname or url_main
+    return host[4:] if host.startswith('www.') else host
+
+
+def load_checkpoint(filename: str, provider_name: str) -> Dict[str, Optional[int]]:
+    """Returns ranks fetched by the same provider before the interruption"""
+    if not filename or not os.path.exists(filename):
+        return {}
+    with open(filename, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("provider") != provider_name:
+        return {}
+    return data.get("ranks", {})
+
+
+def save_checkpoint(filename: str, provider_name: str, ranks: Dict[str, Optional[int]]):
+    if not filename:
         return
+    # the checkpoint is replaced at once to survive interruptions while saving
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        json.dump({"provider": provider_name, "ranks": ranks}, f)
+    os.replace(tmp_filename, filename)
+
+
+async def fetch_ranks(
+    domains: Iterable[str],
+    provider: RankProvider,
+    connections: int = 20,
+    timeout: float = 10,
+    checkpoint_file: Optional[str] = CHECKPOINT_FILE,
+    progress=None,
+) -> Dict[str, Optional[int]]:
+    """
+    Fetches ranks of domains concurrently, ranks from the checkpoint file
+    are not fetched again. Returns ranks of all the domains, None if the rank
+    is unknown or fetching has failed.
+    """
+    ranks = load_checkpoint(checkpoint_file, provider.name)
+    domains_to_fetch = [d for d in dict.fromkeys(domains) if d not in ranks]
+
+    # executor passes the task kwargs (default result) to the function
+    async def get_rank(session, domain, **kwargs):
+        try:
+            return domain, await provider.get_rank(session, domain)
+        except Exception as e:
+            logging.error(f"Error retrieving rank information for '{domain}': {e}")
+            return domain, None
+
+    connector = aiohttp.TCPConnector(limit=connections, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        await provider.prepare(session, domains_to_fetch)
+
+        executor = AsyncioDynamicQueueExecutor(
+            logger=logging.getLogger("update_site_data"),
+            in_parallel=connections,
+            timeout=timeout + 0.5,
+        )
+        tasks = (
+            (get_rank, [session, domain], {'default': (domain, None)})
+            for domain in domains_to_fetch
+        )
+
+        try:
+            fetched = 0
+            async for domain, rank in executor.run(tasks):
+                ranks[domain] = rank
+                fetched += 1
+                if fetched % CHECKPOINT_EVERY == 0:
+                    save_checkpoint(checkpoint_file, provider.name, ranks)
+                if progress:
+                    progress(fetched, len(domains_to_fetch))
+        finally:
+            save_checkpoint(checkpoint_file, provider.name, ranks)
+
+    return ranks
+
+
+def update_sites_ranks(sites, ranks: Dict[str, Optional[int]]) -> list:
+    """Sets fetched ranks to sites, returns the sites with changed ranks"""
+    changed_sites = []
+    for site in sites:
+        rank = ranks.get(get_site_domain(site.url_main))
+        # keep the known rank if it can't be fetched now
+        if rank is None or rank == site.alexa_rank:
+            continue
+        site.alexa_rank = rank
+        changed_sites.append(site)
+    return changed_sites
 
 
 def get_step_rank(rank):
@@ -67,6 +226,48 @@ def get_step_rank(rank):
         return get_readable_rank(list(filter(lambda x: x >= rank, valid_step_ranks))[0])
 
 
+def get_sites_listing(db: MaigretDatabase) -> str:
+    sites_subset = db.sites
+    text = f"""
+## List of supported sites (search methods): total {len(sites_subset)}\n
+Rank data fetched from Alexa by domains.
+
+"""
+    # sites without rank are at the end of the list
+    sites_full_list = sorted(
+        sites_subset, key=lambda s: (not s.alexa_rank, int(s.alexa_rank))
+    )
+
+    for site in sites_full_list:
+        url_main = site.url_main
+        valid_rank = get_step_rank(int(site.alexa_rank))
+        all_tags = sorted(site.tags)
+        tags = ', ' + ', '.join(all_tags) if all_tags else ''
+        note = ''
+        if site.disabled:
+            note = ', search is disabled'
+
+        favicon = f"![](https://www.google.com/s2/favicons?domain={url_main})"
+        text += f'1. {favicon} [{site}]({url_main})*: top {valid_rank}{tags}*{note}\n'
+
+    text += f'\nThe list was updated at ({datetime.now(timezone.utc).date()})\n'
+    text += '## Statistics\n\n'
+    text += db.get_db_stats(is_markdown=True)
+    return text
+
+
+def is_listing_changed(filename: str, text: str) -> bool:
+    """Compares listings ignoring the date of update"""
+    if not os.path.exists(filename):
+        return True
+
+    def strip_date(listing):
+        return [l for l in listing.splitlines() if not l.startswith('The list was updated at')]
+
+    with open(filename, encoding="utf-8") as f:
+        return strip_date(f.read()) != strip_date(text)
+
+
 def main():
     parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter
                             )
@@ -78,8 +279,16 @@ def main():
     parser.add_argument('--empty-only', help='update only sites without rating', action='store_true')
     parser.add_argument('--exclude-engine', help='do not update score with certain engine',
                         action="append", dest="exclude_engine_list", default=[])
-
-    pool = list()
+    parser.add_argument('--provider', choices=sorted(RANK_PROVIDERS), default='alexa',
+                        help='source of sites ranks')
+    parser.add_argument('--provider-url', default=None,
+                        help='URL of the rank provider, e.g. a local mirror of the list')
+    parser.add_argument('--connections', type=int, default=20,
+                        help='count of requests to the rank provider at the same time')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='time in seconds to wait for a rank')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE,
+                        help='file with fetched ranks to resume an interrupted update')
 
     args = parser.parse_args()
 
@@ -88,63 +297,46 @@ def main():
 
     print(f"\nUpdating supported sites list (don't worry, it's needed)...")
 
-    with open("sites.md", "w") as site_file:
-        site_file.write(f"""
-## List of supported sites (search methods): total {len(sites_subset)}\n
-Rank data fetched from Alexa by domains.
+    changed_sites = []
+    if args.with_rank:
+        sites_to_update = [
+            site for site in sites_subset
+            if not (site.alexa_rank < sys.maxsize and args.empty_only)
+            and not (args.exclude_engine_list and site.engine in args.exclude_engine_list)
+        ]
+        provider = RANK_PROVIDERS[args.provider](args.provider_url)
 
-""")
-
-        for site in sites_subset:
-            if not args.with_rank:
-                break
-            url_main = site.url_main
-            if site.alexa_rank < sys.maxsize and args.empty_only:
-                continue
-            if args.exclude_engine_list and site.engine in args.exclude_engine_list:
-                continue
-            site.alexa_rank = 0
-            th = threading.Thread(target=get_rank, args=(url_main, site,))
-            pool.append((site.name, url_main, th))
-            th.start()
-
-        if args.with_rank:
-            index = 1
-            for site_name, url_main, th in pool:
-                th.join()
-                sys.stdout.write("\r{0}".format(f"Updated {index} out of {len(sites_subset)} entries"))
-                sys.stdout.flush()
-                index = index + 1
-
-        sites_full_list = [(s, int(s.alexa_rank)) for s in sites_subset]
-
-        sites_full_list.sort(reverse=False, key=lambda x: x[1])
-
-        while sites_full_list[0][1] == 0:
-            site = sites_full_list.pop(0)
-            sites_full_list.append(site)
-
-        for num, site_tuple in enumerate(sites_full_list):
-            site, rank = site_tuple
-            url_main = site.url_main
-            valid_rank = get_step_rank(rank)
-            all_tags = site.tags
-            all_tags.sort()
-            tags = ', ' + ', '.join(all_tags) if all_tags else ''
-            note = ''
-            if site.disabled:
-                note = ', search is disabled'
-
-            favicon = f"![](https://www.google.com/s2/favicons?domain={url_main})"
-            site_file.write(f'1. {favicon} [{site}]({url_main})*: top {valid_rank}{tags}*{note}\n')
+        def progress(done, total):
+            sys.stdout.write(f"\rUpdated {done} out of {total} entries")
+            sys.stdout.flush()
+
+        ranks = asyncio.run(fetch_ranks(
+            [get_site_domain(site.url_main) for site in sites_to_update],
+            provider,
+            connections=args.connections,
+            timeout=args.timeout,
+            checkpoint_file=args.checkpoint,
+            progress=progress,
+        ))
+        print()
+
+        changed_sites = update_sites_ranks(sites_to_update, ranks)
+        for site in changed_sites:
             db.update_site(site)
+        print(f"Ranks of {len(changed_sites)} sites are changed")
 
-        site_file.write(f'\nThe list was updated at ({datetime.now(timezone.utc).date()})\n')
+    # sites data is rewritten only if something is changed
+    if changed_sites:
         db.save_to_file(args.base_file)
 
-        statistics_text = db.get_db_stats(is_markdown=True)
-        site_file.write('## Statistics\n\n')
-        site_file.write(statistics_text)
+    listing = get_sites_listing(db)
+    if is_listing_changed("sites.md", listing):
+        with open("sites.md", "w") as site_file:
+            site_file.write(listing)
+
+    # the update is finished, nothing to resume
+    if args.with_rank and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
 
     print("Finished updating supported site listing!")
 
@@ -6,13 +6,15 @@ import io
 import logging
 import os
 import re
+import shutil
 import subprocess
 import sys
+import time
 
 from contextlib import redirect_stdout
 from datetime import datetime
 from os import path
-from tempfile import gettempdir
+from tempfile import gettempdir, mkdtemp
 from unittest.mock import patch
 
 import pytest
@@ -28,6 +30,16 @@ RESOURCES_DIR = path.join(path.abspath(path.dirname(__file__)), "resources")
 
 settings.MAX_FILES_PER_DIRECTORY = 1
 
+# input file making the extraction process crash, see test_file_processing_crash
+CRASHING_FILE = "crash.html"
+
+
+def crashing_file_chunk(files, counter, timeout):
+    "Process a chunk of files in a worker process, exit on the crashing file."
+    if any(path.basename(f[0]) == CRASHING_FILE for f in files):
+        os._exit(1)
+    return cli_utils.process_file_chunk(files, counter, timeout)
+
 
 def test_parser():
     """test argument parsing for the command-line interface"""
@@ -407,6 +419,120 @@ def test_file_processing():
     settings.MAX_FILES_PER_DIRECTORY = backup
 
 
+def test_file_processing_resume():
+    "Test the manifest of processed files and the file walker."
+    files = list(cli_utils.generate_filestats(RESOURCES_DIR))
+    filelist = cli_utils.generate_filelist(RESOURCES_DIR)
+    assert sorted(f[0] for f in files) == sorted(filelist)
+    assert all(f[1] == os.path.getsize(f[0]) for f in files)
+
+    tmp_dir = mkdtemp()
+    manifest = path.join(tmp_dir, "manifest.txt")
+    testargs = [
+        "",
+        "--parallel",
+        "2",
+        "--input-dir",
+        RESOURCES_DIR,
+        "-o",
+        path.join(tmp_dir, "out"),
+        "--manifest",
+        manifest,
+    ]
+    with patch.object(sys, "argv", testargs):
+        args = cli.parse_args(testargs)
+    assert cli_utils.file_processing_pipeline(args) == 0
+    assert cli_utils.load_manifest(manifest) == {f[0] for f in files}
+    outputs = os.listdir(path.join(tmp_dir, "out"))
+    assert outputs
+
+    # nothing left to do on the next run
+    shutil.rmtree(path.join(tmp_dir, "out"))
+    assert cli_utils.file_processing_pipeline(args) == 0
+    assert not path.exists(path.join(tmp_dir, "out"))
+    shutil.rmtree(tmp_dir)
+
+
+def test_file_processing_timeout():
+    "Test that extractions taking too long are stopped and errors are reported."
+    testargs = ["", "--input-dir", RESOURCES_DIR]
+    with patch.object(sys, "argv", testargs):
+        args = cli.parse_args(testargs)
+    cli_utils.init_extraction_worker(settings.args_to_extractor(args), args)
+    filename = path.join(RESOURCES_DIR, "utf8.html")
+    files = (
+        (filename, 1000, time.time(), None, None),
+        ("does-not-exist.html", 1000, time.time(), None, None),
+    )
+
+    def slow_processing(*args, **kwargs):
+        time.sleep(30)
+
+    start = time.time()
+    with patch("trafilatura.cli_utils.document_extraction", slow_processing):
+        failed = cli_utils.process_file_chunk(files, -1, 1)
+    assert failed[0] == (filename, "timeout") and failed[1][0] == "does-not-exist.html"
+    assert time.time() - start < 10
+
+    # results are written without time limit, so that no file is left truncated
+    def slow_writing(*args, **kwargs):
+        time.sleep(2)
+
+    with patch("trafilatura.cli_utils.write_result", slow_writing):
+        failed = cli_utils.process_file_chunk(files[:1], -1, 1)
+    assert not failed
+
+    # the existing file is read, the other one leads to an error
+    failed = cli_utils.process_file_chunk(files, -1, 1)
+    assert len(failed) == 1 and failed[0][0] == "does-not-exist.html"
+
+
+def test_file_processing_crash():
+    "Test that crashed extraction processes are replaced and the faulty file isolated."
+    tmp_dir = mkdtemp()
+    input_dir = path.join(tmp_dir, "input")
+    os.makedirs(input_dir)
+    for name in ("apache.html", "scam.html", "utf8.html"):
+        shutil.copy(path.join(RESOURCES_DIR, name), input_dir)
+    shutil.copy(
+        path.join(RESOURCES_DIR, "utf8.html"), path.join(input_dir, CRASHING_FILE)
+    )
+    manifest = path.join(tmp_dir, "manifest.txt")
+    testargs = [
+        "",
+        "--input-dir",
+        input_dir,
+        "-o",
+        path.join(tmp_dir, "out"),
+        "--manifest",
+        manifest,
+    ]
+    with patch.object(sys, "argv", testargs):
+        args = cli.parse_args(testargs)
+
+    # the workers import the crashing function from this module
+    with patch.object(
+        cli_utils, "process_file_chunk", crashing_file_chunk
+    ), patch.object(cli_utils.LOGGER, "error") as log_error:
+        assert cli_utils.file_processing_pipeline(args) == 1
+    errors = [
+        call.args[1]
+        for call in log_error.call_args_list
+        if call.args[0].startswith("file processing error")
+    ]
+    assert errors == [path.join(input_dir, CRASHING_FILE)]
+
+    # every file is processed once, the faulty one is not retried on the next run
+    with open(manifest, "r", encoding="utf-8") as f:
+        recorded = f.read().splitlines()
+    assert sorted(recorded) == sorted(
+        path.join(input_dir, name) for name in os.listdir(input_dir)
+    )
+    # the other files are extracted
+    assert os.listdir(path.join(tmp_dir, "out"))
+    shutil.rmtree(tmp_dir)
+
+
 def test_cli_config_file():
     "Test if the configuration file is loaded correctly from the CLI."
     testargs = ["", "--input-dir", "/dev/null", "--config-file", "newsettings.cfg"]
@@ -595,6 +721,9 @@ if __name__ == "__main__":
     test_sysoutput()
     test_cli_pipeline()
     test_file_processing()
+    test_file_processing_resume()
+    test_file_processing_timeout()
+    test_file_processing_crash()
     test_cli_config_file()
     test_crawling()
     test_download()
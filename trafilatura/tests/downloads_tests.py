@@ -6,6 +6,7 @@ Unit tests for download functions from the trafilatura library.
 import gzip
 import logging
 import os
+import shutil
 import sys
 import zlib
 
@@ -21,6 +22,11 @@ try:
 except ImportError:
     HAS_ZSTD = False
 
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Thread
 from time import sleep
 from unittest.mock import patch
 
@@ -33,13 +39,16 @@ from trafilatura.cli_utils import (download_queue_processing,
                                    url_processing_pipeline)
 from trafilatura.core import Extractor, extract
 import trafilatura.downloads
-from trafilatura.downloads import (DEFAULT_HEADERS, HAS_PYCURL, USER_AGENT, Response,
+from trafilatura.downloads import (DEFAULT_HEADERS, HAS_AIOHTTP, HAS_PYCURL,
+                                   USER_AGENT, Response, _buffered_downloads,
                                    _determine_headers, _handle_response,
                                    _parse_config, _pycurl_is_live_page,
                                    _send_pycurl_request, _send_urllib_request,
                                    _urllib3_is_live_page,
-                                   add_to_compressed_dict, fetch_url,
-                                   is_live_page, load_download_buffer)
+                                   add_to_compressed_dict, buffered_downloads,
+                                   buffered_response_downloads, fetch_url,
+                                   is_live_page, load_download_buffer,
+                                   store_downloads)
 from trafilatura.settings import DEFAULT_CONFIG, args_to_extractor, use_config
 from trafilatura.utils import decode_file, handle_compressed_file, load_html
 
@@ -277,6 +286,118 @@ def test_queue():
     assert len(results[0]) == 5 and results[1] is -1
 
 
+class LocalHandler(BaseHTTPRequestHandler):
+    "Serve HTML pages for /page paths and 404 errors otherwise."
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status = 200 if self.path.startswith("/page") else 404
+        text = " ".join([self.path] * 50)
+        body = f"<html><body><article><p>{text}</p></article></body></html>".encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_server():
+    "Run a local HTTP server in a thread and return its base URL."
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_buffered_downloads_refill():
+    "Downloads are submitted continuously, all results are returned once."
+    def worker(url):
+        sleep(0.01 if url.endswith("0") else 0)
+        return url.upper()
+
+    urls = [f"https://example.org/{i}" for i in range(50)]
+    results = dict(_buffered_downloads(iter(urls), 4, worker, max_pending=5))
+    assert results == {u: u.upper() for u in urls}
+
+
+@pytest.mark.skipif(not HAS_AIOHTTP, reason="aiohttp not installed")
+def test_async_downloads():
+    "The async backend returns the same results as the threaded one."
+    with local_server() as base_url:
+        urls = [f"{base_url}/page{i}" for i in range(20)] + [f"{base_url}/missing"]
+        threaded = dict(buffered_downloads(urls, 4, options=DEFAULT_OPTS))
+        asynchronous = dict(
+            buffered_downloads(urls, 4, options=DEFAULT_OPTS, backend="async")
+        )
+        assert asynchronous == threaded
+        assert asynchronous[f"{base_url}/missing"] is None
+        assert "/page3" in asynchronous[f"{base_url}/page3"]
+
+        responses = dict(
+            buffered_response_downloads(urls[-2:], 2, options=DEFAULT_OPTS, backend="async")
+        )
+        response = responses[f"{base_url}/missing"]
+        assert isinstance(response, Response) and response.status == 404
+        assert response.url == f"{base_url}/missing" and response.html is None
+
+        # leaving the loop early stops the downloads
+        for _ in buffered_downloads(urls, 2, options=DEFAULT_OPTS, backend="async"):
+            break
+
+
+@pytest.mark.skipif(not HAS_AIOHTTP, reason="aiohttp not installed")
+def test_store_downloads():
+    "URL stores are downloaded with domain-based back-off by both backends."
+    config = use_config()
+    config.set("DEFAULT", "SLEEP_TIME", "0.05")
+    options = Extractor(config=config)
+
+    with local_server() as base_url:
+        other_url = base_url.replace("127.0.0.1", "localhost")
+        urls = [f"{u}/page{i}" for u in (base_url, other_url) for i in range(5)]
+        for backend in ("threads", "async"):
+            url_store = add_to_compressed_dict(urls)
+            results = dict(
+                store_downloads(url_store, 4, options=options, backend=backend)
+            )
+            assert sorted(results) == sorted(urls)
+            assert all(results.values())
+            assert url_store.done
+
+
+def test_download_pipeline():
+    "Extraction in parallel processes writes the same files as in the main process."
+    tmp_path = Path(mkdtemp())
+    with local_server() as base_url:
+        urls = [f"{base_url}/page{i}" for i in range(12)] + [f"{base_url}/missing"]
+        outputs = []
+        for parallel in ("1", "2"):
+            output_dir = tmp_path / parallel
+            testargs = ["", "--parallel", parallel, "-o", str(output_dir)]
+            with patch.object(sys, "argv", testargs):
+                args = parse_args(testargs)
+            options = args_to_extractor(args)
+            options.config["DEFAULT"]["SLEEP_TIME"] = "0"
+            url_store = add_to_compressed_dict(urls)
+            # use worker processes even on a single core
+            with patch("trafilatura.cli_utils.CPU_COUNT", 2):
+                errors, counter = download_queue_processing(url_store, args, 0, options)
+            assert errors == [f"{base_url}/missing"] and counter == 12
+            outputs.append(
+                {f.name: f.read_text() for f in output_dir.rglob("*.txt")}
+            )
+    assert len(outputs[0]) == 12 and outputs[0] == outputs[1]
+    shutil.rmtree(tmp_path)
+
+
 if __name__ == '__main__':
     test_response_object()
     test_is_live_page()
@@ -286,3 +407,7 @@ if __name__ == '__main__':
     test_config()
     test_decode()
     test_queue()
+    test_buffered_downloads_refill()
+    test_async_downloads()
+    test_store_downloads()
+    test_download_pipeline()
@@ -0,0 +1,179 @@
+"""
+Unit tests for WARC reading and writing.
+"""
+
+import gzip
+import io
+import logging
+import os
+import shutil
+import sys
+
+from argparse import Namespace
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+from trafilatura import cli, cli_utils
+from trafilatura.warc import (
+    HTML_RECORD_TYPES,
+    WarcWriter,
+    decode_chunked,
+    is_warc_file,
+    iterate_warc_file,
+    make_warc_record,
+    read_warc,
+)
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+TEST_DIR = os.path.abspath(os.path.dirname(__file__))
+RESOURCES_DIR = os.path.join(TEST_DIR, "resources")
+
+HTML = (
+    b"<html><body><article><p>"
+    + b"Archived text. " * 20
+    + b"</p></article></body></html>"
+)
+
+
+def make_response(body, headers=b"Content-Type: text/html\r\n", status=b"200 OK"):
+    "Make a WARC response record with an HTTP message."
+    http = b"HTTP/1.1 " + status + b"\r\n" + headers + b"\r\n" + body
+    return make_warc_record(
+        "response", http, "application/http; msgtype=response", "https://example.org/"
+    )
+
+
+def test_records():
+    """Test reading the web pages contained in records"""
+    assert is_warc_file("dump/CC-MAIN-00000.warc.gz") and is_warc_file("a.WARC")
+    assert not is_warc_file("page.html.gz")
+
+    request = make_warc_record(
+        "request", b"GET / HTTP/1.1\r\n\r\n", "application/http; msgtype=request"
+    )
+    body = gzip.compress(HTML)
+    chunked = b"%x\r\n" % len(body) + body + b"\r\n0\r\n\r\n"
+    records = [
+        request,
+        make_response(HTML),
+        make_response(
+            chunked,
+            b"Content-Type: text/html\r\nTransfer-Encoding: chunked\r\nContent-Encoding: gzip\r\n",
+        ),
+        make_response(HTML, status=b"404 Not Found"),
+        make_response(b"\x89PNG", b"Content-Type: image/png\r\n"),
+        make_warc_record("resource", HTML, "text/html", "https://example.org/res"),
+    ]
+    data = b"".join(records)
+
+    # uncompressed file: offsets of the records
+    results = list(read_warc(io.BytesIO(data), HTML_RECORD_TYPES))
+    assert [r.type for r in results] == ["response"] * 4 + ["resource"]
+    assert results[0].offset == len(request)
+    assert results[1].offset == len(request) + len(records[1])
+    assert [r.get_html() for r in results] == [HTML, HTML, None, None, HTML]
+    assert results[0].url == "https://example.org/"
+    assert results[0].get_timestamp() > 0
+    assert len(list(read_warc(io.BytesIO(data)))) == len(records)
+
+    # one gzip member per record: offsets of the members
+    members = [gzip.compress(r) for r in records]
+    results = list(read_warc(io.BytesIO(b"".join(members)), HTML_RECORD_TYPES))
+    assert [r.offset for r in results] == [
+        sum(len(m) for m in members[:i]) for i in range(1, len(records))
+    ]
+    assert [r.get_html() for r in results] == [HTML, HTML, None, None, HTML]
+
+    # a whole compressed file is a single member
+    results = list(read_warc(io.BytesIO(gzip.compress(data)), HTML_RECORD_TYPES))
+    assert len(results) == 5 and {r.offset for r in results} == {0}
+
+    # broken files
+    truncated = b"".join(members)[: -len(members[-1]) // 2]
+    assert len(list(read_warc(io.BytesIO(truncated)))) == len(records) - 1
+    assert not list(read_warc(io.BytesIO(b"<html></html>")))
+    assert decode_chunked(b"<html></html>") == b"<html></html>"
+
+
+def test_writer():
+    """Test writing backups to WARC files and reading them again"""
+    tmp_dir = mkdtemp()
+    writer = WarcWriter(tmp_dir, max_size=1000)
+    locations = [writer.write(HTML, url=f"https://example.org/{i}") for i in range(10)]
+    writer.close()
+    assert len(os.listdir(tmp_dir)) > 1
+
+    for filename in sorted(os.listdir(tmp_dir)):
+        filepath = os.path.join(tmp_dir, filename)
+        records = list(iterate_warc_file(filepath))
+        assert [(filepath, r.offset) for r in records] == [
+            l for l in locations if l[0] == filepath
+        ]
+        # records can be read directly from their offset
+        with open(filepath, "rb") as f:
+            for record in records:
+                f.seek(record.offset)
+                assert next(read_warc(f)).url == record.url
+                assert record.get_html() == HTML
+    shutil.rmtree(tmp_dir)
+
+
+def test_cli_warc():
+    """Test WARC backups and WARC files as input of the command-line interface"""
+    tmp_dir = mkdtemp()
+    backup_dir = os.path.join(tmp_dir, "backup")
+    testargs = ["", "--backup-dir", backup_dir, "--backup-format", "warc"]
+    with patch.object(sys, "argv", testargs):
+        args = cli.parse_args(testargs)
+    for name in ("apache.html", "scam.html", "utf8.html"):
+        with open(os.path.join(RESOURCES_DIR, name), "r", encoding="utf-8") as f:
+            cli_utils.write_extraction(
+                f.read(), None, args, -1, f"https://example.org/{name}"
+            )
+    cli_utils.close_backup_writers()
+    assert not cli_utils.BACKUP_WRITERS
+    backups = os.listdir(backup_dir)
+    assert len(backups) == 1 and backups[0].endswith(".warc.gz")
+    urls = [r.url for r in iterate_warc_file(os.path.join(backup_dir, backups[0]))]
+    assert urls == [
+        "https://example.org/apache.html",
+        "https://example.org/scam.html",
+        "https://example.org/utf8.html",
+    ]
+
+    # HTML files by default, also for arguments not coming from the parser
+    html_dir = os.path.join(tmp_dir, "html")
+    assert cli_utils.archive_html("<html></html>", Namespace(backup_dir=html_dir))
+    assert os.listdir(html_dir)[0].endswith(".html.gz")
+
+    # archived pages are processed like files
+    testargs = [
+        "",
+        "--input-dir",
+        backup_dir,
+        "-o",
+        os.path.join(tmp_dir, "out"),
+        "--json",
+        "--with-metadata",
+    ]
+    with patch.object(sys, "argv", testargs):
+        args = cli.parse_args(testargs)
+    documents = list(cli_utils.generate_input_documents(backup_dir))
+    assert [d[3] for d in documents] == urls
+    assert all(
+        d[0].startswith(os.path.join(backup_dir, backups[0]) + "#") for d in documents
+    )
+    assert cli_utils.file_processing_pipeline(args) == 0
+    outputs = os.listdir(os.path.join(tmp_dir, "out"))
+    assert outputs
+    for output in outputs:
+        with open(os.path.join(tmp_dir, "out", output), "r", encoding="utf-8") as f:
+            assert '"source": "https://example.org/' in f.read()
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    test_records()
+    test_writer()
+    test_cli_warc()
@@ -14,6 +14,7 @@ from .cli_utils import (cli_crawler, cli_discovery, examine,
                         file_processing_pipeline, load_blacklist,
                         load_input_dict, probe_homepage,
                         url_processing_pipeline, write_result)
+from .downloads import DOWNLOAD_BACKENDS
 from .settings import PARALLEL_CORES, SUPPORTED_FMT_CLI
 
 
@@ -40,7 +41,7 @@ def add_args(parser: Any) -> Any:
                         help="name of input file for batch processing",
                         type=str)
     group1_ex.add_argument("--input-dir",
-                        help="read files from a specified directory (relative path)",
+                        help="read files from a specified directory (relative path), including WARC files",
                         type=str)
     group1_ex.add_argument("-u", "--URL",
                         help="custom URL download",
@@ -49,6 +50,12 @@ def add_args(parser: Any) -> Any:
     group1.add_argument('--parallel',
                         help="specify a number of cores/threads for downloads and/or processing",
                         type=int, default=PARALLEL_CORES)
+    group1.add_argument('--download-backend',
+                        help="download with a thread pool or asynchronously with keep-alive connections (requires aiohttp)",
+                        choices=DOWNLOAD_BACKENDS, default="threads")
+    group1.add_argument('--manifest',
+                        help="list processed files of the input directory in this file and skip them on the next run",
+                        type=str)
     group1.add_argument('-b', '--blacklist',
                         help="file containing unwanted URLs to discard during processing",
                         type=str)
@@ -62,6 +69,9 @@ def add_args(parser: Any) -> Any:
     group2.add_argument('--backup-dir',
                         help="preserve a copy of downloaded files in a backup directory",
                         type=str)
+    group2.add_argument('--backup-format',
+                        help="write the backup copies as compressed HTML files or as records of WARC files",
+                        choices=["html", "warc"], default="html")
     group2.add_argument('--keep-dirs',
                         help="keep input directory structure and file names",
                         action="store_true")
@@ -223,7 +233,7 @@ def process_args(args: Any) -> None:
 
     # read files from an input directory
     elif args.input_dir:
-        file_processing_pipeline(args)
+        exit_code = file_processing_pipeline(args)
 
     # read url list from input file or process input URL
     elif args.input_file or args.URL:
@@ -8,20 +8,34 @@ try:
 except ImportError:
     HAS_GZIP = False
 
+import atexit
 import logging
 import random
 import re
+import signal
 import string
 import sys
 import traceback
 
 from base64 import urlsafe_b64encode
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from functools import partial
-from os import makedirs, path, stat, walk
+from itertools import chain, islice
+from multiprocessing import get_all_start_methods, get_context
+from os import makedirs, path, scandir, stat, walk
 from threading import RLock
-from typing import Any, Generator, Optional, List, Set, Tuple
+from time import perf_counter
+from typing import Any, Deque, Dict, Generator, Optional, List, Set, Tuple
 
 from courlan import UrlStore, extract_domain, get_base_url  # validate_url
 
@@ -34,12 +48,12 @@ from .downloads import (
     Response,
     add_to_compressed_dict,
     buffered_downloads,
-    buffered_response_downloads,
-    load_download_buffer
+    store_downloads,
 )
 from .feeds import find_feed_urls
 from .meta import reset_caches
 from .settings import (
+    CPU_COUNT,
     Extractor,
     FILENAME_LEN,
     MAX_FILES_PER_DIRECTORY,
@@ -53,6 +67,7 @@ from .utils import (
     language_classifier,
     make_chunks,
 )
+from .warc import WarcWriter, is_warc_file, iterate_warc_file
 
 
 LOGGER = logging.getLogger(__name__)
@@ -67,6 +82,25 @@ CLEAN_XML = re.compile(r"<[^<]+?>")
 
 INPUT_URLS_ARGS = ["URL", "crawl", "explore", "probe", "feed", "sitemap"]
 
+# extraction processes are not forked from the process running download threads
+EXTRACTION_START_METHOD = (
+    "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+)
+
+# name of a file or of a WARC record with its offset, size, reference timestamp,
+# URL and content for archived documents
+InputDocument = Tuple[str, int, float, Optional[str], Optional[bytes]]
+
+# extractions waiting for their turn to be written, per extraction process
+PENDING_EXTRACTIONS = 4
+
+# files sent at once to an extraction process, a divisor of MAX_FILES_PER_DIRECTORY
+FILES_PER_TASK = 10
+# tasks run by an extraction process before it is replaced (Python >= 3.11)
+TASKS_PER_CHILD = 100
+# throughput is logged every time this number of files has been processed
+REPORT_EVERY = 10000
+
 EXTENSION_MAPPING = {
     "csv": ".csv",
     "json": ".json",
@@ -186,8 +220,36 @@ def determine_output_path(
     return output_path, destination_dir
 
 
-def archive_html(htmlstring: str, args: Any, counter: int = -1) -> str:
-    "Write a copy of raw HTML in backup directory."
+# WARC files receiving backups, by backup directory
+BACKUP_WRITERS: Dict[str, WarcWriter] = {}
+BACKUP_LOCK = RLock()
+
+
+def archive_warc(htmlstring: str, backup_dir: str, url: Optional[str] = None) -> None:
+    "Write a copy of raw HTML as a record of a WARC file in backup directory."
+    with BACKUP_LOCK:
+        if backup_dir not in BACKUP_WRITERS:
+            BACKUP_WRITERS[backup_dir] = WarcWriter(backup_dir)
+        BACKUP_WRITERS[backup_dir].write(htmlstring.encode("utf-8"), url=url)
+
+
+@atexit.register
+def close_backup_writers() -> None:
+    "Close the WARC files receiving backups, new backups go to new files."
+    with BACKUP_LOCK:
+        for writer in BACKUP_WRITERS.values():
+            writer.close()
+        BACKUP_WRITERS.clear()
+
+
+def archive_html(
+    htmlstring: str, args: Any, counter: int = -1, url: Optional[str] = None
+) -> str:
+    """Write a copy of raw HTML in backup directory, return the name of the file
+    or an empty string if it is written to a WARC file."""
+    if getattr(args, "backup_format", "html") == "warc":
+        archive_warc(htmlstring, args.backup_dir, url)
+        return ""
     destination_directory = determine_counter_dir(args.backup_dir, counter)
     output_path, filename = get_writable_path(destination_directory, ".html.gz")
     # check the directory status
@@ -227,35 +289,126 @@ def generate_filelist(inputdir: str) -> Generator[str, None, None]:
             yield path.join(root, fname)
 
 
+def generate_filestats(inputdir: str) -> Generator[Tuple[str, int, float], None, None]:
+    """Walk the directory tree like generate_filelist() and output file names
+    along with their size and reference timestamp, files are stat-ed once."""
+    directories = [inputdir]
+    while directories:
+        directory = directories.pop()
+        subdirectories = []
+        try:
+            with scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        file_stat = entry.stat()
+                        yield entry.path, file_stat.st_size, min(
+                            file_stat.st_ctime, file_stat.st_mtime
+                        )
+        except OSError as err:
+            LOGGER.error("cannot read directory %s: %s", directory, err)
+        directories.extend(reversed(subdirectories))
+
+
 def file_processing(
-    filename: str, args: Any, counter: int = -1, options: Optional[Extractor] = None
+    filename: str,
+    args: Any,
+    counter: int = -1,
+    options: Optional[Extractor] = None,
+    ref_timestamp: Optional[float] = None,
 ) -> None:
     "Aggregated functions to process a file in a list."
-    if not options:
-        options = args_to_extractor(args)
-    options.source = filename
+    htmlstring, ref_timestamp = read_input_file(filename, ref_timestamp)
+    document_processing(htmlstring, filename, args, counter, options, ref_timestamp)
 
+
+def read_input_file(
+    filename: str, ref_timestamp: Optional[float] = None
+) -> Tuple[bytes, float]:
+    "Read a file and determine its reference timestamp if it is not known."
     with open(filename, "rb") as inputf:
         htmlstring = inputf.read()
 
-    file_stat = stat(filename)
-    ref_timestamp = min(file_stat.st_ctime, file_stat.st_mtime)
+    if ref_timestamp is None:
+        file_stat = stat(filename)
+        ref_timestamp = min(file_stat.st_ctime, file_stat.st_mtime)
+    return htmlstring, ref_timestamp
+
+
+def document_extraction(
+    htmlstring: bytes,
+    source: str,
+    args: Any,
+    options: Optional[Extractor],
+    ref_timestamp: float,
+) -> Optional[str]:
+    "Extract a document read from a file or from a WARC archive."
+    if not options:
+        options = args_to_extractor(args)
+    options.source = source
     options.date_params["max_date"] = datetime.fromtimestamp(ref_timestamp).strftime(
         "%Y-%m-%d"
     )
+    return examine(htmlstring, args, options=options)
 
-    result = examine(htmlstring, args, options=options)
-    write_result(result, args, filename, counter, new_filename=None)
+
+def document_processing(
+    htmlstring: bytes,
+    source: str,
+    args: Any,
+    counter: int,
+    options: Optional[Extractor],
+    ref_timestamp: float,
+) -> None:
+    "Extract a document read from a file or from a WARC archive and write the result."
+    result = document_extraction(htmlstring, source, args, options, ref_timestamp)
+    write_result(result, args, source, counter, new_filename=None)
+
+
+def generate_input_documents(
+    inputdir: str,
+) -> Generator[InputDocument, None, None]:
+    """Output the files of the input directory, web pages archived in WARC files
+    are read sequentially and output one by one along with their URL."""
+    for filename, size, ref_timestamp in generate_filestats(inputdir):
+        if not is_warc_file(filename):
+            yield filename, size, ref_timestamp, None, None
+            continue
+        try:
+            for record in iterate_warc_file(filename):
+                htmlstring = record.get_html()
+                if htmlstring is not None:
+                    yield (
+                        f"{filename}#{record.offset}",
+                        len(htmlstring),
+                        record.get_timestamp() or ref_timestamp,
+                        record.url,
+                        htmlstring,
+                    )
+        except OSError as err:
+            LOGGER.error("cannot read WARC file %s: %s", filename, err)
 
 
 def process_result(
     htmlstring: str, args: Any, counter: int, options: Optional[Extractor]
 ) -> int:
     "Extract text and metadata from a download webpage and eventually write out the result."
-    # backup option
-    fileslug = archive_html(htmlstring, args, counter) if args.backup_dir else ""
-    # process
     result = examine(htmlstring, args, options=options)
+    url = options.url if options else None
+    return write_extraction(htmlstring, result, args, counter, url)
+
+
+def write_extraction(
+    htmlstring: str,
+    result: Optional[str],
+    args: Any,
+    counter: int,
+    url: Optional[str] = None,
+) -> int:
+    "Back up a downloaded webpage, write out its extraction result and update the file counter."
+    # backup option
+    fileslug = archive_html(htmlstring, args, counter, url) if args.backup_dir else ""
     write_result(
         result, args, orig_filename=fileslug, counter=counter, new_filename=fileslug
     )
@@ -265,19 +418,48 @@ def process_result(
     return counter
 
 
+# extraction options and arguments of a worker process, sent once when it is started
+WORKER_OPTIONS: Optional[Extractor] = None
+WORKER_ARGS: Any = None
+
+
+def init_extraction_worker(options: Extractor, args: Any = None) -> None:
+    "Store the extraction options and the arguments in a worker process."
+    global WORKER_OPTIONS, WORKER_ARGS
+    WORKER_OPTIONS = options
+    WORKER_ARGS = args
+
+
+def extract_download(htmlstring: str, url: str) -> Optional[str]:
+    "Extraction stage of the download pipeline, run in a worker process."
+    options = WORKER_OPTIONS
+    options.url = url  # type: ignore[union-attr]
+    return examine(htmlstring, None, options=options)
+
+
+def get_extraction_workers(args: Any, options: Extractor) -> int:
+    """Number of processes extracting downloaded pages in parallel,
+    0 to extract them in the main process."""
+    # the cache of duplicate detection has to be shared by all documents
+    if options.dedup:
+        return 0
+    workers = min(args.parallel, CPU_COUNT)
+    return workers if workers > 1 else 0
+
+
 def download_queue_processing(
     url_store: UrlStore, args: Any, counter: int, options: Extractor
 ) -> Tuple[List[str], int]:
-    "Implement a download queue consumer, single- or multi-threaded."
+    """Implement a download queue consumer, multi-threaded or asynchronous.
+    Downloaded pages are extracted in parallel processes if possible."""
     errors = []
-    sleep_time = options.config.getfloat("DEFAULT", "SLEEP_TIME")
-
-    while not url_store.done:
-        bufferlist, url_store = load_download_buffer(url_store, sleep_time)
-        # process downloads
-        for url, result in buffered_downloads(
-            bufferlist, args.parallel, options=options
-        ):
+    downloads = store_downloads(
+        url_store, args.parallel, options=options, backend=args.download_backend
+    )
+    workers = get_extraction_workers(args, options)
+
+    if not workers:
+        for url, result in downloads:
             # handle result
             if result and isinstance(result, str):
                 options.url = url
@@ -285,6 +467,41 @@ def download_queue_processing(
             else:
                 LOGGER.warning("No result for URL: %s", url)
                 errors.append(url)
+        return errors, counter
+
+    # results are written in download order, the same way as above;
+    # downloads wait if there are too many pending extractions
+    pending: Deque[Tuple[str, str, "Future[Optional[str]]"]] = deque()
+
+    def write_next(counter: int) -> int:
+        url, htmlstring, future = pending.popleft()
+        try:
+            result = future.result()
+        except Exception as err:
+            LOGGER.error("extraction error: %s %s", url, err)
+            result = None
+        return write_extraction(htmlstring, result, args, counter, url)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context(EXTRACTION_START_METHOD),
+        initializer=init_extraction_worker,
+        initargs=(options,),
+    ) as executor:
+        for url, result in downloads:
+            if result and isinstance(result, str):
+                future = executor.submit(extract_download, result, url)
+                pending.append((url, result, future))
+            else:
+                LOGGER.warning("No result for URL: %s", url)
+                errors.append(url)
+            while pending and (
+                len(pending) >= PENDING_EXTRACTIONS * workers or pending[0][2].done()
+            ):
+                counter = write_next(counter)
+        while pending:
+            counter = write_next(counter)
+
     return errors, counter
 
 
@@ -357,7 +574,6 @@ def cli_crawler(
     """Start a focused crawler which downloads a fixed number of URLs within a website
     and prints the links found in the process."""
     options = options or args_to_extractor(args)
-    sleep_time = options.config.getfloat("DEFAULT", "SLEEP_TIME")
     param_dict = {}
 
     # load input URLs
@@ -380,15 +596,15 @@ def cli_crawler(
             # ...
 
     # iterate until the threshold is reached
-    while not spider.URL_STORE.done:
-        bufferlist, spider.URL_STORE = load_download_buffer(
-            spider.URL_STORE, sleep_time
-        )
-        for url, result in buffered_response_downloads(
-            bufferlist, args.parallel, options=options
-        ):
-            if result and isinstance(result, Response):
-                spider.process_response(result, param_dict[get_base_url(url)])
+    for url, result in store_downloads(
+        spider.URL_STORE,
+        args.parallel,
+        options=options,
+        decode=False,
+        backend=args.download_backend,
+    ):
+        if result and isinstance(result, Response):
+            spider.process_response(result, param_dict[get_base_url(url)])
         # early exit if maximum count is reached
         if any(c >= n for c in spider.URL_STORE.get_all_counts()):
             break
@@ -402,7 +618,7 @@ def probe_homepage(args: Any) -> None:
     options = args_to_extractor(args)
 
     for url, result in buffered_downloads(
-        input_urls, args.parallel, options=options
+        input_urls, args.parallel, options=options, backend=args.download_backend
     ):
         if result is not None:
             result = html2txt(result)
@@ -441,49 +657,223 @@ def url_processing_pipeline(args: Any, url_store: UrlStore) -> int:
     url_count = url_store.total_url_number()
     counter = 0 if url_count > MAX_FILES_PER_DIRECTORY else -1
 
-    # download strategy
-    errors, counter = download_queue_processing(url_store, args, counter, options)
-    LOGGER.debug("%s / %s URLs could not be found", len(errors), url_count)
+    try:
+        # download strategy
+        errors, counter = download_queue_processing(url_store, args, counter, options)
+        LOGGER.debug("%s / %s URLs could not be found", len(errors), url_count)
+
+        if args.archived is True:
+            url_store = UrlStore()
+            url_store.add_urls(["https://web.archive.org/web/20/" + e for e in errors])
+            if len(url_store.find_known_urls("https://web.archive.org")) > 0:
+                archived_errors, _ = download_queue_processing(
+                    url_store, args, counter, options
+                )
+                LOGGER.debug(
+                    "%s archived URLs out of %s could not be found",
+                    len(archived_errors),
+                    len(errors),
+                )
+                # pass information along if URLs are missing
+                return _define_exit_code(archived_errors, url_store.total_url_number())
+    finally:
+        close_backup_writers()
 
-    if args.archived is True:
-        url_store = UrlStore()
-        url_store.add_urls(["https://web.archive.org/web/20/" + e for e in errors])
-        if len(url_store.find_known_urls("https://web.archive.org")) > 0:
-            archived_errors, _ = download_queue_processing(
-                url_store, args, counter, options
-            )
-            LOGGER.debug(
-                "%s archived URLs out of %s could not be found",
-                len(archived_errors),
-                len(errors),
+    return _define_exit_code(errors, url_count)
+
+
+class ExtractionTimeout(BaseException):
+    """Raised in a worker process when a file takes too long to process,
+    not an Exception so that the safeguards in examine() don't catch it."""
+
+
+# counter, input documents, whether the documents are retried
+FileTask = Tuple[int, Tuple[InputDocument, ...], bool]
+
+
+def _raise_timeout(signum: int, frame: Any) -> None:
+    raise ExtractionTimeout
+
+
+def process_file_chunk(
+    files: Tuple[InputDocument, ...], counter: int, timeout: int
+) -> List[Tuple[str, str]]:
+    """Process a chunk of files or archived documents in a worker process, each one
+    read and extracted within the time limit (on platforms with SIGALRM), return
+    the ones which failed with the reason."""
+    args, options = WORKER_ARGS, WORKER_OPTIONS
+    use_alarm = timeout > 0 and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+    failed = []
+    for filename, size, ref_timestamp, url, htmlstring in files:
+        options.url = url  # type: ignore[union-attr]
+        # spare reading files which would be discarded anyway
+        if not is_acceptable_length(size, options):
+            continue
+        try:
+            if use_alarm:
+                signal.alarm(timeout)
+            if htmlstring is None:
+                htmlstring, ref_timestamp = read_input_file(filename, ref_timestamp)
+            result = document_extraction(
+                htmlstring, filename, args, options, ref_timestamp
             )
-            # pass information along if URLs are missing
-            return _define_exit_code(archived_errors, url_store.total_url_number())
+            # no time limit for writing, a file would be left truncated
+            if use_alarm:
+                signal.alarm(0)
+            write_result(result, args, filename, counter, new_filename=None)
+        except ExtractionTimeout:
+            failed.append((filename, "timeout"))
+        except Exception as err:
+            failed.append((filename, str(err)))
+        finally:
+            if use_alarm:
+                signal.alarm(0)
+    return failed
+
+
+def start_file_workers(args: Any, options: Extractor) -> ProcessPoolExecutor:
+    "Start the extraction processes, arguments and options are sent once to each one."
+    kwargs: Dict[str, Any] = {}
+    if sys.version_info >= (3, 11):
+        kwargs["max_tasks_per_child"] = TASKS_PER_CHILD
+    return ProcessPoolExecutor(
+        max_workers=max(args.parallel, 1),
+        mp_context=get_context(EXTRACTION_START_METHOD),
+        initializer=init_extraction_worker,
+        initargs=(options, args),
+        **kwargs,
+    )
 
-    return _define_exit_code(errors, url_count)
+
+def stop_file_workers(executor: ProcessPoolExecutor) -> None:
+    "Kill the extraction processes, e.g. if an extraction is stuck in native code."
+    if hasattr(executor, "kill_workers"):  # Python >= 3.14
+        executor.kill_workers()
+    else:
+        # no public way to stop running tasks before: CPython keeps the worker
+        # processes in _processes, a dict of PIDs and processes, since 3.3 (the
+        # attribute is None after shutdown), nothing is killed if it is missing
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def load_manifest(filename: Optional[str]) -> Set[str]:
+    "Read the list of files processed by a previous run."
+    if not filename or not path.isfile(filename):
+        return set()
+    with open(filename, "r", encoding="utf-8") as manifest:
+        return {line.rstrip("\n") for line in manifest if line.strip()}
+
+
+def report_throughput(files: int, volume: int, errors: int, start: float) -> str:
+    "Describe the number of processed files and the processing speed."
+    elapsed = max(perf_counter() - start, 1e-6)
+    megabytes = volume / 1024**2
+    return (
+        f"{files} files ({megabytes:.1f} MB) in {elapsed:.1f} s: "
+        f"{files / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s, {errors} errors"
+    )
 
 
-def file_processing_pipeline(args: Any) -> None:
-    "Define batches for parallel file processing and perform the extraction."
-    filecounter = -1
+def file_processing_pipeline(args: Any) -> int:
+    """Process the files of the input directory in chunks with parallel processes,
+    the web pages of WARC files are processed like files. Files are processed
+    within a time limit, stuck or crashed processes are replaced and the files
+    of lost tasks retried one at a time. Processed files are recorded in the
+    manifest if there is one and skipped on the next run."""
     options = args_to_extractor(args)
     timeout = options.config.getint("DEFAULT", "EXTRACTION_TIMEOUT")
+    manifest_name = getattr(args, "manifest", None)
+
+    done = load_manifest(manifest_name)
+    files = (f for f in generate_input_documents(args.input_dir) if f[0] not in done)
+    # use numbered subdirectories if there are enough files
+    first_files = list(islice(files, MAX_FILES_PER_DIRECTORY))
+    use_counter = len(first_files) >= MAX_FILES_PER_DIRECTORY
+    tasks = (
+        (i * FILES_PER_TASK if use_counter else -1, chunk, False)
+        for i, chunk in enumerate(
+            make_chunks(chain(first_files, files), FILES_PER_TASK)
+        )
+    )
+    retries: Deque[FileTask] = deque()
+    pending: Dict[Future, FileTask] = {}
+
+    # extractions are interrupted in the workers, this is the last resort
+    stall_timeout = (FILES_PER_TASK + 1) * timeout if timeout > 0 else None
+    workers = max(args.parallel, 1)
+    processed, volume, errors, start = 0, 0, [], perf_counter()
+    manifest = open(manifest_name, "a", encoding="utf-8") if manifest_name else None
+
+    def record(task: FileTask, failed: List[Tuple[str, str]]) -> None:
+        nonlocal processed, volume
+        for filename, reason in failed:
+            LOGGER.error("file processing error: %s %s", filename, reason)
+            errors.append(filename)
+        before = processed
+        processed += len(task[1])
+        volume += sum(f[1] for f in task[1])
+        if manifest:
+            manifest.writelines(f[0] + "\n" for f in task[1])
+            manifest.flush()
+        if processed // REPORT_EVERY > before // REPORT_EVERY:
+            LOGGER.info(report_throughput(processed, volume, len(errors), start))
+
+    executor = start_file_workers(args, options)
+    try:
+        while True:
+            # files are retried one at a time to find out which one is faulty
+            isolated = retries or any(task[2] for task in pending.values())
+            while len(pending) < (1 if isolated else PENDING_EXTRACTIONS * workers):
+                task = retries.popleft() if retries else next(tasks, None)
+                if task is None:
+                    break
+                future = executor.submit(process_file_chunk, task[1], task[0], timeout)
+                pending[future] = task
+            if not pending:
+                break
 
-    # max_tasks_per_child available in Python >= 3.11
-    with ProcessPoolExecutor(max_workers=args.parallel) as executor:
-        # chunk input: https://github.com/python/cpython/issues/74028
-        for filebatch in make_chunks(
-            generate_filelist(args.input_dir), MAX_FILES_PER_DIRECTORY
-        ):
-            if filecounter < 0 and len(filebatch) >= MAX_FILES_PER_DIRECTORY:
-                filecounter = 0
-            worker = partial(
-                file_processing, args=args, counter=filecounter, options=options
+            finished, _ = wait(
+                pending, timeout=stall_timeout, return_when=FIRST_COMPLETED
             )
-            executor.map(worker, filebatch, chunksize=10, timeout=timeout)
-            # update counter
-            if filecounter >= 0:
-                filecounter += len(filebatch)
+            broken = not finished
+            for future in finished:
+                task = pending.pop(future)
+                try:
+                    record(task, future.result())
+                except BrokenProcessPool:
+                    broken = True
+                    pending[future] = task
+                except (Exception, ExtractionTimeout) as err:
+                    record(task, [(f[0], repr(err)) for f in task[1]])
+
+            if broken:
+                LOGGER.error("extraction processes stuck or crashed, restarting them")
+                stop_file_workers(executor)
+                executor = start_file_workers(args, options)
+                # isolate the culprit: files of lost tasks are retried one by one
+                for counter, chunk, retried in pending.values():
+                    if retried:
+                        record(
+                            (counter, chunk, retried),
+                            [(chunk[0][0], "timeout or crash")],
+                        )
+                    else:
+                        retries.extend((counter, (f,), True) for f in chunk)
+                pending.clear()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if manifest:
+            manifest.close()
+
+    sys.stderr.write(
+        f"INFO: {report_throughput(processed, volume, len(errors), start)}\n"
+    )
+    return _define_exit_code(errors, processed)
 
 
 def examine(
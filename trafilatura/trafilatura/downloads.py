@@ -3,21 +3,27 @@
 All functions needed to steer and execute downloads of web documents.
 """
 
+import asyncio
+import heapq
 import logging
 import os
 import random
+import ssl
+import threading
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from configparser import ConfigParser
 from functools import partial
 from importlib.metadata import version
 from io import BytesIO
-from time import sleep
+from time import monotonic, sleep
 from typing import (
     Any,
+    Awaitable,
     Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     Optional,
     Set,
@@ -32,7 +38,7 @@ from courlan import UrlStore
 from courlan.network import redirection_test
 
 from .settings import DEFAULT_CONFIG, Extractor
-from .utils import URL_BLACKLIST_REGEX, decode_file, is_acceptable_length, make_chunks
+from .utils import URL_BLACKLIST_REGEX, decode_file, is_acceptable_length
 
 try:
     from urllib3.contrib.socks import SOCKSProxyManager
@@ -55,6 +61,13 @@ try:
 except ImportError:
     HAS_PYCURL = False
 
+try:
+    import aiohttp
+
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -62,6 +75,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 HTTP_POOL = None
 NO_CERT_POOL = None
 RETRY_STRATEGY = None
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
 
 
 def create_pool(**args: Any) -> Union[urllib3.PoolManager, Any]:
@@ -100,6 +114,12 @@ FORCE_STATUS = [
 
 CURL_SSL_ERRORS = {35, 54, 58, 59, 60, 64, 66, 77, 82, 83, 91}
 
+DOWNLOAD_BACKENDS = ("threads", "async")
+# kept-alive connections per host with the async backend
+ASYNC_CONNECTIONS_PER_HOST = 4
+# maximum backoff time between retries, same as urllib3
+MAX_BACKOFF_TIME = 120
+
 
 class Response:
     "Store information gathered in a HTTP response object."
@@ -403,27 +423,336 @@ def load_download_buffer(
 
 
 def _buffered_downloads(
-    bufferlist: List[str],
+    bufferlist: Iterable[str],
     download_threads: int,
     worker: Callable[[str], Any],
-    chunksize: int = 10000,
+    max_pending: int = 0,
 ) -> Generator[Tuple[str, Any], None, None]:
-    "Use a thread pool to perform a series of downloads."
+    """Use a thread pool to perform a series of downloads, new downloads
+    are submitted as soon as others are finished."""
+    max_pending = max_pending or 2 * download_threads
+    urls = iter(bufferlist)
     with ThreadPoolExecutor(max_workers=download_threads) as executor:
-        for chunk in make_chunks(bufferlist, chunksize):
-            future_to_url = {executor.submit(worker, url): url for url in chunk}
-            for future in as_completed(future_to_url):
-                yield future_to_url[future], future.result()
+        future_to_url = {}
+        while True:
+            # refill the queue of pending downloads
+            for url in urls:
+                future_to_url[executor.submit(worker, url)] = url
+                if len(future_to_url) >= max_pending:
+                    break
+            if not future_to_url:
+                break
+            done, _ = wait(future_to_url, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future_to_url.pop(future), future.result()
+
+
+def _get_backoff_time(attempt: int, config: ConfigParser) -> float:
+    "Time to wait before the next retry, same as the urllib3 retry strategy."
+    if attempt <= 1:
+        return 0
+    backoff_factor = config.getint("DEFAULT", "DOWNLOAD_TIMEOUT") / 2
+    return min(MAX_BACKOFF_TIME, backoff_factor * 2 ** (attempt - 1))
+
+
+async def _send_aiohttp_request(
+    session: Any, url: str, no_ssl: bool, with_headers: bool, config: ConfigParser
+) -> Optional[Response]:
+    "Internal function to send a request over a shared aiohttp session and return its result."
+    max_redirects = config.getint("DEFAULT", "MAX_REDIRECTS")
+    max_size = config.getint("DEFAULT", "MAX_FILE_SIZE")
+    # content encodings are negotiated and decoded by aiohttp itself
+    headers = {
+        k: v
+        for k, v in _determine_headers(config).items()
+        if k.lower() != "accept-encoding"
+    }
+
+    try:
+        attempt = 0
+        while True:
+            async with session.get(
+                url,
+                headers=headers,
+                max_redirects=max_redirects,
+                ssl=False if no_ssl else SSL_CONTEXT,
+            ) as response:
+                if response.status in FORCE_STATUS:
+                    attempt += 1
+                    if attempt > max_redirects:
+                        raise ValueError(f"too many {response.status} responses")
+                    await asyncio.sleep(_get_backoff_time(attempt, config))
+                    continue
+
+                # stop downloading as soon as MAX_FILE_SIZE is reached
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(2**17):
+                    data.extend(chunk)
+                    if len(data) > max_size:
+                        raise ValueError("MAX_FILE_SIZE exceeded")
+
+                # necessary for standardization
+                resp = Response(bytes(data), response.status, str(response.url))
+                if with_headers:
+                    resp.store_headers(dict(response.headers))
+                return resp
+
+    except aiohttp.ClientSSLError:
+        if not no_ssl:
+            LOGGER.warning("retrying after SSLError: %s", url)
+            return await _send_aiohttp_request(session, url, True, with_headers, config)
+        LOGGER.error("download error: %s SSL error", url)
+    except Exception as err:
+        LOGGER.error("download error: %s %s", url, err)
+
+    return None
+
+
+async def fetch_response_async(
+    session: Any,
+    url: str,
+    *,
+    decode: bool = False,
+    no_ssl: bool = False,
+    with_headers: bool = False,
+    config: ConfigParser = DEFAULT_CONFIG,
+) -> Optional[Response]:
+    """Asynchronous counterpart of fetch_response using a session
+    created by create_async_session."""
+    LOGGER.debug("sending request: %s", url)
+    response = await _send_aiohttp_request(session, url, no_ssl, with_headers, config)
+    if not response:
+        LOGGER.debug("request failed: %s", url)
+        return None
+    response.decode_data(decode)
+    return response
+
+
+async def fetch_url_async(
+    session: Any,
+    url: str,
+    no_ssl: bool = False,
+    config: ConfigParser = DEFAULT_CONFIG,
+    options: Optional[Extractor] = None,
+) -> Optional[str]:
+    """Asynchronous counterpart of fetch_url using a session
+    created by create_async_session."""
+    config = options.config if options else config
+    response = await fetch_response_async(
+        session, url, decode=True, no_ssl=no_ssl, config=config
+    )
+    if response and response.data:
+        if not options:
+            options = Extractor(config=config)
+        if _is_suitable_response(url, response, options):
+            return response.html
+    return None
+
+
+def create_async_session(
+    download_threads: int, config: ConfigParser = DEFAULT_CONFIG
+) -> Any:
+    """Create an aiohttp session with a pool of kept-alive connections
+    for each host, to be used inside of a running event loop."""
+    if not HAS_AIOHTTP:
+        raise ImportError("the async download backend requires aiohttp")
+    if PROXY_URL:
+        raise ValueError("the async download backend doesn't support proxies")
+    connector = aiohttp.TCPConnector(
+        limit=download_threads,
+        limit_per_host=ASYNC_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=config.getint("DEFAULT", "DOWNLOAD_TIMEOUT"))
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+# end of the results of an async producer
+_DONE = object()
+
+
+def _iterate_async(
+    producer: Callable[[Callable[[Any], Awaitable[None]]], Awaitable[None]],
+    max_queued: int,
+) -> Generator[Tuple[str, Any], None, None]:
+    """Run a producer of results in an event loop in a background thread
+    and yield the results. The queue of results is bounded, downloads go on
+    while the results are processed and wait if they are not consumed."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def run(coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def start() -> Tuple["asyncio.Queue[Any]", "asyncio.Task[None]"]:
+        results: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_queued)
+        return results, asyncio.ensure_future(producer(results.put))
+
+    async def get_next() -> Any:
+        getter = asyncio.ensure_future(results.get())
+        await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            return getter.result()
+        getter.cancel()
+        # the producer is finished, drain the queue
+        if not results.empty():
+            return results.get_nowait()
+        task.result()  # raise errors of the producer
+        return _DONE
+
+    async def stop() -> None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    task = None
+    try:
+        results, task = run(start())
+        while True:
+            item = run(get_next())
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        try:
+            if task is not None:
+                run(stop())
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+async def _async_list_producer(
+    bufferlist: Iterable[str],
+    download_threads: int,
+    worker: Callable[[Any, str], Awaitable[Any]],
+    config: ConfigParser,
+    put: Callable[[Any], Awaitable[None]],
+) -> None:
+    "Download the URLs of a list, new downloads start as soon as others are finished."
+    urls = iter(bufferlist)
+    async with create_async_session(download_threads, config) as session:
+
+        async def download(url: str) -> Tuple[str, Any]:
+            return url, await worker(session, url)
+
+        pending: Set["asyncio.Task[Tuple[str, Any]]"] = set()
+        while True:
+            for url in urls:
+                pending.add(asyncio.ensure_future(download(url)))
+                if len(pending) >= download_threads:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                await put(task.result())
+
+
+async def _async_store_producer(
+    url_store: UrlStore,
+    download_threads: int,
+    worker: Callable[[Any, str], Awaitable[Any]],
+    config: ConfigParser,
+    put: Callable[[Any], Awaitable[None]],
+) -> None:
+    """Download the URLs of a store, keeping all the connections busy:
+    a website is ready for a new download when the last one is finished
+    and its crawl delay (from robots.txt or SLEEP_TIME) has passed."""
+    sleep_time = config.getfloat("DEFAULT", "SLEEP_TIME")
+    delays: Dict[str, float] = {}
+    # websites ready for downloads by time, and websites in this heap or busy
+    ready: List[Tuple[float, str]] = []
+    scheduled: Set[str] = set()
+
+    last_scan = 0.0
+
+    def schedule_new_websites() -> None:
+        nonlocal last_scan
+        last_scan = monotonic()
+        for website in url_store.get_unvisited_domains():
+            if website not in scheduled:
+                scheduled.add(website)
+                heapq.heappush(ready, (0, website))
+
+    async with create_async_session(download_threads, config) as session:
+
+        async def download(website: str, url: str) -> Tuple[str, str, Any]:
+            return website, url, await worker(session, url)
+
+        pending: Set["asyncio.Task[Tuple[str, str, Any]]"] = set()
+        schedule_new_websites()
+        while True:
+            # refill with websites whose delay has passed
+            now = monotonic()
+            if now - last_scan > sleep_time:
+                # URLs of new websites may have been added meanwhile
+                schedule_new_websites()
+            while ready and ready[0][0] <= now and len(pending) < download_threads:
+                _, website = heapq.heappop(ready)
+                url = url_store.get_url(website)
+                if url is None:
+                    scheduled.discard(website)
+                    continue
+                pending.add(asyncio.ensure_future(download(website, url)))
+
+            if not pending:
+                if not ready:
+                    # URLs may have been added during the downloads
+                    schedule_new_websites()
+                    if not ready:
+                        break
+                    continue
+                await asyncio.sleep(max(0, ready[0][0] - monotonic()))
+                continue
+
+            timeout = max(0, ready[0][0] - now) if ready else None
+            if len(pending) >= download_threads:
+                timeout = None
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                website, url, result = task.result()
+                if website not in delays:
+                    delays[website] = url_store.get_crawl_delay(
+                        website, default=sleep_time
+                    )
+                heapq.heappush(ready, (monotonic() + delays[website], website))
+                await put((url, result))
+
+
+def _download_worker(
+    backend: str, decode: bool, options: Optional[Extractor]
+) -> Callable[..., Any]:
+    "Select the function performing a single download with the given backend."
+    config = options.config if options else DEFAULT_CONFIG
+    if backend == "async":
+        if decode:
+            return partial(fetch_url_async, options=options)
+        return partial(fetch_response_async, config=config)
+    if decode:
+        return partial(fetch_url, options=options)
+    return partial(fetch_response, config=config)
 
 
 def buffered_downloads(
     bufferlist: List[str],
     download_threads: int,
     options: Optional[Extractor] = None,
+    backend: str = "threads",
 ) -> Generator[Tuple[str, str], None, None]:
-    "Download queue consumer, single- or multi-threaded."
-    worker = partial(fetch_url, options=options)
-
+    "Download queue consumer, single- or multi-threaded or asynchronous."
+    worker = _download_worker(backend, True, options)
+    if backend == "async":
+        config = options.config if options else DEFAULT_CONFIG
+        producer = partial(
+            _async_list_producer, bufferlist, download_threads, worker, config
+        )
+        return _iterate_async(producer, download_threads)
     return _buffered_downloads(bufferlist, download_threads, worker)
 
 
@@ -431,12 +760,41 @@ def buffered_response_downloads(
     bufferlist: List[str],
     download_threads: int,
     options: Optional[Extractor] = None,
+    backend: str = "threads",
 ) -> Generator[Tuple[str, Response], None, None]:
     "Download queue consumer, returns full Response objects."
+    worker = _download_worker(backend, False, options)
+    if backend == "async":
+        config = options.config if options else DEFAULT_CONFIG
+        producer = partial(
+            _async_list_producer, bufferlist, download_threads, worker, config
+        )
+        return _iterate_async(producer, download_threads)
+    return _buffered_downloads(bufferlist, download_threads, worker)
+
+
+def store_downloads(
+    url_store: UrlStore,
+    download_threads: int,
+    options: Optional[Extractor] = None,
+    decode: bool = True,
+    backend: str = "threads",
+) -> Generator[Tuple[str, Any], None, None]:
+    """Download all the URLs of a store respecting domain-based back-off rules.
+    Yields HTML strings or Response objects if decode is False."""
     config = options.config if options else DEFAULT_CONFIG
-    worker = partial(fetch_response, config=config)
+    worker = _download_worker(backend, decode, options)
+    if backend == "async":
+        producer = partial(
+            _async_store_producer, url_store, download_threads, worker, config
+        )
+        yield from _iterate_async(producer, download_threads)
+        return
 
-    return _buffered_downloads(bufferlist, download_threads, worker)
+    sleep_time = config.getfloat("DEFAULT", "SLEEP_TIME")
+    while not url_store.done:
+        bufferlist, url_store = load_download_buffer(url_store, sleep_time)
+        yield from _buffered_downloads(bufferlist, download_threads, worker)
 
 
 def _send_pycurl_request(
@@ -0,0 +1,391 @@
+"""
+Functions dedicated to reading and writing WARC files (Web ARChive).
+Archives are read as a stream, gzip members are tracked so that records
+can be found again by their offset in the file.
+"""
+
+import gzip
+import logging
+import zlib
+
+from base64 import b32encode
+from collections import deque
+from datetime import datetime, timezone
+from hashlib import sha1
+from os import getpid, makedirs, path
+from typing import Any, BinaryIO, Deque, Dict, Generator, Optional, Set, Tuple
+from uuid import uuid4
+
+from .utils import handle_compressed_file
+
+
+LOGGER = logging.getLogger(__name__)
+
+WARC_EXTENSIONS = (".warc", ".warc.gz")
+WARC_VERSION = "WARC/1.0"
+# records which can contain web pages
+HTML_RECORD_TYPES = {"response", "resource"}
+
+READ_CHUNK_SIZE = 2**16
+# headers of a record, an HTTP message or a chunk are never that large
+MAX_HEADER_SIZE = 2**20
+# a new backup file is started beyond this size
+MAX_WARC_FILE_SIZE = 2**30
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def is_warc_file(filename: str) -> bool:
+    "Tell if a file is a WARC archive based on its name."
+    return filename.lower().endswith(WARC_EXTENSIONS)
+
+
+class WarcRecord:
+    "Store a WARC record along with its offset in the archive."
+    __slots__ = ["headers", "content", "offset"]
+
+    def __init__(self, headers: Dict[str, str], content: bytes, offset: int) -> None:
+        self.headers = headers
+        self.content = content
+        # start of the gzip member or of the record in an uncompressed file
+        self.offset = offset
+
+    @property
+    def type(self) -> str:
+        "Type of the record, e.g. response or resource."
+        return self.headers.get("WARC-Type", "")
+
+    @property
+    def url(self) -> Optional[str]:
+        "URL of the archived document."
+        return self.headers.get("WARC-Target-URI", "").strip("<>") or None
+
+    def get_timestamp(self) -> Optional[float]:
+        "Date of the capture as a POSIX timestamp."
+        try:
+            date = self.headers["WARC-Date"].replace("Z", "+00:00")
+            return datetime.fromisoformat(date).timestamp()
+        except (KeyError, ValueError):
+            return None
+
+    def get_html(self) -> Optional[bytes]:
+        """Return the web page contained in a response or resource record,
+        None if it's another type of document or if the response is not valid."""
+        content_type = self.headers.get("Content-Type", "").lower()
+        if self.type == "resource":
+            return self.content if "html" in content_type else None
+        if self.type != "response" or not content_type.startswith("application/http"):
+            return None
+
+        head, _, body = self.content.partition(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("iso-8859-1").split("\r\n")
+        parts = status_line.split(maxsplit=2)
+        if len(parts) < 2 or not parts[1].startswith("2"):
+            return None
+
+        http_headers = parse_headers(header_lines)
+        if "html" not in http_headers.get("content-type", "html").lower():
+            return None
+        if "chunked" in http_headers.get("transfer-encoding", "").lower():
+            body = decode_chunked(body)
+        if http_headers.get("content-encoding", "identity").lower() != "identity":
+            body = handle_compressed_file(body)
+        return body
+
+
+def parse_headers(lines: Any) -> Dict[str, str]:
+    "Make a dictionary out of header lines, field names are lowercased."
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def decode_chunked(body: bytes) -> bytes:
+    "Decode a body sent with chunked transfer encoding, return it unchanged if it's not valid."
+    chunks = []
+    position = 0
+    while True:
+        line_end = body.find(b"\r\n", position)
+        try:
+            size = int(body[position:line_end].split(b";")[0], 16)
+        except ValueError:
+            # archived as it was decoded by the crawler
+            return body
+        if size == 0 or line_end == -1:
+            break
+        chunks.append(body[line_end + 2 : line_end + 2 + size])
+        position = line_end + 2 + size + 2
+    return b"".join(chunks)
+
+
+class ArchiveStream:
+    """Read an uncompressed or a gzip-compressed WARC file line by line or by blocks,
+    gzip members are decompressed one after another to know where they start."""
+
+    __slots__ = [
+        "fileobj",
+        "buffer",
+        "index",
+        "start",
+        "compressed",
+        "decompressor",
+        "raw_offset",
+        "members",
+    ]
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self.fileobj = fileobj
+        self.buffer = bytearray()
+        # read position in the buffer and position of the buffer in the data
+        self.index = 0
+        self.start = 0
+        self.raw_offset = 0
+        # beginning of gzip members: position in the data, offset in the file
+        self.members: Deque[Tuple[int, int]] = deque()
+        self.compressed: Optional[bool] = None
+        self.decompressor: Any = None
+
+    @property
+    def position(self) -> int:
+        "Current position in the (decompressed) data."
+        return self.start + self.index
+
+    def get_offset(self, position: int) -> int:
+        "Offset in the file of the gzip member including the position, or the position itself."
+        if not self.compressed:
+            return position
+        while len(self.members) > 1 and self.members[1][0] <= position:
+            self.members.popleft()
+        return self.members[0][1] if self.members else 0
+
+    def _fill(self) -> bool:
+        "Add data to the buffer, return False at the end of the file."
+        data = self.fileobj.read(READ_CHUNK_SIZE)
+        if not data:
+            return False
+        # drop data which has been read already
+        if self.index > READ_CHUNK_SIZE:
+            del self.buffer[: self.index]
+            self.start += self.index
+            self.index = 0
+
+        if self.compressed is None:
+            self.compressed = data[:2] == b"\x1f\x8b"
+            if self.compressed:
+                self.decompressor = zlib.decompressobj(GZIP_WBITS)
+                self.members.append((0, 0))
+        if not self.compressed:
+            self.buffer += data
+            return True
+
+        end = self.start + len(self.buffer)
+        while data:
+            if self.decompressor.eof:
+                self.decompressor = zlib.decompressobj(GZIP_WBITS)
+                self.members.append((end, self.raw_offset))
+            try:
+                decompressed = self.decompressor.decompress(data)
+            except zlib.error as err:
+                LOGGER.error("invalid gzip data at offset %s: %s", self.raw_offset, err)
+                return False
+            self.buffer += decompressed
+            end += len(decompressed)
+            if self.decompressor.eof:
+                rest = self.decompressor.unused_data
+                self.raw_offset += len(data) - len(rest)
+                data = rest
+            else:
+                self.raw_offset += len(data)
+                data = b""
+        return True
+
+    def readline(self) -> bytes:
+        "Read a line including the line break, an empty string at the end of the file."
+        while True:
+            line_end = self.buffer.find(b"\n", self.index)
+            if line_end != -1:
+                line = bytes(self.buffer[self.index : line_end + 1])
+                self.index = line_end + 1
+                return line
+            if len(self.buffer) - self.index > MAX_HEADER_SIZE or not self._fill():
+                line = bytes(self.buffer[self.index :])
+                self.index = len(self.buffer)
+                return line
+
+    def read(self, size: int) -> bytes:
+        "Read a block of data, shorter than the size at the end of the file."
+        while len(self.buffer) - self.index < size and self._fill():
+            pass
+        block = bytes(self.buffer[self.index : self.index + size])
+        self.index += len(block)
+        return block
+
+    def skip(self, size: int) -> int:
+        "Skip a block of data without keeping it, return the skipped size."
+        skipped = 0
+        while skipped < size:
+            available = min(len(self.buffer) - self.index, size - skipped)
+            self.index += available
+            skipped += available
+            if skipped < size and not self._fill():
+                break
+        return skipped
+
+
+def read_warc(
+    fileobj: BinaryIO, record_types: Optional[Set[str]] = None
+) -> Generator[WarcRecord, None, None]:
+    """Iterate over the records of a WARC file, only records of the given types
+    are yielded and their content read, the others are skipped."""
+    stream = ArchiveStream(fileobj)
+    while True:
+        line = stream.readline()
+        # records are separated by blank lines
+        while line in (b"\r\n", b"\n"):
+            line = stream.readline()
+        if not line:
+            return
+
+        offset = stream.get_offset(stream.position - len(line))
+        if not line.startswith(b"WARC/"):
+            LOGGER.error("invalid WARC record at offset %s", offset)
+            return
+
+        header_lines = []
+        line = stream.readline()
+        while line.strip():
+            header_lines.append(line.decode("utf-8", errors="replace"))
+            line = stream.readline()
+        if not line:
+            LOGGER.error("truncated WARC record at offset %s", offset)
+            return
+        headers = {
+            name.strip(): value.strip()
+            for name, sep, value in (h.partition(":") for h in header_lines)
+            if sep
+        }
+
+        try:
+            length = int(headers["Content-Length"])
+        except (KeyError, ValueError):
+            LOGGER.error("invalid WARC record length at offset %s", offset)
+            return
+        if record_types is not None and headers.get("WARC-Type") not in record_types:
+            if stream.skip(length) < length:
+                LOGGER.error("truncated WARC record at offset %s", offset)
+                return
+            continue
+
+        content = stream.read(length)
+        if len(content) < length:
+            LOGGER.error("truncated WARC record at offset %s", offset)
+            return
+        yield WarcRecord(headers, content, offset)
+
+
+def iterate_warc_file(
+    filename: str, record_types: Optional[Set[str]] = HTML_RECORD_TYPES
+) -> Generator[WarcRecord, None, None]:
+    "Open a WARC file and iterate over its records, see read_warc()."
+    with open(filename, "rb") as fileobj:
+        yield from read_warc(fileobj, record_types)
+
+
+def make_warc_record(
+    record_type: str,
+    content: bytes,
+    content_type: str,
+    url: Optional[str] = None,
+    extra_headers: Optional[Dict[str, str]] = None,
+) -> bytes:
+    "Serialize a WARC record with the mandatory headers and a digest of its content."
+    headers = {
+        "WARC-Type": record_type,
+        "WARC-Record-ID": f"<urn:uuid:{uuid4()}>",
+        "WARC-Date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    if url:
+        headers["WARC-Target-URI"] = url
+    headers.update(extra_headers or {})
+    headers["WARC-Block-Digest"] = "sha1:" + b32encode(sha1(content).digest()).decode()
+    headers["Content-Type"] = content_type
+    headers["Content-Length"] = str(len(content))
+
+    head = "\r\n".join(
+        [WARC_VERSION] + [f"{name}: {value}" for name, value in headers.items()]
+    )
+    return head.encode("utf-8") + b"\r\n\r\n" + content + b"\r\n\r\n"
+
+
+class WarcWriter:
+    """Write records to gzip-compressed WARC files in a directory,
+    each record is a gzip member so that it can be read on its own."""
+
+    __slots__ = ["directory", "max_size", "fileobj", "filename", "serial", "size"]
+
+    def __init__(self, directory: str, max_size: int = MAX_WARC_FILE_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.fileobj: Optional[BinaryIO] = None
+        self.filename = ""
+        self.serial = 0
+        self.size = 0
+
+    def _open_next_file(self) -> None:
+        "Close the current file and start a new one with a warcinfo record."
+        self.close()
+        makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        while True:
+            self.serial += 1
+            self.filename = path.join(
+                self.directory,
+                f"trafilatura-{timestamp}-{getpid()}-{self.serial:05d}.warc.gz",
+            )
+            if not path.exists(self.filename):
+                break
+        self.fileobj = open(self.filename, "wb")
+        self.size = 0
+        info = "software: trafilatura\r\nformat: WARC File Format 1.0\r\n"
+        self._write_member(
+            make_warc_record(
+                "warcinfo",
+                info.encode("utf-8"),
+                "application/warc-fields",
+                extra_headers={"WARC-Filename": path.basename(self.filename)},
+            )
+        )
+
+    def _write_member(self, record: bytes) -> int:
+        "Append a record as a gzip member, return its offset in the file."
+        offset = self.size
+        data = gzip.compress(record)
+        self.fileobj.write(data)  # type: ignore[union-attr]
+        # records are readable even if the process stops
+        self.fileobj.flush()  # type: ignore[union-attr]
+        self.size += len(data)
+        return offset
+
+    def write(
+        self,
+        content: bytes,
+        url: Optional[str] = None,
+        content_type: str = "text/html; charset=utf-8",
+        record_type: str = "resource",
+    ) -> Tuple[str, int]:
+        "Write a document as a WARC record, return the file name and the offset of the record."
+        if self.fileobj is None or self.size >= self.max_size:
+            self._open_next_file()
+        offset = self._write_member(
+            make_warc_record(record_type, content, content_type, url)
+        )
+        return self.filename, offset
+
+    def close(self) -> None:
+        "Close the current file."
+        if self.fileobj is not None:
+            self.fileobj.close()
+            self.fileobj = None